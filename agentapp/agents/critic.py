@@ -1,8 +1,9 @@
 # agentapp/agents/critic.py
 
-from agentapp.logger import logging
+from agentapp.logger import logging, payload_log
 from agentapp.processing.embedder import LLMToolkit  
 from agentapp.exception import MultiAgentException
+from utils.tracing import set_attributes, traced
 
 
 class CriticAgent:
@@ -10,16 +11,18 @@ class CriticAgent:
         self.llm = LLMToolkit()
         logging.info("CriticAgent initialized.")
 
+    @traced("agent.critic.evaluate_summary")
     def evaluate_summary(self, summary: str) -> dict:
         logging.info("CriticAgent: Evaluating summary quality.")
 
         try:
-            logging.info(f"CriticAgent: Summary content to evaluate (truncated):\n{summary[:200]}...")
+            payload_log.info("CriticAgent: Summary content to evaluate (truncated):\n%s...", summary[:200])
             label = self.llm.get_critique_score(summary)
-            logging.info(f"CriticAgent: Evaluation completed with label: {label}")
+            logging.info("CriticAgent: Evaluation completed with label: %s", label)
+            set_attributes({"critic.summary_chars": len(summary), "critic.label": label})
 
             return {"summary": summary, "label": label}
 
         except Exception as e:
-            logging.error(f"CriticAgent: Failed to evaluate summary: {e}")
+            logging.error("CriticAgent: Failed to evaluate summary: %s", e)
             raise MultiAgentException(f"CriticAgent failed to evaluate summary: {e}")
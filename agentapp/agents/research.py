@@ -1,32 +1,36 @@
 from agentapp.processing.embedder import LLMToolkit
 from agentapp.logger import logging
 from agentapp.exception import MultiAgentException
-from utils.rag_retriever import SupportDocEmbedder
+from utils.retriever_registry import get_registry
+from utils.tracing import set_attributes, traced
 import sys
 
 
 class ResearchAgent:
     def __init__(self):
         self.llm = LLMToolkit()
-        self.retriever=SupportDocEmbedder()
+        self.retriever = get_registry().get(collection_name="default")
         logging.info("ResearchAgent initialized.")
 
+    @traced("agent.research.fetch_documents")
     def fetch_documents(self, query: str):
-        logging.info(f"Fetching documents for query: '{query}'")
+        logging.info("Fetching documents for query: '%s'", query)
 
         try:
             
             llm_docs = self.llm.fetch_llm_research(query)
-            logging.info(f"Fetched {len(llm_docs)} documents from LLM research.")
+            logging.info("Fetched %s documents from LLM research.", len(llm_docs))
             llm_contents = [d["content"] for d in llm_docs]
 
             
             logging.info("Retrieving additional context from vector store.")
             retrieved_contents = self.retriever.retrieve_context(query)
-            logging.info(f"Retrieved {len(retrieved_contents)} documents from vector store.")
+            logging.info("Retrieved %s documents from vector store.", len(retrieved_contents))
 
             
             all_contents = llm_contents + retrieved_contents
+            set_attributes({"research.llm_documents": len(llm_contents),
+                            "research.retrieved_documents": len(retrieved_contents)})
 
             
             logging.info("Running reranker on combined content.")
@@ -48,11 +52,11 @@ class ResearchAgent:
                         "url": ""
                     })
 
-            logging.info(f"Returning {len(final_docs)} reranked documents.")
+            logging.info("Returning %s reranked documents.", len(final_docs))
             return final_docs
 
         except Exception as e:
-            logging.error(f"ResearchAgent: Failed to fetch documents: {e}")
+            logging.error("ResearchAgent: Failed to fetch documents: %s", e)
             
             raise MultiAgentException("Failed to fetch documents in ResearchAgent", error_detail=sys)
 
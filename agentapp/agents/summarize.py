@@ -2,16 +2,20 @@
 
 from agentapp.processing.text_ops import chunk_text
 from agentapp.processing.embedder import LLMToolkit
+from agentapp.processing.concurrency import AGENT_MAX_CONCURRENCY, bounded_map
 from agentapp.logger import logging
 from agentapp.exception import MultiAgentException
+from utils.tracing import set_attributes, traced
 
 
 class SummarizationAgent:
-    def __init__(self, max_chunk_size=800):
+    def __init__(self, max_chunk_size=800, max_concurrency=AGENT_MAX_CONCURRENCY):
         self.max_chunk_size = max_chunk_size
+        self.max_concurrency = max_concurrency
         self.llm = LLMToolkit()
-        logging.info(f"SummarizationAgent initialized with max_chunk_size={self.max_chunk_size}")
+        logging.info("SummarizationAgent initialized with max_chunk_size=%s", self.max_chunk_size)
 
+    @traced("agent.summarize.summarize_document")
     def summarize_document(self, text: str) -> str:
         logging.info("SummarizationAgent: Starting document summarization")
         
@@ -23,19 +27,21 @@ class SummarizationAgent:
 
             logging.info("SummarizationAgent: Chunking input text")
             chunks = chunk_text(text, max_tokens=self.max_chunk_size)
-            logging.info(f"SummarizationAgent: Total chunks created: {len(chunks)}")
+            logging.info("SummarizationAgent: Total chunks created: %s", len(chunks))
+            set_attributes({"summarize.text_chars": len(text), "summarize.chunks": len(chunks)})
 
-            summarized_chunks = []
+            def summarize_chunk(indexed_chunk):
+                i, chunk = indexed_chunk
+                logging.info("Summarizing chunk %s/%s", i + 1, len(chunks))
+                summary = self.llm.get_summary(chunk)
+                logging.info("Successfully summarized chunk %s", i + 1)
+                return summary
 
-            for i, chunk in enumerate(chunks):
-                logging.info(f"Summarizing chunk {i + 1}/{len(chunks)}")
-                try:
-                    summary = self.llm.get_summary(chunk)
-                    summarized_chunks.append(summary)
-                    logging.info(f"Successfully summarized chunk {i + 1}")
-                except Exception as e:
-                    logging.error(f"Failed to summarize chunk {i + 1}: {e}")
-                    summarized_chunks.append("[Summary failed for this chunk]")
+            def on_error(indexed_chunk, e):
+                logging.error("Failed to summarize chunk %s: %s", indexed_chunk[0] + 1, e)
+                return "[Summary failed for this chunk]"
+
+            summarized_chunks = bounded_map(summarize_chunk, enumerate(chunks), self.max_concurrency, on_error)
 
             if not summarized_chunks:
                 raise MultiAgentException("SummarizationAgent failed", error_detail="All chunks failed")
@@ -45,5 +51,5 @@ class SummarizationAgent:
             return final_summary
 
         except Exception as e:
-            logging.error(f"SummarizationAgent: Document summarization failed: {e}")
+            logging.error("SummarizationAgent: Document summarization failed: %s", e)
             raise MultiAgentException("SummarizationAgent failed", error_detail=str(e))
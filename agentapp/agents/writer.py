@@ -2,24 +2,27 @@
 
 from agentapp.logger import logging
 from agentapp.exception import MultiAgentException
+from utils.tracing import set_attributes, traced
 
 
 class WriterAgent:
     def __init__(self):
         logging.info("WriterAgent initialized.")
 
+    @traced("agent.writer.compile_report")
     def compile_report(self, vetted_summaries: list[dict]) -> str:
         logging.info("WriterAgent: Compiling final report from vetted summaries.")
 
         try:
-            logging.info(f"WriterAgent: Received {len(vetted_summaries)} summaries to vet.")
+            logging.info("WriterAgent: Received %s summaries to vet.", len(vetted_summaries))
 
             high_quality = [item["summary"] for item in vetted_summaries if item["label"] == "High"]
             medium_quality = [item["summary"] for item in vetted_summaries if item["label"] == "Medium"]
 
-            logging.info(f"WriterAgent: {len(high_quality)} high-quality summaries selected.")
-            logging.info(f"WriterAgent: {len(medium_quality)} medium-quality summaries selected.")
+            logging.info("WriterAgent: %s high-quality summaries selected.", len(high_quality))
+            logging.info("WriterAgent: %s medium-quality summaries selected.", len(medium_quality))
 
+            set_attributes({"writer.high": len(high_quality), "writer.medium": len(medium_quality)})
             report_sections = []
 
             if high_quality:
@@ -36,5 +39,5 @@ class WriterAgent:
             return "\n\n".join(report_sections)
 
         except Exception as e:
-            logging.error(f"WriterAgent: Failed to compile report: {e}")
+            logging.error("WriterAgent: Failed to compile report: %s", e)
             raise MultiAgentException(f"WriterAgent failed to compile report: {e}")
@@ -38,5 +38,5 @@ class LangGraphBuilder:
             return compiled_graph
 
         except Exception as e:
-            logging.error(f"Orchestrator: Failed to build LangGraph: {e}")
+            logging.error("Orchestrator: Failed to build LangGraph: %s", e)
             raise MultiAgentException(f"LangGraph construction error: {e}")
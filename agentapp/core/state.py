@@ -8,3 +8,4 @@ class ResearchState(TypedDict):
     summaries: Optional[List[str]]
     vetted: Optional[List[dict]]
     report: Optional[str]
+    error: Optional[str]
@@ -1,38 +1,85 @@
+import threading
 from agentapp.core.orchestrator import LangGraphBuilder
-from agentapp.logger import logging
+from agentapp.processing.concurrency import AGENT_MAX_CONCURRENCY
+from agentapp.processing.response_cache import response_cache_stats
+from agentapp.logger import logging, payload_log
 from agentapp.exception import MultiAgentException
+from utils.tracing import configure_tracing, get_tracer, memory_exporter, summarize_spans
 
 
 class LangGraphRunner:
     def __init__(self):
+        configure_tracing("agentapp")
         self.builder = LangGraphBuilder()
+        self._graph = None
+        self._graph_lock = threading.Lock()
+
+    @property
+    def graph(self):
+        # Built and compiled once; the compiled graph is stateless between invocations.
+        if self._graph is None:
+            with self._graph_lock:
+                if self._graph is None:
+                    self._graph = self.builder.build()
+                    logging.info("LangGraphRunner: Graph built successfully.")
+        return self._graph
 
     def run(self, query: str):
         logging.info("LangGraphRunner: Starting orchestration...")
 
         try:
             
-            graph = self.builder.build()
-            logging.info("LangGraphRunner: Graph built successfully.")
-
-            
             initial_state = {"query": query}
-            logging.info(f"LangGraphRunner: Initial state: {initial_state}")
+            payload_log.info("LangGraphRunner: Initial state: %s", initial_state)
 
            
-            final_state = graph.invoke(initial_state)
+            with get_tracer().start_as_current_span("graph.run"):
+                final_state = self.graph.invoke(initial_state)
             logging.info("LangGraphRunner: Execution completed.")
-
-            
-            print("\n=== FINAL REPORT ===\n")
-            print(final_state["report"])
+            self.log_cache_stats()
+            return final_state
 
         except MultiAgentException as mae:
-            logging.error(f"LangGraphRunner: MultiAgentException occurred: {mae}")
+            logging.error("LangGraphRunner: MultiAgentException occurred: %s", mae)
         except Exception as e:
-            logging.exception(f"LangGraphRunner: Unexpected error occurred: {e}")
+            logging.exception("LangGraphRunner: Unexpected error occurred: %s", e)
+
+    def run_many(self, queries: list[str], max_concurrency: int = AGENT_MAX_CONCURRENCY) -> list[dict]:
+        logging.info("LangGraphRunner: Running %s queries with max_concurrency=%s", len(queries), max_concurrency)
+
+        initial_states = [{"query": query} for query in queries]
+        with get_tracer().start_as_current_span("graph.run_many", attributes={"graph.queries": len(queries)}):
+            results = self.graph.batch(initial_states, config={"max_concurrency": max_concurrency},
+                                       return_exceptions=True)
+
+        final_states = []
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                logging.error("LangGraphRunner: Query '%s' failed: %s", query, result)
+                final_states.append({"query": query, "report": None, "error": str(result)})
+            else:
+                final_states.append(result)
+
+        logging.info("LangGraphRunner: Batch execution completed.")
+        self.log_cache_stats()
+        return final_states
+
+    @staticmethod
+    def log_cache_stats():
+        # Once per run rather than per LLM call.
+        stats = response_cache_stats()
+        if stats is not None:
+            logging.info("LangGraphRunner: LLM response cache %s", stats)
 
 
 if __name__ == "__main__":
     runner = LangGraphRunner()
-    runner.run("AI in healthcare")
+    final_state = runner.run("AI in healthcare")
+    if final_state:
+        print("\n=== FINAL REPORT ===\n")
+        print(final_state["report"])
+    if memory_exporter() is not None:
+        # OTEL_TRACES_EXPORTER=memory: print where the run spent its time.
+        print("\n=== SPANS ===\n")
+        for row in summarize_spans(memory_exporter().get_finished_spans()):
+            print(f"{row['name']:<40} {row['count']:>4} x {row['total_ms']:>10.1f} ms")
@@ -0,0 +1,35 @@
+# agentapp/processing/concurrency.py
+
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+
+
+def bounded_map(fn, items, max_workers: int = AGENT_MAX_CONCURRENCY, on_error=None) -> list:
+    """Apply `fn` to every item with at most `max_workers` running at once.
+
+    Results come back in input order. When `on_error` is given, an item that raises
+    is replaced by `on_error(item, exc)` so one failure does not sink the whole batch.
+    """
+    items = list(items)
+
+    def run(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            if on_error is None:
+                raise
+            return on_error(item, e)
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [run(item) for item in items]
+
+    # Each worker runs in a copy of the caller's context, so trace spans nest under the caller's.
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(lambda context, item: context.run(run, item), contexts, items))
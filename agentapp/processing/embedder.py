@@ -1,8 +1,13 @@
 import requests
 import os
 import time
+import threading
 from dotenv import load_dotenv
-from agentapp.logger import logging
+from agentapp.logger import logging, payload_log
+from agentapp.processing.response_cache import LLM_CACHE_ENABLED, ResponseCache, get_response_cache, is_cacheable
+from utils.embedding_providers import ULTRASAFE_BASE_URL
+from utils.metrics import upstream_call
+from utils.tracing import client_span, inject_headers, record_response
 
 load_dotenv()
 
@@ -11,15 +16,57 @@ HEADERS = {
     "Content-Type": "application/json",
     "x-api-key": ULTRASAFE_API_KEY
 }
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Caps upstream calls across every LLMToolkit in the process, however many
+# pipeline stages fan out at the same time.
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
 
 
 class LLMToolkit:
-    def __init__(self):
-        self.base_url = "https://api.us.inc/usf/v1/hiring"
+    def __init__(self, cache: ResponseCache = None, use_cache: bool = LLM_CACHE_ENABLED, bypass_cache: bool = False):
+        self.base_url = f"{ULTRASAFE_BASE_URL}/hiring"
+        self.session = requests.Session()
+        # The shared cache is opened on first use so constructing agents stays side-effect free.
+        self._cache = cache
+        self.use_cache = use_cache
+        self.bypass_cache = bypass_cache
         logging.info("LLMToolkit initialized with base URL: %s", self.base_url)
 
+    @property
+    def cache(self):
+        if self._cache is None and self.use_cache:
+            self._cache = get_response_cache()
+        return self._cache if self.use_cache else None
+
+    def _post(self, path: str, payload: dict, bypass_cache: bool = None) -> dict:
+        url = f"{self.base_url}{path}"
+        cache = self.cache
+        bypass = self.bypass_cache if bypass_cache is None else bypass_cache
+
+        # Looked up before the client span, so only real upstream calls are traced as HTTP requests.
+        if cache is not None and not bypass:
+            body = cache.get(url, payload)
+            logging.debug("LLMToolkit: cache %s for %s", "hit" if body is not None else "miss", path)
+            if body is not None:
+                return body
+
+        with client_span(f"llm {path}", url, payload) as span:
+            with _llm_slots, upstream_call(path.strip("/").replace("/", "_")):
+                response = self.session.post(url, json=payload, headers=inject_headers(HEADERS))
+                record_response(span, response)
+                response.raise_for_status()
+            body = response.json()
+            # Bypass skips the lookup but still refreshes the stored entry.
+            if cache is not None:
+                if is_cacheable(body):
+                    cache.set(url, payload, body)
+                else:
+                    logging.warning("LLMToolkit: not caching malformed response from %s", path)
+            return body
+
     def fetch_llm_research(self, query: str, limit: int = 3) -> list:
-        logging.info(f"LLMToolkit: fetching research for query: '{query}' with limit={limit}")
+        logging.info("LLMToolkit: fetching research for query: '%s' with limit=%s", query, limit)
         
         prompt = f"""List {limit} recent academic findings or insights on the topic: "{query}".
         Format each result as:
@@ -40,12 +87,11 @@ class LLMToolkit:
 
         try:
             start = time.time()
-            response = requests.post(f"{self.base_url}/chat/completions", json=payload, headers=HEADERS)
-            response.raise_for_status()
+            body = self._post("/chat/completions", payload)
             elapsed = time.time() - start
-            logging.info(f"LLMToolkit: research fetched successfully in {elapsed:.2f} seconds")
+            logging.info("LLMToolkit: research fetched successfully in %.2f seconds", elapsed)
 
-            content = response.json()["choices"][0]["message"]["content"]
+            content = body["choices"][0]["message"]["content"]
 
             # Parsing response
             docs = []
@@ -63,15 +109,15 @@ class LLMToolkit:
             if current_doc:
                 docs.append(current_doc)
 
-            logging.info(f"LLMToolkit: total {len(docs)} documents structured and returned")
+            logging.info("LLMToolkit: total %s documents structured and returned", len(docs))
             return docs
 
         except Exception as e:
-            logging.error(f"LLMToolkit: LLM research failed: {e}")
+            logging.error("LLMToolkit: LLM research failed: %s", e)
             return []
 
     def get_summary(self, text: str) -> str:
-        logging.info(f"LLMToolkit: summarizing text of length {len(text)}")
+        logging.info("LLMToolkit: summarizing text of length %s", len(text))
         
         payload = {
             "model": "usf1-mini",
@@ -86,19 +132,18 @@ class LLMToolkit:
 
         try:
             start = time.time()
-            response = requests.post(f"{self.base_url}/chat/completions", json=payload, headers=HEADERS)
-            response.raise_for_status()
+            body = self._post("/chat/completions", payload)
             elapsed = time.time() - start
-            logging.info(f"LLMToolkit: summarization completed in {elapsed:.2f} seconds")
+            logging.info("LLMToolkit: summarization completed in %.2f seconds", elapsed)
 
-            return response.json()["choices"][0]["message"]["content"]
+            return body["choices"][0]["message"]["content"]
         except Exception as e:
-            logging.error(f"LLMToolkit: Summarization failed: {e}")
+            logging.error("LLMToolkit: Summarization failed: %s", e)
             return "Summarization failed."
 
  
     def rerank(self, query: str, texts: list[str]) -> list[str]:
-        logging.info(f"LLMToolkit: reranking {len(texts)} documents against query: '{query}'")
+        logging.info("LLMToolkit: reranking %s documents against query: '%s'", len(texts), query)
 
         payload = {
             "model": "usf1-rerank",
@@ -107,20 +152,18 @@ class LLMToolkit:
         }
 
         try:
-            response = requests.post(f"{self.base_url}/embed/reranker", json=payload, headers=HEADERS)
-            response.raise_for_status()
-            results = response.json()["result"]["data"]
+            results = self._post("/embed/reranker", payload)["result"]["data"]
             ranked = sorted(results, key=lambda x: x["score"], reverse=True)
 
             logging.info("LLMToolkit: reranking completed successfully")
             return [item["text"] for item in ranked]
         except Exception as e:
-            logging.error(f"LLMToolkit: Reranking failed: {e}")
+            logging.error("LLMToolkit: Reranking failed: %s", e)
             return texts
 
     def get_critique_score(self, summary: str) -> str:
         logging.info("LLMToolkit: evaluating critique score for summary")
-        logging.info(f"LLMToolkit: Summary preview: {summary[:100]}...")
+        payload_log.info("LLMToolkit: Summary preview: %s...", summary[:100])
 
         prompt = f"""You are a summary critic.
 Evaluate the following summary for quality in terms of clarity, depth, and relevance.
@@ -140,16 +183,14 @@ Summary:
         }
 
         try:
-            response = requests.post(f"{self.base_url}/chat/completions", json=payload, headers=HEADERS)
-            response.raise_for_status()
-            message = response.json()["choices"][0]["message"]["content"]
+            message = self._post("/chat/completions", payload)["choices"][0]["message"]["content"]
 
             label = message.strip().split()[0].lower()
             if label in ["high", "medium", "low"]:
-                logging.info(f"LLMToolkit: critique score = {label.capitalize()}")
+                logging.info("LLMToolkit: critique score = %s", label.capitalize())
                 return label.capitalize()
             logging.warning("LLMToolkit: Unexpected critique score response")
             return "Unknown"
         except Exception as e:
-            logging.error(f"LLMToolkit: Critique scoring failed: {e}")
+            logging.error("LLMToolkit: Critique scoring failed: %s", e)
             return "Unknown"
\ No newline at end of file
@@ -5,31 +5,57 @@ from agentapp.agents.summarize import SummarizationAgent
 from agentapp.agents.critic import CriticAgent
 from agentapp.agents.writer import WriterAgent
 from agentapp.core.state import ResearchState
+from agentapp.processing.concurrency import AGENT_MAX_CONCURRENCY, bounded_map
+from agentapp.logger import logging
+from utils.tracing import set_attributes, traced
+
+SUMMARY_FAILED = "[Summary failed for this document]"
+
 
 class GraphPipeline:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = AGENT_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
         self.research_agent = ResearchAgent()
-        self.summarization_agent = SummarizationAgent()
+        self.summarization_agent = SummarizationAgent(max_concurrency=max_concurrency)
         self.critic_agent = CriticAgent()
         self.writer_agent = WriterAgent()
 
+    @traced("graph.research")
     def research_node(self, state: ResearchState) -> ResearchState:
         papers = self.research_agent.fetch_documents(state["query"])
+        set_attributes({"graph.documents": len(papers)})
         state["documents"] = papers
         return state
 
+    @traced("graph.summarize")
     def summarize_node(self, state: ResearchState) -> ResearchState:
-        summaries = [self.summarization_agent.summarize_document(doc["content"])
-                     for doc in state["documents"]]
+        def on_error(doc, e):
+            logging.error("GraphPipeline: summarizing '%s' failed: %s", doc.get('title', ''), e)
+            return SUMMARY_FAILED
+
+        summaries = bounded_map(lambda doc: self.summarization_agent.summarize_document(doc["content"]),
+                                state["documents"], self.max_concurrency, on_error)
+        set_attributes({"graph.summaries": len(summaries),
+                        "graph.failures": sum(1 for summary in summaries if summary == SUMMARY_FAILED)})
         state["summaries"] = summaries
         return state
 
+    @traced("graph.critic")
     def critic_node(self, state: ResearchState) -> ResearchState:
-        vetted = [self.critic_agent.evaluate_summary(summary)
-                  for summary in state["summaries"]]
-        state["vetted"] = vetted
+        def on_error(summary, e):
+            logging.error("GraphPipeline: critique failed: %s", e)
+            return {"summary": summary, "label": "Unknown"}
+
+        # Failed documents keep their placeholder without spending an LLM call on it.
+        summaries = [summary for summary in state["summaries"] if summary != SUMMARY_FAILED]
+        evaluated = iter(bounded_map(self.critic_agent.evaluate_summary,
+                                     summaries, self.max_concurrency, on_error))
+        state["vetted"] = [{"summary": summary, "label": "Unknown"} if summary == SUMMARY_FAILED else next(evaluated)
+                           for summary in state["summaries"]]
+        set_attributes({"graph.critiques": len(summaries)})
         return state
 
+    @traced("graph.writer")
     def writer_node(self, state: ResearchState) -> ResearchState:
         state["report"] = self.writer_agent.compile_report(state["vetted"])
         return state
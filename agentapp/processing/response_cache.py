@@ -0,0 +1,78 @@
+# agentapp/processing/response_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from dotenv import load_dotenv
+
+from utils.kv_cache import TwoTierCache
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+LLM_CACHE_DISK_ITEMS = int(os.getenv("LLM_CACHE_DISK_ITEMS", "50000"))
+# Anchored to the project directory, not the working directory, so every entry point shares one cache.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", PROJECT_DIR)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(LLM_CACHE_DIR, "llm_cache.sqlite3"))
+
+
+def is_cacheable(body) -> bool:
+    # Error payloads can arrive with a 200 status; caching them would replay the failure until the TTL.
+    if not isinstance(body, dict) or body.get("error"):
+        return False
+    if "choices" in body:
+        choices = body["choices"]
+        content = (choices[0].get("message") or {}).get("content") if choices else None
+        return isinstance(content, str) and bool(content.strip())
+    if "result" in body:
+        return isinstance((body["result"] or {}).get("data"), list)
+    return False
+
+
+class ResponseCache:
+    """JSON response bodies keyed by sha256 of the endpoint and the canonical payload.
+
+    The payload carries the model and sampling parameters, so changing either is a miss.
+    """
+
+    def __init__(self, path: str = None, ttl: float = LLM_CACHE_TTL,
+                 max_memory_items: int = LLM_CACHE_MEMORY_ITEMS, max_disk_items: int = LLM_CACHE_DISK_ITEMS):
+        self.store = TwoTierCache(path, max_memory_items=max_memory_items, max_disk_items=max_disk_items, ttl=ttl)
+
+    @staticmethod
+    def key(url: str, payload: dict) -> str:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{url}\0{canonical}".encode("utf-8")).hexdigest()
+
+    def get(self, url: str, payload: dict):
+        blob = self.store.get(self.key(url, payload))
+        return None if blob is None else json.loads(blob)
+
+    def set(self, url: str, payload: dict, body: dict):
+        self.store.set(self.key(url, payload), json.dumps(body).encode("utf-8"))
+
+    @property
+    def stats(self) -> dict:
+        return {**self.store.stats, "hit_rate": round(self.store.hit_rate(), 4)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    # Shared by every LLMToolkit so the memory tier is reused across agents.
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(LLM_CACHE_PATH)
+        return _cache
+
+
+def response_cache_stats():
+    # None until an LLMToolkit has opened the cache in this process.
+    return _cache.stats if _cache is not None else None
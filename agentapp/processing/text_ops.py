@@ -1,27 +1,16 @@
 # agentapp/processing/text_ops.py
 
-from agentapp.logger import logging
+from agentapp.logger import logging, payload_log
+from utils.chunking import iter_chunks
 
-def chunk_text(text: str, max_tokens: int = 800) -> list[str]:
-    logging.info(f"chunk_text: Starting to chunk text with max_tokens={max_tokens}")
-    
-    sentences = text.split('. ')
-    chunks = []
-    current_chunk = ""
+def chunk_text(text: str, max_tokens: int = 800, overlap: int = 0) -> list[str]:
+    logging.info("chunk_text: Starting to chunk text with max_tokens=%s", max_tokens)
 
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) < max_tokens:
-            current_chunk += sentence + ". "
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + ". "
+    chunks = list(iter_chunks(text, max_tokens=max_tokens, overlap=overlap))
 
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    logging.info(f"chunk_text: Total chunks created: {len(chunks)}")
+    logging.info("chunk_text: Total chunks created: %s", len(chunks))
 
     for i, chunk in enumerate(chunks[:3]):
-        logging.info(f"chunk_text: Preview chunk {i+1}: {chunk[:100]}...")
+        payload_log.info("chunk_text: Preview chunk %s: %s...", i+1, chunk[:100])
 
     return chunks
@@ -0,0 +1,56 @@
+"""Benchmark the shared token-aware chunker on large documents.
+
+    python -m benchmarks.bench_chunking --sizes 1 4 16
+
+Sizes are in megabytes of synthetic text. The previous character-based
+`chunk_text` is reproduced here as a baseline; it did not count tokens, so
+the comparison is of wall time only.
+"""
+
+import argparse
+import time
+
+from utils.chunking import count_tokens, get_encoding, iter_chunks
+
+SENTENCE = "The TechEase Hub resets after holding the button for ten seconds. "
+
+
+def legacy_chunk_text(text: str, max_tokens: int = 800) -> list[str]:
+    sentences = text.split('. ')
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) < max_tokens:
+            current_chunk += sentence + ". "
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence + ". "
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16], help="document sizes in MB")
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=64)
+    args = parser.parse_args()
+
+    encoding = get_encoding()
+    for size_mb in args.sizes:
+        text = SENTENCE * (size_mb * 1024 * 1024 // len(SENTENCE))
+
+        legacy, legacy_seconds = timed(lambda: legacy_chunk_text(text))
+        chunks, seconds = timed(lambda: list(iter_chunks(text, args.max_tokens, args.overlap, encoding=encoding)))
+        largest = max(count_tokens(chunk, encoding) for chunk in chunks)
+
+        print(f"{size_mb:>4} MB | iter_chunks: {len(chunks):>6} chunks in {seconds:6.2f}s "
+              f"({size_mb / seconds:5.2f} MB/s, largest {largest} tokens) | "
+              f"legacy chunk_text: {len(legacy):>6} chunks in {legacy_seconds:6.2f}s")
@@ -0,0 +1,40 @@
+"""Compare serial per-chunk ingestion against batched, concurrent ingestion.
+
+    python -m benchmarks.bench_ingest --chunks 300 --latency 0.05
+"""
+
+import argparse
+import tempfile
+
+from benchmarks.fake_upstream import start_server, base_url
+from utils.embedding_providers import RemoteEmbeddingProvider
+from utils.rag_retriever import SupportDocEmbedder
+
+
+def run(chunks: list[str], upstream: str, batch_size: int, max_in_flight: int) -> dict:
+    with tempfile.TemporaryDirectory() as db_path:
+        embedder = SupportDocEmbedder(db_path=db_path, collection_name="bench_ingest",
+                                      provider=RemoteEmbeddingProvider(base_url=upstream))
+        ids = [f"bench_chunk_{i}" for i in range(len(chunks))]
+        return embedder.store_chunks(ids, chunks, batch_size=batch_size, max_in_flight=max_in_flight)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency)
+    upstream = base_url(server)
+    chunks = [f"Support manual page {i}. " * 40 for i in range(args.chunks)]
+
+    serial = run(chunks, upstream, batch_size=1, max_in_flight=1)
+    batched = run(chunks, upstream, batch_size=args.batch_size, max_in_flight=args.max_in_flight)
+    server.shutdown()
+
+    print(f"serial : {serial}")
+    print(f"batched: {batched}")
+    print(f"speedup: {serial['seconds'] / batched['seconds']:.1f}x")
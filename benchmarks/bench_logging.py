@@ -0,0 +1,81 @@
+"""Per-request logging cost: the old synchronous file logging against the queued setup.
+
+    python -m benchmarks.bench_logging --requests 5000 --context-chars 1500
+
+Each simulated /chat request logs what the handler logs: the user line, the
+retrieved context chunks and the completion line. "sync" is the previous
+setup (FileHandler on the caller's thread, f-strings); "queued" is
+utils.log_setup (QueueHandler, %-args, sampled payload logger). The time is
+what the request thread spends; "drain" is the listener catching up afterwards.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from utils.log_setup import TEXT_FORMAT, create_handlers
+
+
+def isolated_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def sync_request(log, payload_log, user, session_id, message, chunks):
+    log.info(f"User: {user} | Session: {session_id} | Message: {message}")
+    payload_log.info(f"Context retrieved for query: {chunks}")
+    log.info("LLM response received successfully.")
+
+
+def queued_request(log, payload_log, user, session_id, message, chunks):
+    log.info("User: %s | Session: %s | Message: %s", user, session_id, message)
+    payload_log.info("Context retrieved for query: %s", chunks)
+    log.info("LLM response received successfully.")
+
+
+def run(request, log, payload_log, requests: int, chunks: list[str]) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        request(log, payload_log, "Username", f"session-{i % 50}", "What is the return policy?", chunks)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--context-chars", type=int, default=1500, help="size of each of the two context chunks")
+    parser.add_argument("--payload-rate", type=float, default=0.1, help="sampling rate of the payload logger")
+    args = parser.parse_args()
+
+    chunks = ["Products can be returned within 30 days of delivery. " * (args.context_chars // 54 + 1)] * 2
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        file_handler = logging.FileHandler(os.path.join(log_dir, "sync.log"))
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        sync_log = isolated_logger("bench.sync", file_handler)
+        sync_seconds = run(sync_request, sync_log, isolated_logger("bench.sync.payload", file_handler),
+                           args.requests, chunks)
+        file_handler.close()
+
+        handler, listener = create_handlers(os.path.join(log_dir, "queued.log"),
+                                            sample_rates={"bench.queued.payload": args.payload_rate})
+        listener.start()
+        queued_seconds = run(queued_request, isolated_logger("bench.queued", handler),
+                             isolated_logger("bench.queued.payload", handler), args.requests, chunks)
+        drain_start = time.perf_counter()
+        listener.stop()
+        drain_seconds = time.perf_counter() - drain_start
+
+        sizes = {name: os.path.getsize(os.path.join(log_dir, name)) for name in ("sync.log", "queued.log")}
+
+    per_request = 1e6 / args.requests
+    print(f"sync  : {sync_seconds * per_request:7.1f} us/request on the request thread, "
+          f"{sizes['sync.log'] / 1e6:.1f} MB written")
+    print(f"queued: {queued_seconds * per_request:7.1f} us/request on the request thread, "
+          f"{sizes['queued.log'] / 1e6:.1f} MB written, drain {drain_seconds:.2f}s, dropped {handler.dropped}")
+    print(f"speedup on the request thread: {sync_seconds / queued_seconds:.1f}x")
@@ -0,0 +1,51 @@
+"""Compare serial retrieve_context calls against one batched retrieve_contexts call.
+
+    python -m benchmarks.bench_retrieval --queries 500 --chunks 2000 --latency 0.02
+
+Embeddings come from the fake upstream, so the serial path pays one simulated
+round trip per query and the batched path one per batch.
+"""
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.fake_upstream import base_url, start_server
+from utils.embedding_providers import RemoteEmbeddingProvider
+from utils.rag_retriever import SupportDocEmbedder
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency)
+    queries = [f"How do I fix error code {i}?" for i in range(args.queries)]
+    chunks = [f"Error code {i}: power-cycle the hub and retry. " * 5 for i in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as db_path:
+        embedder = SupportDocEmbedder(db_path=db_path, collection_name="bench_retrieval", use_cache=False,
+                                      use_lexical=False, provider=RemoteEmbeddingProvider(base_url=base_url(server)))
+        embedder.store_chunks([f"chunk_{i}" for i in range(args.chunks)], chunks)
+
+        serial, serial_seconds = timed(lambda: [embedder.retrieve_context(q, top_k=args.top_k) for q in queries])
+        batched, batched_seconds = timed(lambda: embedder.retrieve_contexts(
+            queries, top_k=args.top_k, batch_size=args.batch_size, max_in_flight=args.max_in_flight))
+    server.shutdown()
+
+    assert [r["documents"] for r in batched] == serial
+    print(f"serial : {args.queries / serial_seconds:8.1f} queries/s ({serial_seconds:.2f}s)")
+    print(f"batched: {args.queries / batched_seconds:8.1f} queries/s ({batched_seconds:.2f}s)")
+    print(f"speedup: {serial_seconds / batched_seconds:.1f}x")
@@ -0,0 +1,156 @@
+"""Concurrent chat-history writes against SQLite: default vs tuned vs async engine vs write-behind.
+
+    python -m benchmarks.bench_sqlite_writes --writers 8 --turns 200 --readers 2
+
+Every writer commits chat turns (a user and a bot row, as /chat does) while
+readers page through history. "default" is the previous engine (rollback
+journal, synchronous=FULL); "tuned" is chatapp.db.db.create_db_engine (WAL,
+synchronous=NORMAL, sized pool); "async" is the aiosqlite engine the handlers
+use, with the writers as coroutines on one event loop; "behind" hands the same
+turns to chatapp.db.history_writer.HistoryWriter, which group-commits them.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from chatapp.db.db import Base, create_async_db_engine, create_db_engine
+from chatapp.db.history import fetch_page
+from chatapp.db.history_writer import HistoryWriter
+from chatapp.db.models import ConversationHistory
+
+
+def turn(user_id: int, session_id: str, i: int) -> list[ConversationHistory]:
+    now = datetime.now(timezone.utc)
+    return [
+        ConversationHistory(user_id=user_id, session_id=session_id, sender="user", message=f"question {i}",
+                            timestamp=now),
+        ConversationHistory(user_id=user_id, session_id=session_id, sender="bot", message=f"answer {i} " * 40,
+                            timestamp=now),
+    ]
+
+
+def run_threads(engine, writers: int, turns: int, readers: int) -> dict:
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stop = threading.Event()
+    counts = {"turns": 0, "errors": 0, "reads": 0}
+    lock = threading.Lock()
+
+    def write(worker: int):
+        for i in range(turns):
+            with Session() as db:
+                try:
+                    db.add_all(turn(worker, f"session-{worker}", i))
+                    db.commit()
+                    key = "turns"
+                except OperationalError:
+                    db.rollback()
+                    key = "errors"
+            with lock:
+                counts[key] += 1
+
+    def read(worker: int):
+        while not stop.is_set():
+            with Session() as db:
+                fetch_page(db, worker, f"session-{worker}", limit=50)
+            with lock:
+                counts["reads"] += 1
+
+    reader_threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+    return {**counts, "seconds": elapsed}
+
+
+async def run_async(engine, writers: int, turns: int) -> dict:
+    Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    counts = {"turns": 0, "errors": 0, "reads": 0}
+
+    async def write(worker: int):
+        for i in range(turns):
+            async with Session() as db:
+                try:
+                    db.add_all(turn(worker, f"session-{worker}", i))
+                    await db.commit()
+                    counts["turns"] += 1
+                except OperationalError:
+                    await db.rollback()
+                    counts["errors"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(write(i) for i in range(writers)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return {**counts, "seconds": elapsed}
+
+
+async def run_write_behind(engine, writers: int, turns: int) -> dict:
+    writer = HistoryWriter(async_sessionmaker(engine, autoflush=False, expire_on_commit=False))
+    await writer.start()
+
+    async def write(worker: int):
+        for i in range(turns):
+            await writer.submit(turn(worker, f"session-{worker}", i))
+            # Yield as a handler would between requests.
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(write(i) for i in range(writers)))
+    # Counted once the last row is on disk, not when it was acknowledged.
+    await writer.stop()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return {"turns": writer.stats["rows"] // 2, "errors": writer.stats["failures"], "reads": 0, "seconds": elapsed}
+
+
+def report(label: str, result: dict):
+    rows = result["turns"] * 2
+    print(f"{label:>8}: {rows / result['seconds']:8.0f} rows/s  {result['turns'] / result['seconds']:7.0f} turns/s  "
+          f"errors {result['errors']}  reads {result['reads']}  ({result['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=200, help="turns committed by each writer")
+    parser.add_argument("--readers", type=int, default=2, help="threads paging history meanwhile (sync engines)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("default", "tuned", "async", "behind"):
+            path = os.path.join(tmp, f"{label}.db")
+            url = f"sqlite:///{path}"
+            if label == "default":
+                engine = create_engine(url, connect_args={"check_same_thread": False})
+            else:
+                engine = create_db_engine(url)
+            Base.metadata.create_all(engine)
+
+            if label in ("async", "behind"):
+                engine.dispose()
+                run = run_async if label == "async" else run_write_behind
+                result = asyncio.run(run(create_async_db_engine(f"sqlite+aiosqlite:///{path}"),
+                                         args.writers, args.turns))
+            else:
+                result = run_threads(engine, args.writers, args.turns, args.readers)
+                engine.dispose()
+            report(label, result)
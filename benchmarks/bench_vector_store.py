@@ -0,0 +1,64 @@
+"""Compare chromadb against the memory-mapped flat store on a small collection.
+
+    python -m benchmarks.bench_vector_store --chunks 3000 --dim 1024 --queries 200
+
+Reports time to open the collection in a fresh client, single-query latency, and
+recall@k of chromadb's approximate HNSW search against the exact flat results.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from chromadb import PersistentClient
+
+from utils.flat_store import FlatVectorStore
+
+
+def build(client, ids, vectors, documents):
+    collection = client.get_or_create_collection("bench_vectors")
+    for i in range(0, len(ids), 1000):
+        collection.upsert(ids=ids[i:i + 1000], embeddings=vectors[i:i + 1000], documents=documents[i:i + 1000])
+
+
+def measure(open_client, queries, top_k):
+    start = time.perf_counter()
+    collection = open_client().get_collection("bench_vectors")
+    collection.query(query_embeddings=queries[:1], n_results=top_k)
+    open_seconds = time.perf_counter() - start
+
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(collection.query(query_embeddings=[query], n_results=top_k, include=["documents"])["ids"][0])
+    per_query_ms = (time.perf_counter() - start) / len(queries) * 1000
+    return open_seconds, per_query_ms, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    ids = [f"chunk_{i}" for i in range(args.chunks)]
+    documents = [f"Support manual chunk {i}" for i in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as root:
+        chroma_path, flat_path = f"{root}/chroma", f"{root}/flat"
+        build(PersistentClient(path=chroma_path), ids, vectors, documents)
+        build(FlatVectorStore(flat_path), ids, vectors, documents)
+
+        chroma = measure(lambda: PersistentClient(path=chroma_path), queries, args.top_k)
+        flat = measure(lambda: FlatVectorStore(flat_path), queries, args.top_k)
+
+    recall = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(chroma[2], flat[2])])
+    print(f"chroma: open {chroma[0] * 1000:7.1f} ms | query {chroma[1]:6.2f} ms")
+    print(f"flat  : open {flat[0] * 1000:7.1f} ms | query {flat[1]:6.2f} ms")
+    print(f"chroma recall@{args.top_k} vs exact: {recall:.3f}")
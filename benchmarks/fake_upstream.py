@@ -0,0 +1,137 @@
+"""Local stand-in for the UltraSafe API used by benchmarks and load tests.
+
+Serves embeddings, chat completions (plain and streamed) and the reranker.
+Run it and point the app and the agents at it with
+    ULTRASAFE_BASE_URL=http://127.0.0.1:8900/usf/v1
+
+Every response waits `latency` plus a uniform random `jitter` seconds; streamed
+completions additionally wait `token_delay` between tokens. With `error_rate`
+set, that fraction of requests fails with a 503. Embeddings have `embed_dim`
+dimensions, which must match the collection the app queries (1024 for stores
+built from the real embedding API).
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBED_DIM = 1024
+ANSWER = "Products can be returned within 30 days of delivery with the original receipt."
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> list[float]:
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((digest[i % len(digest)] + i) % 256) / 255.0 for i in range(dim)]
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, tokens: list[str]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [json.dumps({"choices": [{"delta": {"content": token}}]}) for token in tokens] + ["[DONE]"]
+        for event in events:
+            data = f"data: {event}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _count(self, endpoint: str):
+        with self.server.lock:
+            self.server.requests[endpoint] += 1
+            if endpoint == "embeddings":
+                self.server.embedding_requests += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._count("errors")
+            self._send_json(503, {"detail": "Injected upstream failure"})
+        elif self.path.endswith("/embed/embeddings"):
+            self._count("embeddings")
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            data = [{"index": i, "embedding": fake_embedding(text, self.server.embed_dim)}
+                    for i, text in enumerate(inputs)]
+            self._send_json(200, {"result": {"data": data}})
+        elif self.path.endswith("/chat/completions"):
+            self._count("chat_completions")
+            if payload.get("stream"):
+                self._send_stream([word + " " for word in ANSWER.split()])
+            else:
+                self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": ANSWER}}]})
+        elif self.path.endswith("/embed/reranker"):
+            self._count("reranker")
+            query_words = set(payload.get("query", "").lower().split())
+            data = []
+            for i, text in enumerate(payload.get("texts", [])):
+                overlap = len(query_words & set(text.lower().split()))
+                data.append({"index": i, "text": text, "score": overlap / (len(query_words) or 1)})
+            self._send_json(200, {"result": {"data": data}})
+        else:
+            self._send_json(404, {"detail": f"Unknown path {self.path}"})
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 token_delay: float = 0.0, error_rate: float = 0.0, embed_dim: int = EMBED_DIM) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), FakeUpstreamHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.token_delay = token_delay
+    server.error_rate = error_rate
+    server.embed_dim = embed_dim
+    server.lock = threading.Lock()
+    server.requests = Counter()
+    server.embedding_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/usf/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake UltraSafe upstream server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay, in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--embed-dim", type=int, default=EMBED_DIM, help="dimension of the returned embeddings")
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, args.latency, args.jitter, args.token_delay, args.error_rate,
+                          args.embed_dim)
+    print(f"Fake upstream listening on {base_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,280 @@
+"""Ramp concurrent authenticated users against /chat and record latency percentiles.
+
+Against a running app (start the fake upstream first and point the app at it):
+
+    python -m benchmarks.fake_upstream --latency 0.2 --jitter 0.1
+    ULTRASAFE_BASE_URL=http://127.0.0.1:8900/usf/v1 uvicorn chatapp.main:app --workers 4
+    python -m benchmarks.loadtest_chat --url http://127.0.0.1:8000 --stages 10:30,50:30,100:30
+
+Or fully in-process, with the fake upstream started on a free port and the app
+served through httpx's ASGI transport (client and app then share one event loop):
+
+    python -m benchmarks.loadtest_chat --in-process --stages 5:10,20:10
+
+Each stage is USERS:SECONDS. Every virtual user logs in once, then sends chat
+requests back to back (plus --think-time). Results per stage and overall are
+printed and written to --output as JSON, so runs can be compared across releases.
+
+A 200 answered without any retrieved context (e.g. the vector query failed and
+the app fell back to an empty context) did not take the path being measured. Such
+requests are counted as `empty_context`, and the run exits non-zero if any occurred.
+In-process, the fake upstream's embedding size follows the collection
+(--embed-dim overrides it, and must then match).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+QUESTIONS = [
+    "What is the return policy?",
+    "How do I reset the TechEase Hub?",
+    "The hub is not connecting to Wi-Fi, what should I do?",
+    "How long is the warranty?",
+    "Can I change my delivery address after ordering?",
+    "How do I update the hub firmware?",
+]
+
+
+def parse_stages(spec: str) -> list[tuple[int, float]]:
+    stages = []
+    for part in spec.split(","):
+        users, seconds = part.split(":")
+        stages.append((int(users), float(seconds)))
+    return stages
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    # Nearest-rank percentile over an already sorted list.
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(samples: list[dict], seconds: float) -> dict:
+    latencies = sorted(sample["latency"] for sample in samples if sample["ok"])
+    errors = sum(1 for sample in samples if not sample["ok"])
+    empty = sum(1 for sample in samples if sample["ok"] and sample.get("empty_context"))
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "empty_context": empty,
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds > 0 else 0.0,
+        "seconds": round(seconds, 2),
+    }
+    for pct in (50, 95, 99):
+        summary[f"p{pct}_ms"] = round(percentile(latencies, pct) * 1000, 1)
+    first_tokens = sorted(sample["ttft"] for sample in samples if sample["ok"] and sample.get("ttft") is not None)
+    if first_tokens:
+        summary["ttft_p50_ms"] = round(percentile(first_tokens, 50) * 1000, 1)
+        summary["ttft_p95_ms"] = round(percentile(first_tokens, 95) * 1000, 1)
+    return summary
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> dict:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def is_empty_context(usage) -> bool:
+    # usage is null for semantic-cache hits, which retrieve nothing by design.
+    return usage is not None and usage.get("candidates") == 0
+
+
+async def send_chat(client: httpx.AsyncClient, headers: dict, session_id: str, message: str, stream: bool) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    usage = None
+    try:
+        body = {"session_id": session_id, "message": message}
+        if stream:
+            async with client.stream("POST", "/chat/stream", json=body, headers=headers) as response:
+                event = None
+                async for line in response.aiter_lines():
+                    if ttft is None and line.startswith("data:"):
+                        ttft = time.perf_counter() - start
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif event == "done" and line.startswith("data:"):
+                        usage = json.loads(line[len("data:"):]).get("usage")
+                status = response.status_code
+        else:
+            response = await client.post("/chat", json=body, headers=headers)
+            status = response.status_code
+            if status == 200:
+                usage = response.json().get("usage")
+        ok = status == 200
+    except httpx.HTTPError as e:
+        status, ok = type(e).__name__, False
+    return {"latency": time.perf_counter() - start, "ttft": ttft, "ok": ok, "status": status,
+            "empty_context": is_empty_context(usage)}
+
+
+async def virtual_user(client, credentials, stop: asyncio.Event, samples: list, clock: dict, stream: bool,
+                       think_time: float, unique: bool):
+    session_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+    try:
+        headers = await login(client, *credentials)
+    except httpx.HTTPError as e:
+        samples.append({"stage": clock["stage"], "latency": 0.0, "ttft": None, "ok": False,
+                        "status": f"login: {type(e).__name__}"})
+        return
+    turn = 0
+    while not stop.is_set():
+        message = QUESTIONS[turn % len(QUESTIONS)]
+        if unique:
+            # Defeats the semantic and embedding caches so every request takes the full path.
+            message = f"{message} (ref {uuid.uuid4().hex[:8]})"
+        sample = await send_chat(client, headers, session_id, message, stream)
+        # Attributed to the stage in which the request finished.
+        samples.append({"stage": clock["stage"], **sample})
+        turn += 1
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_load(client: httpx.AsyncClient, stages: list[tuple[int, float]], credentials: tuple[str, str],
+                   stream: bool = False, think_time: float = 0.0, unique: bool = False, progress=print) -> dict:
+    # Users are added or stopped at each stage boundary and keep their session across stages.
+    users = []
+    samples = []
+    clock = {"stage": 0}
+    results = []
+    started = time.perf_counter()
+    for index, (target, seconds) in enumerate(stages):
+        clock["stage"] = index
+        while len(users) > target:
+            users.pop()[0].set()
+        while len(users) < target:
+            stop = asyncio.Event()
+            task = asyncio.create_task(
+                virtual_user(client, credentials, stop, samples, clock, stream, think_time, unique)
+            )
+            users.append((stop, task))
+
+        stage_start = time.perf_counter()
+        await asyncio.sleep(seconds)
+        stage_samples = [sample for sample in samples if sample["stage"] == index]
+        summary = {"stage": index + 1, "users": target, **summarize(stage_samples, time.perf_counter() - stage_start)}
+        results.append(summary)
+        progress(format_summary(f"stage {index + 1} ({target} users)", summary))
+
+    elapsed = time.perf_counter() - started
+    # Requests still in flight when the last stage ends are not counted.
+    finished = list(samples)
+    for stop, _ in users:
+        stop.set()
+    await asyncio.gather(*(task for _, task in users), return_exceptions=True)
+    overall = summarize(finished, elapsed)
+    progress(format_summary("overall", overall))
+    return {"stages": results, "overall": overall}
+
+
+def format_summary(label: str, summary: dict) -> str:
+    line = (f"{label:>22}: {summary['requests']:>6} req | {summary['throughput_rps']:>7.1f} rps | "
+            f"p50 {summary['p50_ms']:>7.1f} ms | p95 {summary['p95_ms']:>7.1f} ms | p99 {summary['p99_ms']:>7.1f} ms | "
+            f"errors {summary['error_rate']:.2%}")
+    if summary["empty_context"]:
+        line += f" | EMPTY CONTEXT {summary['empty_context']}"
+    if "ttft_p50_ms" in summary:
+        line += f" | ttft p50 {summary['ttft_p50_ms']:.1f} ms"
+    return line
+
+
+def check_embed_dim(collection_dim, requested=None) -> int:
+    if requested and collection_dim and requested != collection_dim:
+        raise SystemExit(f"--embed-dim {requested} does not match the collection's {collection_dim} dimensions")
+    if not (requested or collection_dim):
+        raise SystemExit("The collection is empty; ingest documents first or pass --embed-dim")
+    return requested or collection_dim
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args) -> dict:
+    server = None
+    if args.in_process:
+        from benchmarks.fake_upstream import base_url, start_server
+
+        server = start_server(latency=args.upstream_latency, jitter=args.upstream_jitter,
+                              token_delay=args.upstream_token_delay)
+        # Must be set before the app is imported: upstream URLs are read at import time.
+        os.environ["ULTRASAFE_BASE_URL"] = base_url(server)
+        from chatapp.main import app, get_retriever
+
+        server.embed_dim = check_embed_dim(get_retriever().embedding_dim(), args.embed_dim)
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                   timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+
+    try:
+        results = await run_load(client, parse_stages(args.stages), (args.username, args.password),
+                                 stream=args.stream, think_time=args.think_time, unique=args.unique)
+    finally:
+        await client.aclose()
+        if server is not None:
+            from chatapp.db.db import async_engine
+
+            # ASGITransport skips the app's lifespan, which would otherwise dispose the pool.
+            await async_engine.dispose()
+            server.shutdown()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "target": "in-process" if args.in_process else args.url,
+        "endpoint": "/chat/stream" if args.stream else "/chat",
+        "config": {key: value for key, value in vars(args).items() if key not in ("password", "output")},
+        **results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the /chat endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-process", action="store_true", help="serve the app and a fake upstream in this process")
+    parser.add_argument("--stages", default="5:10,20:20,50:20", help="comma-separated USERS:SECONDS ramp")
+    parser.add_argument("--username", default=os.getenv("LOADTEST_USERNAME", "Username"))
+    parser.add_argument("--password", default=os.getenv("LOADTEST_PASSWORD", "password"))
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and record time to first token")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds each user waits between requests")
+    parser.add_argument("--unique", action="store_true", help="make every question unique to bypass caches")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--upstream-latency", type=float, default=0.2, help="fake upstream latency (--in-process)")
+    parser.add_argument("--upstream-jitter", type=float, default=0.1, help="fake upstream jitter (--in-process)")
+    parser.add_argument("--upstream-token-delay", type=float, default=0.01,
+                        help="fake upstream delay between streamed tokens (--in-process)")
+    parser.add_argument("--embed-dim", type=int, default=None,
+                        help="fake upstream embedding size (--in-process; default: the collection's)")
+    parser.add_argument("--output", default=f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if report["overall"]["empty_context"]:
+        print(f"{report['overall']['empty_context']} requests were answered without retrieved context; "
+              "retrieval failed, so the latencies above do not cover it.", file=sys.stderr)
+        sys.exit(1)
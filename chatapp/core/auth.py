@@ -1,21 +1,107 @@
 from passlib.context import CryptContext
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from chatapp.db.db import AsyncSessionLocal
 from chatapp.db.models import User
+from chatapp.logger import logging
+from chatapp.exception import ChatBotException
+from utils.metrics import stage
 from jose import JWTError, jwt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta,timezone
 from dotenv import load_dotenv
+import asyncio
+import threading
+import time
+import sys
 import os
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+# bcrypt is deliberately slow; a small dedicated pool keeps login bursts from
+# occupying the shared threadpool that chat requests use for DB work.
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+
+
+class PrincipalCache:
+    """Verified principals keyed by bearer token.
+
+    An entry lives for at most `ttl` seconds and never past the token's own expiry.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal: Principal, token_exp: float = None):
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            for token in [t for t, (p, _) in self._entries.items() if p.username == username]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    # Only fires for ORM deletes (session.delete); bulk query.delete() bypasses it.
+    principal_cache.invalidate_user(target.username)
+
 
 def get_user(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
+async def aget_user(db: AsyncSession, username: str):
+    return (await db.scalars(select(User).where(User.username == username))).first()
+
 def hash_password(password: str):
     return pwd_context.hash(password)
 
@@ -28,8 +114,48 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = await aget_user(db, username)
+    if not user:
+        return False
+    loop = asyncio.get_running_loop()
+    verified = await loop.run_in_executor(_bcrypt_executor, verify_password, password, user.hashed_password)
+    return user if verified else False
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+async def load_principal(username: str):
+    async with AsyncSessionLocal() as db:
+        user = await aget_user(db, username)
+        return Principal(id=user.id, username=user.username) if user else None
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    with stage("auth"):
+        return await resolve_principal(token)
+
+
+async def resolve_principal(token: str) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError as e:
+        logging.error(ChatBotException(e, sys))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    username: str = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    principal = await load_principal(username)
+    if principal is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    answer: str
+    chunk_ids: tuple
+    similarity: float
+    created: float
+
+
+class SemanticCache:
+    """Answers keyed by query embedding, matched by cosine similarity.
+
+    Every entry records the collection's index_version at the time it was answered;
+    a lookup with a newer version drops the whole cache, since re-ingestion may
+    have changed any chunk. Once full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, index_version):
+        self.index_version = index_version
+        self._vectors = None
+        self._entries = []
+        self._next = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._reset(index_version)
+
+    def lookup(self, embedding, index_version) -> Optional[CachedAnswer]:
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if not self._entries or vector.shape[0] != self._vectors.shape[1]:
+                self.stats["misses"] += 1
+                return None
+            similarities = self._vectors[:len(self._entries)] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            answer, chunk_ids, created = self._entries[best]
+            return CachedAnswer(answer, chunk_ids, float(similarities[best]), created)
+
+    def add(self, embedding, chunk_ids, answer: str, index_version):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries = []
+                self._next = 0
+            entry = (answer, tuple(chunk_ids), time.time())
+            if len(self._entries) < self.max_entries:
+                self._entries.append(entry)
+            else:
+                self._entries[self._next] = entry
+            self._vectors[self._next] = vector
+            self._next = (self._next + 1) % self.max_entries
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = SemanticCache()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    return _cache if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,40 @@
+import os
+import httpx
+from dotenv import load_dotenv
+
+from utils.embedding_providers import ULTRASAFE_BASE_URL
+
+load_dotenv()
+
+CHAT_COMPLETIONS_URL = f"{ULTRASAFE_BASE_URL}/hiring/chat/completions"
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "60"))
+
+_client = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=30,
+        ),
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=5.0),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Shared across requests so upstream connections stay alive between chats.
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,4 +1,8 @@
 from chatapp.db.db import engine
-from chatapp.db.models import Base
+from chatapp.db.models import Base, ConversationHistory
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+Base.metadata.create_all(bind=engine)
+
+# create_all skips indexes on tables that already exist, so add any new ones explicitly.
+for index in ConversationHistory.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,100 @@
+import base64
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Select, and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from chatapp.db.models import ConversationHistory
+
+MAX_PAGE_SIZE = 200
+# Stands in for the id of a row the write-behind writer has not committed yet: a cursor
+# on such a row means "everything up to and including this timestamp".
+PENDING_ROW_ID = 2 ** 63 - 1
+
+
+def encode_cursor(row: ConversationHistory) -> str:
+    raw = f"{row.timestamp.isoformat()}|{row.id if row.id is not None else PENDING_ROW_ID}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+
+def sort_key(row: ConversationHistory):
+    # Stored timestamps come back naive; rows still in memory carry UTC tzinfo.
+    return row.timestamp.replace(tzinfo=None), row.id if row.id is not None else PENDING_ROW_ID
+
+
+def merge_pending(rows: List[ConversationHistory], pending: List[ConversationHistory], cursor: Optional[str],
+                  limit: int) -> List[ConversationHistory]:
+    """Add uncommitted rows to a page read from the database, in (timestamp, id) order."""
+    if not pending:
+        return rows
+    stored = {row.id for row in rows}
+    after = None
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        after = (timestamp.replace(tzinfo=None), row_id)
+    # A row committed between the pending snapshot and the query is already in `rows`.
+    extra = [row for row in pending if row.id not in stored and (after is None or sort_key(row) > after)]
+    return sorted(rows + extra, key=sort_key)[:limit]
+
+
+def serialize(row: ConversationHistory) -> dict:
+    return {"sender": row.sender, "message": row.message, "timestamp": row.timestamp.isoformat()}
+
+
+def history_query(user_id: int, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> Select:
+    # Keyset pagination on (timestamp, id), served by the (user_id, session_id, timestamp) index.
+    query = select(ConversationHistory).where(
+        ConversationHistory.user_id == user_id,
+        ConversationHistory.session_id == session_id,
+    )
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ConversationHistory.timestamp > timestamp,
+            and_(ConversationHistory.timestamp == timestamp, ConversationHistory.id > row_id),
+        ))
+    return query.order_by(ConversationHistory.timestamp, ConversationHistory.id).limit(limit)
+
+
+def to_page(rows: List[ConversationHistory], cursor: Optional[str], limit: int) -> dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [serialize(row) for row in rows],
+        "next_cursor": encode_cursor(rows[-1]) if rows else cursor,
+        "has_more": has_more,
+    }
+
+
+def fetch_after(db: Session, user_id: int, session_id: str, cursor: Optional[str] = None,
+                limit: int = 50) -> List[ConversationHistory]:
+    return list(db.scalars(history_query(user_id, session_id, cursor, limit)))
+
+
+def fetch_page(db: Session, user_id: int, session_id: str, cursor: Optional[str] = None, limit: int = 50) -> dict:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return to_page(fetch_after(db, user_id, session_id, cursor, limit + 1), cursor, limit)
+
+
+async def afetch_after(db: AsyncSession, user_id: int, session_id: str, cursor: Optional[str] = None,
+                       limit: int = 50, pending: List[ConversationHistory] = None) -> List[ConversationHistory]:
+    # `pending` must be snapshotted before the query so that no row can fall between the two.
+    rows = list(await db.scalars(history_query(user_id, session_id, cursor, limit)))
+    return merge_pending(rows, pending, cursor, limit)
+
+
+async def afetch_page(db: AsyncSession, user_id: int, session_id: str, cursor: Optional[str] = None,
+                      limit: int = 50, pending: List[ConversationHistory] = None) -> dict:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return to_page(await afetch_after(db, user_id, session_id, cursor, limit + 1, pending), cursor, limit)
@@ -0,0 +1,206 @@
+"""Write-behind persistence for ConversationHistory rows.
+
+With HISTORY_WRITE_BEHIND enabled, chat handlers hand their rows to the
+HistoryWriter and respond without waiting for a commit. The writer inserts
+everything queued in one transaction once HISTORY_FLUSH_ROWS rows are waiting
+or HISTORY_FLUSH_INTERVAL seconds have passed, so concurrent chats share one
+commit (and one fsync) instead of paying for one each.
+
+Durability trade-off: a reply is acknowledged before its rows are on disk.
+If the process dies without a clean shutdown (SIGKILL, OOM, power loss), up to
+HISTORY_FLUSH_INTERVAL seconds of acknowledged turns are lost. A clean shutdown
+flushes everything. Uncommitted rows are only visible to history reads served
+by the same process (pending_for), so with several workers read-your-writes
+holds per worker.
+
+Failures: when a batch fails to commit, its rows are retried one per transaction
+so a single bad row cannot hold back the others. A row that has failed
+HISTORY_MAX_ATTEMPTS times is dropped and logged in full (the dead letter), and
+the flush loop backs off (up to HISTORY_RETRY_MAX_DELAY seconds) while flushes
+keep failing. At HISTORY_MAX_PENDING queued rows a submitter first pays for a
+flush; if the queue is still full, submit raises HistoryBacklogFull instead of
+growing the queue.
+"""
+
+import asyncio
+import os
+import sys
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import make_transient
+
+from chatapp.db.db import AsyncSessionLocal
+from chatapp.db.models import ConversationHistory
+from chatapp.exception import ChatBotException
+from chatapp.logger import logging
+from utils.metrics import stage
+
+load_dotenv()
+
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+HISTORY_FLUSH_ROWS = int(os.getenv("HISTORY_FLUSH_ROWS", "64"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.05"))
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "10000"))
+HISTORY_MAX_ATTEMPTS = int(os.getenv("HISTORY_MAX_ATTEMPTS", "8"))
+HISTORY_RETRY_MAX_DELAY = float(os.getenv("HISTORY_RETRY_MAX_DELAY", "5"))
+
+
+class HistoryBacklogFull(Exception):
+    """The writer already holds max_pending rows and a flush could not make room."""
+
+
+class HistoryWriter:
+    def __init__(self, session_factory=AsyncSessionLocal, flush_rows: int = HISTORY_FLUSH_ROWS,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL, max_pending: int = HISTORY_MAX_PENDING,
+                 max_attempts: int = HISTORY_MAX_ATTEMPTS, retry_max_delay: float = HISTORY_RETRY_MAX_DELAY):
+        self.session_factory = session_factory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_max_delay = retry_max_delay
+        self.stats = {"rows": 0, "batches": 0, "failures": 0, "dropped": 0}
+        self._pending: List[ConversationHistory] = []
+        # Failed commits per pending row, keyed by id(row); entries go when the row leaves the queue.
+        self._attempts: Dict[int, int] = {}
+        self._failed_flushes = 0
+        self._wake = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def pending_for(self, user_id: int, session_id: str) -> List[ConversationHistory]:
+        return [row for row in self._pending if row.user_id == user_id and row.session_id == session_id]
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, rows: List[ConversationHistory]):
+        if len(self._pending) >= self.max_pending:
+            # Backpressure: the database is not keeping up, so this caller pays for a flush.
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                raise HistoryBacklogFull(f"{len(self._pending)} history rows are waiting to be written")
+        self._pending.extend(rows)
+        if len(self._pending) >= self.flush_rows:
+            self._wake.set()
+
+    def retry_delay(self) -> float:
+        return min(self.flush_interval * 2 ** min(self._failed_flushes, 16), self.retry_max_delay)
+
+    async def _run(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if self._failed_flushes:
+                # Back off while the database keeps failing; stop() cuts the wait short.
+                try:
+                    await asyncio.wait_for(self._closing.wait(), timeout=self.retry_delay())
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _commit(self, rows: List[ConversationHistory]):
+        try:
+            async with self.session_factory() as db:
+                db.add_all(rows)
+                await db.commit()
+        except Exception:
+            for row in rows:
+                # Detach the rolled-back rows so the next attempt inserts them afresh.
+                make_transient(row)
+                row.id = None
+            raise
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            batch = list(self._pending)
+            if not batch:
+                return 0
+            try:
+                with stage("history_flush"):
+                    await self._commit(batch)
+                written, failed = batch, []
+            except Exception as e:
+                self.stats["failures"] += 1
+                logging.error(ChatBotException(e, sys))
+                written, failed = await self._isolate(batch)
+
+            # Rows submitted during the commit were appended after the batch.
+            del self._pending[:len(batch)]
+            kept = [row for row in failed if not self._give_up(row)]
+            self._pending[:0] = kept
+            for row in written:
+                self._attempts.pop(id(row), None)
+            self._failed_flushes = self._failed_flushes + 1 if failed and not written else 0
+            self.stats["rows"] += len(written)
+            self.stats["batches"] += 1 if written else 0
+            return len(written)
+
+    async def _isolate(self, batch: List[ConversationHistory]):
+        # One transaction per row, so the rows that can be written are.
+        written, failed = [], []
+        with stage("history_flush_isolate"):
+            for row in batch:
+                try:
+                    await self._commit([row])
+                    written.append(row)
+                except Exception:
+                    failed.append(row)
+        return written, failed
+
+    def _give_up(self, row: ConversationHistory) -> bool:
+        attempts = self._attempts.get(id(row), 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[id(row)] = attempts
+            return False
+        self._attempts.pop(id(row), None)
+        self.stats["dropped"] += 1
+        logging.error("HistoryWriter: dropping row after %s failed attempts: user=%s session=%s sender=%s "
+                      "timestamp=%s message=%r", attempts, row.user_id, row.session_id, row.sender,
+                      row.timestamp, row.message)
+        return True
+
+    async def stop(self):
+        # The loop is woken rather than cancelled so a commit in progress is never interrupted.
+        if self._task is not None:
+            self._closing.set()
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logging.error("HistoryWriter: %s rows could not be written at shutdown", len(self._pending))
+        logging.info("HistoryWriter: stopped after %s rows in %s batches", self.stats["rows"], self.stats["batches"])
+
+
+_writer: Optional[HistoryWriter] = None
+
+
+async def start_history_writer() -> Optional[HistoryWriter]:
+    global _writer
+    if HISTORY_WRITE_BEHIND and _writer is None:
+        _writer = HistoryWriter()
+        await _writer.start()
+    return _writer
+
+
+async def stop_history_writer():
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def get_history_writer() -> Optional[HistoryWriter]:
+    # None unless write-behind is enabled and the app's lifespan started it.
+    return _writer
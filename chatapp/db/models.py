@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from datetime import datetime
 from chatapp.db.db import Base
 
@@ -18,3 +18,7 @@ class ConversationHistory(Base):
     sender = Column(String)  # 'user' or 'bot'
     message = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_conversation_history_user_session_ts", "user_id", "session_id", "timestamp"),
+    )
@@ -1,21 +1,8 @@
-
 import logging
-import os
-from datetime import datetime
+from utils.log_setup import payload_logger, setup_logging
 
 
 if __name__ != "__main__":
-    LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-    logs_path = os.path.join(os.getcwd(), "logs", LOG_FILE)
-    os.makedirs(logs_path, exist_ok=True)
-
-    LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
-
-    logging.basicConfig(
-        filename=LOG_FILE_PATH,
-        format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-        level=logging.INFO,
-    )
-
-
+    setup_logging("chatapp")
 
+payload_log = payload_logger("chatapp")
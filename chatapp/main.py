@@ -1,19 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from datetime import datetime,timezone
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import os
-import requests
+import json
+import asyncio
+import httpx
 from dotenv import load_dotenv
 import sys
 
-from chatapp.core.auth import authenticate_user, create_access_token, get_user
-from chatapp.db.db import SessionLocal
+from chatapp.core.auth import Principal, authenticate_user_async, create_access_token, get_current_user
+from chatapp.db.db import AsyncSessionLocal, async_engine
 from chatapp.db.models import User, ConversationHistory
+from chatapp.db.history import encode_cursor, decode_cursor, afetch_page, serialize, MAX_PAGE_SIZE
+from chatapp.db.history_writer import (HistoryBacklogFull, HistoryWriter, get_history_writer, start_history_writer,
+                                       stop_history_writer)
+from chatapp.core.upstream import CHAT_COMPLETIONS_URL, get_http_client, close_http_client
+from chatapp.core.semantic_cache import SemanticCache, get_semantic_cache
 from utils.rag_retriever import SupportDocEmbedder
-from chatapp.logger import logging
+from utils.retriever_registry import get_registry
+from utils.context_assembly import CONTEXT_FETCH_K, AssembledContext, assemble_context, count_message_tokens
+from utils.metrics import PROMPT_TOKENS, ServerTimingMiddleware, render_metrics, stage, upstream_call
+from utils.tracing import TracingMiddleware, client_span, configure_tracing, inject_headers, record_response
+from chatapp.logger import logging, payload_log
 from chatapp.exception import ChatBotException
 
 
@@ -21,8 +35,36 @@ from chatapp.exception import ChatBotException
 
 load_dotenv()
 
-app = FastAPI()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "chroma_store")
+SUPPORT_COLLECTION = "support_collection"
+FALLBACK_RESPONSE = "Apologies, I couldn't generate a response right now."
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry = get_registry()
+    try:
+        registry.warm(CHROMA_DB_PATH, SUPPORT_COLLECTION)
+        logging.info("Retriever registry warmed for collection: %s", SUPPORT_COLLECTION)
+    except Exception as e:
+        logging.error(ChatBotException(e, sys))
+    app.state.retrievers = registry
+    app.state.http_client = get_http_client()
+    if await start_history_writer() is not None:
+        logging.info("History write-behind enabled")
+    yield
+    await close_http_client()
+    # Flushes the rows still queued before the connections go away.
+    await stop_history_writer()
+    await async_engine.dispose()
+    registry.clear()
+
+
+configure_tracing("chatapp")
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
+# Added last so it is outermost and the server span covers the whole request.
+app.add_middleware(TracingMiddleware)
 
 # ---------- SCHEMAS ----------
 
@@ -36,32 +78,160 @@ class UserOut(BaseModel):
 class Message(BaseModel):
     session_id: str
     message: str
+    since: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     history: List[dict]
+    cursor: Optional[str] = None
+    cached: bool = False
+    usage: Optional[dict] = None
+    has_more: bool = False
+
+class HistoryPage(BaseModel):
+    items: List[dict]
+    next_cursor: Optional[str] = None
+    has_more: bool
 
 # ---------- UTILS ----------
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_retriever() -> SupportDocEmbedder:
+    with stage("retriever"):
+        return get_registry().get(CHROMA_DB_PATH, SUPPORT_COLLECTION)
+
+def build_llm_request(context_str: str, message: str, stream: bool = False):
+    headers = {
+        "Content-Type": "application/json",
+        "x-api-key": os.getenv("ULTRASAFE_API_KEY", "")
+    }
+    payload = {
+        "model": "usf1-mini",
+        "messages": [
+            {"role": "system", "content": f"Answer based only on the context below.\n\nContext:\n{context_str}"},
+            {"role": "user", "content": message}
+        ],
+        "temperature": 0.7,
+        "web_search": False,
+        "stream": stream,
+        "max_tokens": 1000
+    }
+    return headers, payload
+
+def parse_stream_delta(data: str) -> str:
+    choices = json.loads(data).get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+async def lookup_answer(support_agent, semantic_cache: Optional[SemanticCache], message: str,
+                        http_client: httpx.AsyncClient):
+    # Returns (query embedding, index version, cached answer or None). Without a semantic
+    # cache nothing is embedded here; vector retrieval embeds the query itself.
+    if semantic_cache is None:
+        return None, None, None
+    try:
+        query_embedding = await support_agent.aget_embedding(message, http_client)
+        index_version = await run_in_threadpool(support_agent.index_version)
+    except Exception as e:
+        logging.error(ChatBotException(e, sys))
+        return None, None, None
+
+    with stage("semantic_cache"):
+        cached = semantic_cache.lookup(query_embedding, index_version)
+    if cached is not None:
+        logging.info("Semantic cache hit (similarity %.3f, chunks %s)", cached.similarity, list(cached.chunk_ids))
+    return query_embedding, index_version, cached
+
+async def search_context(support_agent, semantic_cache: Optional[SemanticCache], message: str,
+                         http_client: httpx.AsyncClient, top_k: int = CONTEXT_FETCH_K):
+    """Returns (cached answer, context, query embedding, index version); exactly one of the first two is set.
+
+    BM25 runs first. When it answers the query on its own nothing is embedded, so the semantic
+    cache is skipped too. Otherwise the query embedding is looked up in the semantic cache and,
+    on a miss, reused for the vector search. Retrieval over-fetches top_k chunks and keeps the
+    best ones that fit CONTEXT_TOKEN_BUDGET.
+    """
+    query_embedding = index_version = None
+    try:
+        hits, result = await support_agent.alexical_pass(message, top_k)
+        if result is None:
+            query_embedding, index_version, cached = await lookup_answer(
+                support_agent, semantic_cache, message, http_client
+            )
+            if cached is not None:
+                return cached, None, query_embedding, index_version
+            result = await support_agent.avector_pass(message, hits, http_client, top_k, query_embedding)
+        chunk_ids, chunks = result
+    except Exception as e:
+        logging.error(ChatBotException(e, sys))
+        chunk_ids, chunks = [], []
+    return None, assemble(chunk_ids, chunks), query_embedding, index_version
+
+def assemble(chunk_ids: List[str], chunks: List[str]) -> AssembledContext:
+    with stage("context_assembly"):
+        context = assemble_context(chunk_ids, chunks)
+    logging.info("Context: %s of %s chunks, %s of %s tokens (budget %s), %s duplicates, truncated=%s",
+                 len(context.chunks), context.candidates, context.tokens, context.candidate_tokens, context.budget,
+                 context.duplicates, context.truncated)
+    return context
+
+def prompt_usage(context: AssembledContext, payload: dict) -> dict:
+    usage = {**context.usage(), "prompt_tokens": count_message_tokens(payload["messages"])}
+    PROMPT_TOKENS.labels("context").observe(usage["context_tokens"])
+    PROMPT_TOKENS.labels("prompt").observe(usage["prompt_tokens"])
+    logging.info("Prompt tokens: %s (context %s)", usage["prompt_tokens"], usage["context_tokens"])
+    return usage
+
+async def save_messages(messages: List[ConversationHistory], writer: Optional[HistoryWriter] = None) -> str:
+    if writer is not None:
+        await writer.submit(messages)
+        return encode_cursor(messages[-1])
+    # Uses its own session: streaming responses outlive the request-scoped one.
+    async with AsyncSessionLocal() as db:
+        with stage("history_insert"):
+            db.add_all(messages)
+            await db.commit()
+        return encode_cursor(messages[-1])
+
+async def save_turn(db: AsyncSession, user_id: int, session_id: str, messages: List[ConversationHistory],
+                    since: Optional[str] = None, writer: Optional[HistoryWriter] = None):
+    # Returns only what the client has not seen: the new turn, or up to MAX_PAGE_SIZE rows after `since`.
+    pending = None
+    if writer is not None:
+        await writer.submit(messages)
+        pending = writer.pending_for(user_id, session_id)
+    else:
+        with stage("history_insert"):
+            db.add_all(messages)
+            await db.commit()
+
+    if since:
+        with stage("history_query"):
+            # The cursor is that of the last row returned, so a capped reply resumes where it stopped.
+            return await afetch_page(db, user_id, session_id, since, MAX_PAGE_SIZE, pending)
+    return {"items": [serialize(h) for h in messages], "next_cursor": encode_cursor(messages[-1]), "has_more": False}
+
+# ---------- METRICS ENDPOINT ----------
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 # ---------- AUTH ENDPOINTS ----------
 
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     try:
-        logging.info(f"Login attempt for user: {form_data.username}")
-        user = authenticate_user(db, form_data.username, form_data.password)
+        logging.info("Login attempt for user: %s", form_data.username)
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
         if not user:
-            logging.warning(f"Login failed for user: {form_data.username}")
+            logging.warning("Login failed for user: %s", form_data.username)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
         access_token = create_access_token(data={"sub": user.username})
-        logging.info(f"Access token generated for user: {user.username}")
+        logging.info("Access token generated for user: %s", user.username)
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException as e:
         raise e
@@ -70,46 +240,49 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         raise HTTPException(status_code=500, detail="Login failed due to server error")
 
 @app.get("/users/me", response_model=UserOut)
-async def read_users_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    from jose import JWTError, jwt
-    from chatapp.core.auth import SECRET_KEY, ALGORITHM
+async def read_users_me(user: Principal = Depends(get_current_user)):
+    return user
+
+# ---------- HISTORY ENDPOINT ----------
+
+@app.get("/history/{session_id}", response_model=HistoryPage)
+async def read_history(
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    writer: Optional[HistoryWriter] = Depends(get_history_writer)
+):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = get_user(db, username=username)
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-    except JWTError as e:
-        logging.error(ChatBotException(e, sys))
-        raise HTTPException(status_code=401, detail="Invalid token")
+        pending = writer.pending_for(user.id, session_id) if writer is not None else None
+        return await afetch_page(db, user.id, session_id, cursor, limit, pending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(ChatBotException(e, sys))
-        raise HTTPException(status_code=500, detail="Something went wrong")
+        raise HTTPException(status_code=500, detail="Could not load history")
 
 # ---------- CHAT ENDPOINT ----------
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     msg: Message,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    support_agent: SupportDocEmbedder = Depends(get_retriever),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+    writer: Optional[HistoryWriter] = Depends(get_history_writer)
 ):
-    from jose import JWTError, jwt
-    from chatapp.core.auth import SECRET_KEY, ALGORITHM
-
+    if msg.since:
+        # Checked up front: once the turn is stored, a bad cursor could only fail the whole request.
+        try:
+            decode_cursor(msg.since)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = get_user(db, username=username)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        logging.info(f"User: {username} | Session: {msg.session_id} | Message: {msg.message}")
+        logging.info("User: %s | Session: %s | Message: %s", user.username, msg.session_id, msg.message)
 
         # Store user message
         user_msg = ConversationHistory(
@@ -119,39 +292,36 @@ async def chat(
             message=msg.message,
             timestamp = datetime.now(timezone.utc)
         )
-        db.add(user_msg)
 
-        # Retrieve RAG context
-        support_agent = SupportDocEmbedder(collection_name="support_collection")
-        context_chunks = support_agent.retrieve_context(msg.message)
-        context_str = "\n".join(context_chunks)
-        logging.info(f"Context retrieved for query: {context_chunks}")
+        # Retrieve RAG context, deduplicated and packed into the token budget, unless a
+        # near-duplicate question can be answered from the semantic cache
+        cached, context, query_embedding, index_version = await search_context(
+            support_agent, semantic_cache, msg.message, http_client
+        )
+
+        usage = None
+        if cached is not None:
+            response = cached.answer
+        else:
+            payload_log.info("Context retrieved for query: %s", context.chunks)
 
-        # LLM Call
-        try:
-            api_url = "https://api.us.inc/usf/v1/hiring/chat/completions"
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": os.getenv("ULTRASAFE_API_KEY")
-            }
-            payload = {
-                "model": "usf1-mini",
-                "messages": [
-                    {"role": "system", "content": f"Answer based only on the context below.\n\nContext:\n{context_str}"},
-                    {"role": "user", "content": msg.message}
-                ],
-                "temperature": 0.7,
-                "web_search": False,
-                "stream": False,
-                "max_tokens": 1000
-            }
-            api_response = requests.post(api_url, headers=headers, json=payload)
-            response_data = api_response.json()
-            response = response_data["choices"][0]["message"]["content"]
-            logging.info("LLM response received successfully.")
-        except Exception as e:
-            logging.error(ChatBotException(e, sys))
-            response = "Apologies, I couldn't generate a response right now."
+            # LLM Call
+            try:
+                headers, payload = build_llm_request(context.text, msg.message)
+                usage = prompt_usage(context, payload)
+                with upstream_call("chat_completions"), \
+                        client_span("chat_completions", CHAT_COMPLETIONS_URL, payload) as span:
+                    api_response = await http_client.post(CHAT_COMPLETIONS_URL, headers=inject_headers(headers),
+                                                          json=payload)
+                    record_response(span, api_response)
+                response_data = api_response.json()
+                response = response_data["choices"][0]["message"]["content"]
+                logging.info("LLM response received successfully.")
+                if semantic_cache is not None and query_embedding is not None:
+                    semantic_cache.add(query_embedding, context.chunk_ids, response, index_version)
+            except Exception as e:
+                logging.error(ChatBotException(e, sys))
+                response = FALLBACK_RESPONSE
 
         # Store bot response
         bot_msg = ConversationHistory(
@@ -161,21 +331,117 @@ async def chat(
             message=response,
             timestamp = datetime.now(timezone.utc)
         )
-        db.add(bot_msg)
-        db.commit()
 
-        # Return chat history
-        history = db.query(ConversationHistory).filter_by(
-            user_id=user.id, session_id=msg.session_id
-        ).order_by(ConversationHistory.timestamp).all()
+        # Store both messages and return the new part of the chat history
+        page = await save_turn(db, user.id, msg.session_id, [user_msg, bot_msg], msg.since, writer)
+
+        return ChatResponse(response=response, history=page["items"], cursor=page["next_cursor"],
+                            has_more=page["has_more"], cached=cached is not None, usage=usage)
+
+    except HistoryBacklogFull as e:
+        logging.error(ChatBotException(e, sys))
+        raise HTTPException(status_code=503, detail="Chat history is not being saved; try again shortly")
+    except Exception as e:
+        logging.error(ChatBotException(e, sys))
+        raise HTTPException(status_code=500, detail="Chat processing failed")
 
-        chat_history = [
-            {"sender": h.sender, "message": h.message, "timestamp": h.timestamp.isoformat()}
-            for h in history
-        ]
 
-        return ChatResponse(response=response, history=chat_history)
+@app.post("/chat/stream")
+async def chat_stream(
+    msg: Message,
+    user: Principal = Depends(get_current_user),
+    support_agent: SupportDocEmbedder = Depends(get_retriever),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+    writer: Optional[HistoryWriter] = Depends(get_history_writer)
+):
+    # No request-scoped session: the turn is saved by save_messages after the stream ends.
+    try:
+        logging.info("Stream | User: %s | Session: %s | Message: %s", user.username, msg.session_id, msg.message)
+
+        user_msg = ConversationHistory(
+            user_id=user.id,
+            session_id=msg.session_id,
+            sender="user",
+            message=msg.message,
+            timestamp = datetime.now(timezone.utc)
+        )
+
+        cached, context, query_embedding, index_version = await search_context(
+            support_agent, semantic_cache, msg.message, http_client
+        )
+        usage = None
+        if cached is None:
+            headers, payload = build_llm_request(context.text, msg.message, stream=True)
+            usage = prompt_usage(context, payload)
 
     except Exception as e:
         logging.error(ChatBotException(e, sys))
         raise HTTPException(status_code=500, detail="Chat processing failed")
+
+    async def event_stream():
+        parts = []
+        try:
+            if cached is not None:
+                parts.append(cached.answer)
+                yield f"data: {json.dumps({'token': cached.answer})}\n\n"
+            else:
+                with upstream_call("chat_completions_stream"), \
+                        client_span("chat_completions_stream", CHAT_COMPLETIONS_URL, payload) as span:
+                    async with http_client.stream("POST", CHAT_COMPLETIONS_URL, headers=inject_headers(headers),
+                                                  json=payload) as upstream:
+                        record_response(span, upstream)
+                        upstream.raise_for_status()
+                        async for line in upstream.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            delta = parse_stream_delta(data)
+                            if delta:
+                                parts.append(delta)
+                                yield f"data: {json.dumps({'token': delta})}\n\n"
+                # Only answers that streamed to completion are worth reusing.
+                if semantic_cache is not None and query_embedding is not None and parts:
+                    semantic_cache.add(query_embedding, context.chunk_ids, "".join(parts), index_version)
+        except asyncio.CancelledError:
+            # Starlette cancels the generator when the client goes away; leaving the
+            # `async with` block above closes the upstream connection.
+            # Nothing is stored for an aborted turn, as for a failed /chat request.
+            logging.info("Stream | Client disconnected from session %s; upstream call cancelled.", msg.session_id)
+            raise
+        except Exception as e:
+            logging.error(ChatBotException(e, sys))
+            if parts:
+                # The reply broke off part-way: report it and, as for a disconnect, store nothing.
+                error = {'detail': 'The reply was interrupted', 'response': "".join(parts)}
+                yield f"event: error\ndata: {json.dumps(error)}\n\n"
+                return
+            parts.append(FALLBACK_RESPONSE)
+            yield f"data: {json.dumps({'token': FALLBACK_RESPONSE})}\n\n"
+
+        response = "".join(parts)
+        bot_msg = ConversationHistory(
+            user_id=user.id,
+            session_id=msg.session_id,
+            sender="bot",
+            message=response,
+            timestamp = datetime.now(timezone.utc)
+        )
+        # The question is stored with its answer, so history never holds a turn without a reply.
+        try:
+            cursor = await save_messages([user_msg, bot_msg], writer)
+        except HistoryBacklogFull as e:
+            # The answer has already been streamed; a null cursor tells the client it was not stored.
+            logging.error(ChatBotException(e, sys))
+            cursor = None
+        logging.info("Stream | LLM response streamed and stored successfully.")
+        done = {'response': response, 'cursor': cursor, 'cached': cached is not None, 'usage': usage}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
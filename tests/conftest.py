@@ -0,0 +1,54 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def dispose_async_engine():
+    yield
+    # TestClient is used without its lifespan, so the pooled aiosqlite connections
+    # (each on a non-daemon thread) would otherwise keep the process alive.
+    from chatapp.db.db import async_engine
+
+    asyncio.run(async_engine.dispose())
+
+
+def fake_embedding(text):
+    # Sign pattern of the digest: unrelated texts land far apart.
+    digest = hashlib.sha256(text.encode()).digest()
+    return [1.0 if byte & 1 else -1.0 for byte in digest]
+
+
+class FakeRetriever:
+    def __init__(self, aliases=None, index_version=0):
+        self.aliases = aliases or {}
+        self.version = index_version
+
+    async def aget_embedding(self, text, http_client):
+        return fake_embedding(self.aliases.get(text, text))
+
+    def index_version(self):
+        return self.version
+
+    async def alexical_pass(self, query, top_k=2, mode=None):
+        return [], None
+
+    async def avector_pass(self, query, hits, http_client, top_k=2, query_embedding=None):
+        return ["manual_pdf_0"], ["Products can be returned within 30 days."]
+
+
+@pytest.fixture
+def fake_retriever():
+    """Stands in for SupportDocEmbedder: one fixed chunk, digest-based embeddings (set `aliases` for paraphrases)."""
+    return FakeRetriever()
+
+
+@pytest.fixture
+def fake_upstream():
+    """MockTransport handler answering every chat completion with the same reply."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Within 30 days."}}]})
+
+    return handler
@@ -0,0 +1,93 @@
+import threading
+import time
+from unittest.mock import patch
+
+from agentapp.processing.concurrency import bounded_map
+from agentapp.processing.graph_nodes import GraphPipeline, SUMMARY_FAILED
+
+
+def test_bounded_map_keeps_order_and_isolates_failures():
+    def work(n):
+        time.sleep(0.01 * (5 - n))
+        if n == 2:
+            raise ValueError("boom")
+        return n * 10
+
+    results = bounded_map(work, range(5), max_workers=5, on_error=lambda item, e: f"failed {item}")
+    assert results == [0, 10, "failed 2", 30, 40]
+
+
+def test_bounded_map_respects_cap():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work(n):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return n
+
+    assert bounded_map(work, range(10), max_workers=3) == list(range(10))
+    assert peak <= 3
+
+
+@patch("agentapp.processing.graph_nodes.ResearchAgent")
+def test_summarize_and_critic_nodes_fan_out(_research_agent):
+    pipeline = GraphPipeline(max_concurrency=4)
+
+    def summarize(text):
+        time.sleep(0.2)
+        if text == "bad":
+            raise RuntimeError("upstream error")
+        return f"summary of {text}"
+
+    def evaluate(summary):
+        time.sleep(0.2)
+        return {"summary": summary, "label": "High"}
+
+    state = {"documents": [{"content": c} for c in ["a", "b", "bad", "d"]]}
+    with patch.object(pipeline.summarization_agent, "summarize_document", side_effect=summarize), \
+            patch.object(pipeline.critic_agent, "evaluate_summary", side_effect=evaluate) as evaluate_mock:
+        start = time.perf_counter()
+        state = pipeline.summarize_node(state)
+        state = pipeline.critic_node(state)
+        elapsed = time.perf_counter() - start
+
+    assert state["summaries"] == ["summary of a", "summary of b", SUMMARY_FAILED, "summary of d"]
+    assert [v["summary"] for v in state["vetted"]] == state["summaries"]
+    assert state["vetted"][2]["label"] == "Unknown"
+    assert SUMMARY_FAILED not in [call.args[0] for call in evaluate_mock.call_args_list]
+    assert elapsed < 0.8
+
+
+@patch("agentapp.processing.graph_nodes.ResearchAgent")
+def test_runner_compiles_once_and_runs_batches(_research_agent):
+    from agentapp.main import LangGraphRunner
+
+    runner = LangGraphRunner()
+    pipeline = runner.builder.pipeline
+
+    def research(state):
+        if state["query"] == "broken":
+            raise RuntimeError("research failed")
+        state["documents"] = [{"content": state["query"]}]
+        return state
+
+    pipeline.research_node = research
+    pipeline.summarization_agent.summarize_document = lambda text: f"summary of {text}"
+    pipeline.critic_agent.evaluate_summary = lambda summary: {"summary": summary, "label": "High"}
+
+    with patch.object(runner.builder, "build", wraps=runner.builder.build) as build:
+        single = runner.run("topic a")
+        batch = runner.run_many(["topic b", "broken", "topic c"], max_concurrency=2)
+
+    assert build.call_count == 1
+    assert "summary of topic a" in single["report"]
+    assert "summary of topic b" in batch[0]["report"]
+    assert batch[1]["error"] == "research failed"
+    assert "summary of topic c" in batch[2]["report"]
@@ -1,5 +1,21 @@
 
-from chatapp.main import app
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from unittest.mock import patch
+from chatapp.main import Message, app, chat_stream, get_retriever
+from chatapp.core.auth import Principal
+from chatapp.core.semantic_cache import SemanticCache, get_semantic_cache
+from chatapp.db.db import SessionLocal
+from chatapp.db.history_writer import HistoryWriter, get_history_writer
+from chatapp.db.models import ConversationHistory, User
+from chatapp.db.history import MAX_PAGE_SIZE, encode_cursor
+from chatapp.core.upstream import get_http_client
+from utils.embedding_providers import HashingEmbeddingProvider
+from utils.rag_retriever import SupportDocEmbedder
 from fastapi.testclient import TestClient
 
 def test_health_check():
@@ -16,4 +32,339 @@ def test_chat_response():
 
     client = TestClient(app)
     response = client.post("/chat", json=payload, headers={"Authorization": token})
-    assert response.status_code in [401, 500]
\ No newline at end of file
+    assert response.status_code in [401, 500]
+
+@pytest.fixture(autouse=True)
+def empty_semantic_cache():
+    get_semantic_cache().clear()
+
+
+def test_chat_with_valid_token_uses_async_upstream(fake_retriever, fake_upstream):
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post(
+            "/chat",
+            json={"session_id": "async-session", "message": "What is the return policy?"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"] == "Within 30 days."
+    assert [h["sender"] for h in body["history"]] == ["user", "bot"]
+    assert body["cursor"]
+    assert body["usage"]["chunks"] == 1
+    assert 0 < body["usage"]["context_tokens"] < body["usage"]["prompt_tokens"]
+
+
+def fake_stream_upstream(request: httpx.Request) -> httpx.Response:
+    assert json.loads(request.content)["stream"] is True
+    events = [
+        'data: {"choices": [{"delta": {"content": "Within "}}]}',
+        'data: {"choices": [{"delta": {"content": "30 days."}}]}',
+        "data: [DONE]",
+    ]
+    return httpx.Response(200, content="\n\n".join(events).encode(), headers={"Content-Type": "text/event-stream"})
+
+
+def test_chat_stream_relays_tokens_and_stores_reply(fake_retriever):
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_stream_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post(
+            "/chat/stream",
+            json={"session_id": "stream-session", "message": "What is the return policy?"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'data: {"token": "Within "}' in response.text
+    done = response.text.split("event: done\ndata: ", 1)[1]
+    assert json.loads(done)["response"] == "Within 30 days."
+
+    db = SessionLocal()
+    try:
+        user_row, last = db.query(ConversationHistory).filter_by(session_id="stream-session").order_by(
+            ConversationHistory.id.desc()).limit(2).all()[::-1]
+        assert user_row.sender == "user"
+        assert last.sender == "bot"
+        assert last.message == "Within 30 days."
+    finally:
+        db.close()
+
+
+def test_abandoned_stream_stores_no_half_turn(fake_retriever):
+    session_id = f"abandoned-{uuid.uuid4().hex}"
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake_stream_upstream)) as http_client:
+            response = await chat_stream(
+                Message(session_id=session_id, message="What is the return policy?"),
+                user=Principal(id=1, username="Username"), support_agent=fake_retriever,
+                http_client=http_client, semantic_cache=None, writer=None,
+            )
+            first = await response.body_iterator.__anext__()
+            # What Starlette does when the client goes away mid-stream.
+            await response.body_iterator.aclose()
+            return first
+
+    assert asyncio.run(run()) == 'data: {"token": "Within "}\n\n'
+    db = SessionLocal()
+    try:
+        assert db.query(ConversationHistory).filter_by(session_id=session_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_stream_that_breaks_off_reports_an_error_and_stores_nothing(fake_retriever):
+    session_id = f"broken-{uuid.uuid4().hex}"
+
+    async def broken_body():
+        yield b'data: {"choices": [{"delta": {"content": "Within "}}]}\n\n'
+        raise httpx.ReadError("upstream went away")
+
+    def broken_upstream(request):
+        return httpx.Response(200, content=broken_body(), headers={"Content-Type": "text/event-stream"})
+
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(broken_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post("/chat/stream", json={"session_id": session_id, "message": "What is the return policy?"},
+                               headers={"Authorization": f"Bearer {token}"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert 'data: {"token": "Within "}' in response.text
+    assert "event: done" not in response.text
+    error = json.loads(response.text.split("event: error\ndata: ", 1)[1])
+    assert error["response"] == "Within "
+    db = SessionLocal()
+    try:
+        assert db.query(ConversationHistory).filter_by(session_id=session_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_history_is_cursor_paginated(fake_retriever, fake_upstream):
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        session_id = f"paged-{uuid.uuid4().hex}"
+
+        first = client.post("/chat", json={"session_id": session_id, "message": "one"}, headers=headers).json()
+        client.post("/chat", json={"session_id": session_id, "message": "two"}, headers=headers)
+        delta = client.post("/chat", json={"session_id": session_id, "message": "three", "since": first["cursor"]},
+                            headers=headers).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [h["message"] for h in delta["history"]] == ["two", "Within 30 days.", "three", "Within 30 days."]
+
+    page = client.get(f"/history/{session_id}", params={"limit": 4}, headers=headers).json()
+    assert len(page["items"]) == 4
+    assert page["has_more"] is True
+
+    rest = client.get(f"/history/{session_id}", params={"limit": 4, "cursor": page["next_cursor"]},
+                      headers=headers).json()
+    assert [h["message"] for h in rest["items"]] == ["three", "Within 30 days."]
+    assert rest["has_more"] is False
+
+    bad = client.get(f"/history/{session_id}", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert bad.status_code == 400
+
+
+def test_since_reply_is_capped_and_resumes_from_its_own_cursor(fake_retriever, fake_upstream):
+    session_id = f"backlog-{uuid.uuid4().hex}"
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db = SessionLocal()
+    try:
+        user_id = db.query(User).filter_by(username="Username").one().id
+        rows = [ConversationHistory(user_id=user_id, session_id=session_id, sender="user", message=f"m{i}",
+                                    timestamp=start + timedelta(seconds=i)) for i in range(MAX_PAGE_SIZE + 10)]
+        db.add_all(rows)
+        db.commit()
+        since = encode_cursor(rows[0])
+    finally:
+        db.close()
+
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        reply = client.post("/chat", json={"session_id": session_id, "message": "new", "since": since},
+                            headers=headers).json()
+        rest = client.get(f"/history/{session_id}", params={"cursor": reply["cursor"]}, headers=headers).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert len(reply["history"]) == MAX_PAGE_SIZE
+    assert reply["history"][-1]["message"] == f"m{MAX_PAGE_SIZE}"
+    assert reply["has_more"] is True
+    assert [h["message"] for h in rest["items"]][:2] == [f"m{MAX_PAGE_SIZE + 1}", f"m{MAX_PAGE_SIZE + 2}"]
+    assert [h["message"] for h in rest["items"]][-2:] == ["new", "Within 30 days."]
+
+
+def test_bad_since_is_rejected_before_anything_is_stored(fake_retriever, fake_upstream):
+    session_id = f"bad-since-{uuid.uuid4().hex}"
+    calls = []
+
+    def counting_upstream(request):
+        calls.append(request)
+        return fake_upstream(request)
+
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(counting_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post("/chat", json={"session_id": session_id, "message": "hi", "since": "not-a-cursor"},
+                               headers={"Authorization": f"Bearer {token}"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid history cursor"
+    assert calls == []
+    db = SessionLocal()
+    try:
+        assert db.query(ConversationHistory).filter_by(session_id=session_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_paraphrase_is_served_from_semantic_cache_until_reingest(fake_retriever, fake_upstream):
+    calls = []
+
+    def counting_upstream(request):
+        calls.append(request)
+        return fake_upstream(request)
+
+    retriever = fake_retriever
+    retriever.aliases = {"How do returns work?": "What is the return policy?"}
+    cache = SemanticCache(threshold=0.95)
+    app.dependency_overrides[get_retriever] = lambda: retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(counting_upstream))
+    app.dependency_overrides[get_semantic_cache] = lambda: cache
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def ask(message):
+            return client.post("/chat", json={"session_id": "semantic", "message": message}, headers=headers).json()
+
+        first = ask("What is the return policy?")
+        paraphrase = ask("How do returns work?")
+        unrelated = ask("Does the hub support Zigbee?")
+        retriever.version = 1
+        after_reingest = ask("How do returns work?")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first["cached"] is False
+    assert paraphrase["cached"] is True
+    assert paraphrase["response"] == first["response"]
+    assert paraphrase["history"][1]["message"] == "Within 30 days."
+    assert unrelated["cached"] is False
+    assert after_reingest["cached"] is False
+    assert len(calls) == 3
+    assert cache.stats["invalidations"] == 1
+
+
+def test_confident_lexical_query_skips_embedding_even_with_semantic_cache(tmp_path, fake_upstream):
+    provider = HashingEmbeddingProvider(dim=32)
+    store = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="lexical_chat",
+                               use_cache=False, provider=provider)
+    store.sync_document("manual.pdf", ["Order ORD-88231 ships Monday.", "Returns are accepted within 30 days.",
+                                       "Reset the hub by holding the button."])
+    cache = SemanticCache(threshold=0.95)
+    app.dependency_overrides[get_retriever] = lambda: store
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    app.dependency_overrides[get_semantic_cache] = lambda: cache
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        with patch.object(provider, "embed", wraps=provider.embed) as embed:
+            lexical = client.post("/chat", json={"session_id": "lexical", "message": "ORD-88231"},
+                                  headers=headers).json()
+            assert embed.call_count == 0
+            fused = client.post("/chat", json={"session_id": "lexical", "message": "how long do I have"},
+                                headers=headers).json()
+            # The one embedding serves both the semantic cache lookup and the vector search.
+            assert embed.call_count == 1
+    finally:
+        app.dependency_overrides.clear()
+
+    assert lexical["usage"]["chunks"] >= 1
+    assert fused["response"] == "Within 30 days."
+    assert cache.stats["misses"] == 1
+
+
+def test_chat_reports_stage_timings_and_metrics(fake_retriever, fake_upstream):
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post(
+            "/chat",
+            json={"session_id": f"timing-{uuid.uuid4().hex[:8]}", "message": "What is the return policy?"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        metrics = client.get("/metrics")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert {"auth", "chat_completions", "history_insert", "total"} <= set(stages)
+    assert metrics.status_code == 200
+    assert "server-timing" not in metrics.headers
+    assert 'pipeline_stage_seconds_count{stage="chat_completions"}' in metrics.text
+    assert 'http_request_seconds_count{method="POST",route="/chat",status="200"}' in metrics.text
+
+
+def test_write_behind_turns_are_visible_before_they_are_committed(fake_retriever, fake_upstream):
+    writer = HistoryWriter(flush_rows=1000, flush_interval=60)
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    app.dependency_overrides[get_history_writer] = lambda: writer
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        session_id = f"behind-{uuid.uuid4().hex}"
+
+        first = client.post("/chat", json={"session_id": session_id, "message": "one"}, headers=headers).json()
+        delta = client.post("/chat", json={"session_id": session_id, "message": "two", "since": first["cursor"]},
+                            headers=headers).json()
+        page = client.get(f"/history/{session_id}", headers=headers).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [h["message"] for h in delta["history"]] == ["two", "Within 30 days."]
+    assert [h["message"] for h in page["items"]] == ["one", "Within 30 days.", "two", "Within 30 days."]
+    assert writer.pending == 4
+    db = SessionLocal()
+    try:
+        assert db.query(ConversationHistory).filter_by(session_id=session_id).count() == 0
+    finally:
+        db.close()
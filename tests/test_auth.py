@@ -1,4 +1,7 @@
+import time
+from unittest.mock import patch
 from chatapp.main import app
+from chatapp.core.auth import Principal, PrincipalCache, principal_cache, load_principal
 from fastapi.testclient import TestClient
 
 client = TestClient(app)
@@ -33,3 +36,26 @@ def test_login_with_valid_credentials():
     })
     assert user_response.status_code == 200
     assert user_response.json()["username"] == "Username"
+
+
+def test_principal_cache_respects_token_expiry():
+    cache = PrincipalCache(ttl=60)
+    cache.put("expired-token", Principal(id=1, username="someone"), token_exp=time.time() - 1)
+    cache.put("live-token", Principal(id=1, username="someone"), token_exp=time.time() + 60)
+
+    assert cache.get("expired-token") is None
+    assert cache.get("live-token").username == "someone"
+
+    cache.invalidate_user("someone")
+    assert cache.get("live-token") is None
+
+
+def test_verified_token_is_served_from_cache():
+    token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+    principal_cache.clear()
+
+    with patch("chatapp.core.auth.load_principal", wraps=load_principal) as lookup:
+        for _ in range(3):
+            assert client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    assert lookup.call_count == 1
@@ -0,0 +1,39 @@
+import pytest
+from utils.chunking import count_tokens, iter_chunks, split_units
+
+
+TEXT = " ".join(f"Sentence number {i} explains one support policy in a few words." for i in range(200))
+
+
+def test_chunks_respect_token_budget():
+    chunks = list(iter_chunks(TEXT, max_tokens=64, overlap=0))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 64 for chunk in chunks)
+    assert " ".join(chunks) == TEXT
+
+
+def test_chunks_overlap_by_trailing_sentences():
+    chunks = list(iter_chunks(TEXT, max_tokens=64, overlap=16))
+    first_tail = chunks[0].split(". ")[-1]
+    assert chunks[1].startswith(first_tail)
+
+
+def test_oversized_unit_is_split_on_token_windows():
+    word_soup = "token " * 500
+    chunks = list(iter_chunks(word_soup, max_tokens=100, overlap=10))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_paragraph_boundaries():
+    text = "First paragraph line.\nStill first.\n\nSecond paragraph.\n\nThird."
+    assert list(split_units(text, "paragraph")) == [
+        "First paragraph line.\nStill first.\n\n", "Second paragraph.\n\n", "Third."
+    ]
+    with pytest.raises(ValueError):
+        list(split_units(text, "chapter"))
+
+
+def test_iter_chunks_is_lazy():
+    chunks = iter_chunks(TEXT, max_tokens=64, overlap=0)
+    assert next(chunks).startswith("Sentence number 0")
@@ -0,0 +1,60 @@
+from utils.chunking import count_tokens, iter_chunks
+from utils.context_assembly import assemble_context, count_message_tokens, overlap, trim_overlaps
+
+SENTENCES = [f"Sentence {i} explains how the smart hub handles device number {i} during pairing." for i in range(60)]
+TEXT = " ".join(SENTENCES)
+
+
+def test_overlap_finds_shared_text_between_neighbouring_chunks():
+    chunks = list(iter_chunks(TEXT, max_tokens=120, overlap=40))
+    shared = overlap(chunks[0], chunks[1])
+
+    assert shared > 0
+    assert chunks[1].startswith(chunks[0][-shared:])
+    assert not trim_overlaps(chunks[1], [chunks[0]]).startswith(chunks[0][-shared:])
+    assert overlap("short", "short text") == 0
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    page = " ".join(SENTENCES[:10])
+    near = page.replace("pairing", "setup", 1)
+
+    context = assemble_context(["a", "b", "c", "d"], [page, page, near, "Returns are accepted within 30 days."],
+                               budget=10_000)
+
+    assert context.chunk_ids == ["a", "d"]
+    assert context.duplicates == 2
+
+
+def test_overlapping_chunks_are_stitched_without_repeating_text():
+    chunks = list(iter_chunks(TEXT, max_tokens=120, overlap=40))[:3]
+
+    context = assemble_context(["c0", "c1", "c2"], chunks, budget=10_000)
+
+    assert context.chunk_ids == ["c0", "c1", "c2"]
+    assert context.tokens < sum(count_tokens(chunk) for chunk in chunks)
+    assert all(context.text.count(sentence) == 1 for sentence in SENTENCES if sentence in context.text)
+
+
+def test_chunks_are_packed_into_the_budget_in_rank_order():
+    big = " ".join(SENTENCES[:40])
+    small = "Returns are accepted within 30 days of delivery."
+    other = "The hub supports Zigbee and Z-Wave devices."
+
+    skipped = assemble_context(["big", "small", "other"], [big, small, other], budget=100, min_tail_tokens=200)
+    cut = assemble_context(["small", "big", "other"], [small, big, other], budget=100, min_tail_tokens=20)
+
+    assert skipped.chunk_ids == ["small", "other"]
+    assert skipped.skipped == ["big"]
+    assert not skipped.truncated
+    assert cut.chunk_ids == ["small", "big"]
+    assert cut.truncated
+    assert cut.skipped == ["other"]
+    assert cut.tokens <= 100
+    assert cut.usage()["candidate_tokens"] == sum(count_tokens(chunk) for chunk in (small, big, other))
+
+
+def test_message_tokens_include_per_message_overhead():
+    messages = [{"role": "system", "content": "Answer briefly."}, {"role": "user", "content": "Hello there"}]
+
+    assert count_message_tokens(messages) == count_tokens("Answer briefly.") + count_tokens("Hello there") + 11
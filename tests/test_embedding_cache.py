@@ -0,0 +1,34 @@
+from array import array
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.set_many("usf1-embed", [("hello", [0.1, 0.2, 0.3])])
+    cache.store.close()
+
+    reopened = EmbeddingCache(path)
+    found = reopened.get_many("usf1-embed", ["hello", "missing"])
+
+    assert list(found) == ["hello"]
+    assert found["hello"] == array("f", [0.1, 0.2, 0.3]).tolist()
+    assert reopened.stats["disk_hits"] == 1
+    assert reopened.stats["misses"] == 1
+
+
+def test_key_depends_on_model():
+    cache = EmbeddingCache()
+    cache.set_many("model-a", [("text", [1.0])])
+    assert cache.get_many("model-b", ["text"]) == {}
+    assert cache.get_many("model-a", ["text"]) == {"text": [1.0]}
+
+
+def test_size_limits_evict_oldest(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_memory_items=2, max_disk_items=3)
+    cache.set_many("m", [(f"text {i}", [float(i)]) for i in range(5)])
+
+    assert len(cache.store._memory) == 2
+    (count,) = cache.store._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+    assert count == 3
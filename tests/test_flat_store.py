@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils.embedding_providers import HashingEmbeddingProvider
+from utils.flat_store import FlatCollection, FlatVectorStore, default_flat_path
+from utils.lexical_index import default_index_path
+from utils.rag_retriever import SupportDocEmbedder, open_vector_client
+
+
+def test_query_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    queries = rng.normal(size=(4, 16)).astype(np.float32)
+
+    collection = FlatVectorStore(str(tmp_path)).get_or_create_collection("docs")
+    collection.upsert(ids=[f"id_{i}" for i in range(300)], embeddings=vectors,
+                      documents=[f"doc {i}" for i in range(300)])
+    result = collection.query(query_embeddings=queries, n_results=5)
+
+    for query, ids, distances in zip(queries, result["ids"], result["distances"]):
+        expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+        assert ids == [f"id_{i}" for i in expected]
+        assert distances == pytest.approx(sorted(distances), rel=1e-5)
+
+
+def test_upsert_delete_and_reopen(tmp_path):
+    store = FlatVectorStore(str(tmp_path))
+    collection = store.get_or_create_collection("docs")
+    collection.upsert(ids=["a", "b", "c"], embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+                      documents=["A", "B", "C"], metadatas=[{"source": "x"}, {"source": "y"}, {"source": "x"}])
+    collection.upsert(ids=["b"], embeddings=[[0.5, 0.5]], documents=["B2"], metadatas=[{"source": "y"}])
+    collection.delete(ids=["a"])
+    collection.modify(metadata={"index_version": 3})
+
+    reopened = FlatVectorStore(str(tmp_path)).get_collection("docs")
+    assert reopened.count() == 2
+    assert reopened.metadata == {"index_version": 3}
+    assert reopened.get(where={"source": "x"})["documents"] == ["C"]
+    assert reopened.get(ids=["b"], include=["documents"])["documents"] == ["B2"]
+    assert reopened.query(query_embeddings=[[1.0, 1.0]], n_results=1)["ids"] == [["c"]]
+
+    with pytest.raises(ValueError):
+        reopened.upsert(ids=["d"], embeddings=[[1.0, 2.0, 3.0]])
+
+
+def test_rows_a_saved_table_points_at_are_never_rewritten(tmp_path):
+    writer = FlatVectorStore(str(tmp_path)).get_or_create_collection("docs")
+    writer.upsert(ids=["a", "b", "c"], embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], documents=["A", "B", "C"])
+    # Stands in for another process that loaded the table before the writes below.
+    reader = FlatCollection(writer.directory, "docs")
+
+    def stale_view():
+        # What the reader's old table and mapping say, without refreshing.
+        return {chunk_id: np.array(reader._vectors[row]).tolist() for chunk_id, row in reader._positions.items()}
+
+    writer.delete(ids=["a"])
+    writer.upsert(ids=["b"], embeddings=[[5.0, 5.0]], documents=["B2"])
+    assert stale_view() == {"a": [1.0, 0.0], "b": [0.0, 1.0], "c": [1.0, 1.0]}
+    assert writer.count() == 2
+    assert writer.query(query_embeddings=[[5.0, 5.0]], n_results=3)["ids"] == [["b", "c"]]
+
+    reader.count()
+    writer.compact()
+    assert stale_view() == {"b": [5.0, 5.0], "c": [1.0, 1.0]}
+    assert writer.generation == 1
+    assert sorted(os.listdir(writer.directory)) == ["norms.1.f32", "table.json", "vectors.1.f32"]
+    assert writer.get(include=["documents"])["documents"] == ["C", "B2"]
+    assert reader.query(query_embeddings=[[5.0, 5.0]], n_results=1)["ids"] == [["b"]]
+    assert reader.generation == 1
+
+
+def test_support_doc_embedder_runs_on_flat_store(tmp_path):
+    store = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="manual", use_cache=False,
+                               use_lexical=False, provider=HashingEmbeddingProvider(dim=32),
+                               client=FlatVectorStore(str(tmp_path / "flat")))
+    report = store.sync_document("manual.pdf", ["Reset the hub.", "Returns within 30 days.", "Battery lasts a year."])
+    assert report["added"] == 3
+    assert store.index_version() == 1
+
+    report = store.sync_document("manual.pdf", ["Reset the hub.", "Battery lasts a year."])
+    assert (report["deleted"], report["unchanged"]) == (1, 2)
+    assert store.retrieve_context("reset the hub", top_k=1) == ["Reset the hub."]
+    assert store.collection.metadata["embedding_model"] == "hashing-32"
+
+
+def test_stores_sharing_a_parent_directory_keep_separate_sidecars(tmp_path):
+    stores = [
+        SupportDocEmbedder(db_path=str(tmp_path / name), collection_name="manual", use_cache=False,
+                           provider=HashingEmbeddingProvider(dim=32),
+                           client=open_vector_client(str(tmp_path / name), "flat"))
+        for name in ("store_a", "store_b")
+    ]
+    stores[0].sync_document("a.pdf", ["Reset the hub by holding the button."])
+    stores[1].sync_document("b.pdf", ["Returns are accepted within 30 days."])
+
+    assert default_flat_path(str(tmp_path / "store_a")) != default_flat_path(str(tmp_path / "store_b"))
+    assert default_index_path(str(tmp_path / "store_a")) != default_index_path(str(tmp_path / "store_b"))
+    assert stores[0].collection.count() == 1
+    assert stores[1].lexical.count() == 1
+    assert stores[1].retrieve_context("reset the hub", top_k=1, mode="lexical") == []
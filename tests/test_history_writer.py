@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from chatapp.db.db import Base, create_async_db_engine
+from chatapp.db.history import afetch_page, encode_cursor
+from chatapp.db.history_writer import HistoryBacklogFull, HistoryWriter
+from chatapp.db.models import ConversationHistory
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_rows(count: int, offset: int = 0, session_id: str = "s-1"):
+    return [
+        ConversationHistory(user_id=1, session_id=session_id, sender="user", message=f"m{offset + i}",
+                            timestamp=START + timedelta(seconds=offset + i))
+        for i in range(count)
+    ]
+
+
+def run_with_db(tmp_path, scenario):
+    path = tmp_path / "history.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    async def run():
+        engine = create_async_db_engine(f"sqlite+aiosqlite:///{path}")
+        Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        try:
+            return await scenario(Session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def stored(Session) -> int:
+    async with Session() as db:
+        return await db.scalar(select(func.count()).select_from(ConversationHistory))
+
+
+def test_rows_are_committed_in_batches_by_size_and_interval(tmp_path):
+    async def scenario(Session):
+        writer = HistoryWriter(Session, flush_rows=4, flush_interval=0.05)
+        await writer.start()
+        for i in range(4):
+            await writer.submit(make_rows(1, offset=i))
+        await asyncio.sleep(0.01)
+        by_size = await stored(Session)
+
+        await writer.submit(make_rows(1, offset=4))
+        await asyncio.sleep(0.1)
+        by_interval = await stored(Session)
+        await writer.stop()
+        return by_size, by_interval, writer.stats
+
+    by_size, by_interval, stats = run_with_db(tmp_path, scenario)
+
+    assert (by_size, by_interval) == (4, 5)
+    assert stats["rows"] == 5
+    assert stats["batches"] == 2
+
+
+def test_stop_flushes_rows_still_pending(tmp_path):
+    async def scenario(Session):
+        writer = HistoryWriter(Session, flush_rows=1000, flush_interval=60)
+        await writer.start()
+        await writer.submit(make_rows(10))
+        await writer.stop()
+        return writer.pending, await stored(Session)
+
+    assert run_with_db(tmp_path, scenario) == (0, 10)
+
+
+def test_pages_include_pending_rows_once_and_in_order(tmp_path):
+    async def scenario(Session):
+        writer = HistoryWriter(Session, flush_rows=1000, flush_interval=60)
+        await writer.submit(make_rows(3))
+        await writer.flush()
+        await writer.submit(make_rows(3, offset=3) + make_rows(2, offset=3, session_id="s-2"))
+
+        async with Session() as db:
+            first = await afetch_page(db, 1, "s-1", limit=4, pending=writer.pending_for(1, "s-1"))
+            rest = await afetch_page(db, 1, "s-1", first["next_cursor"], limit=4,
+                                     pending=writer.pending_for(1, "s-1"))
+        # Once committed, the same rows come back from the database only.
+        await writer.flush()
+        async with Session() as db:
+            committed = await afetch_page(db, 1, "s-1", limit=10, pending=writer.pending_for(1, "s-1"))
+        return first, rest, committed
+
+    first, rest, committed = run_with_db(tmp_path, scenario)
+
+    assert [item["message"] for item in first["items"]] == ["m0", "m1", "m2", "m3"]
+    assert first["has_more"]
+    assert [item["message"] for item in rest["items"]] == ["m4", "m5"]
+    assert not rest["has_more"]
+    assert [item["message"] for item in committed["items"]] == [f"m{i}" for i in range(6)]
+
+
+def test_cursor_on_a_pending_row_skips_everything_up_to_it(tmp_path):
+    async def scenario(Session):
+        writer = HistoryWriter(Session, flush_rows=1000, flush_interval=60)
+        rows = make_rows(2)
+        await writer.submit(rows)
+        cursor = encode_cursor(rows[-1])
+        await writer.submit(make_rows(1, offset=2))
+        async with Session() as db:
+            pending_page = await afetch_page(db, 1, "s-1", cursor, pending=writer.pending_for(1, "s-1"))
+        await writer.flush()
+        async with Session() as db:
+            stored_page = await afetch_page(db, 1, "s-1", cursor)
+        return pending_page, stored_page
+
+    pending_page, stored_page = run_with_db(tmp_path, scenario)
+
+    assert [item["message"] for item in pending_page["items"]] == ["m2"]
+    assert [item["message"] for item in stored_page["items"]] == ["m2"]
+
+
+class FailingSession:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def add_all(self, rows):
+        self.calls.append(len(rows))
+
+    async def commit(self):
+        raise RuntimeError("database is unavailable")
+
+
+def test_rows_that_never_commit_are_dropped_and_submit_stays_bounded():
+    calls = []
+
+    async def scenario():
+        writer = HistoryWriter(lambda: FailingSession(calls), flush_rows=1000, flush_interval=60,
+                               max_pending=4, max_attempts=2)
+        await writer.submit(make_rows(4))
+        try:
+            await writer.submit(make_rows(1, offset=4))
+        except HistoryBacklogFull:
+            rejected = True
+        else:
+            rejected = False
+        pending_after_reject = writer.pending
+        # Second failed attempt: the rows are dropped and the queue accepts new ones.
+        await writer.flush()
+        await writer.submit(make_rows(1, offset=5))
+        return rejected, pending_after_reject, writer.pending, writer.stats
+
+    rejected, pending_after_reject, pending, stats = asyncio.run(scenario())
+
+    assert rejected
+    assert pending_after_reject == 4
+    assert pending == 1
+    assert stats["dropped"] == 4
+    assert stats["rows"] == 0
+    # Each failed batch is retried one row per transaction.
+    assert calls == [4, 1, 1, 1, 1] * 2
+
+
+def test_one_bad_row_does_not_hold_back_the_rest(tmp_path):
+    async def scenario(Session):
+        writer = HistoryWriter(Session, flush_rows=1000, flush_interval=60, max_attempts=1)
+        bad = make_rows(1, offset=1)[0]
+        bad.message = {"not": "text"}  # sqlite cannot bind it, so this row can never commit
+        await writer.submit(make_rows(1) + [bad] + make_rows(1, offset=2))
+        written = await writer.flush()
+        return written, writer.pending, writer.stats, await stored(Session)
+
+    written, pending, stats, rows = run_with_db(tmp_path, scenario)
+
+    assert (written, pending, rows) == (2, 0, 2)
+    assert stats["dropped"] == 1
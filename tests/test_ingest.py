@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+import fitz
+
+from utils.ingest import ingest, resolve_paths, source_root
+from utils.rag_retriever import SupportDocEmbedder
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for i, text in enumerate(pages):
+        doc.insert_page(i, text=text)
+    doc.save(str(path))
+    doc.close()
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
+def test_ingest_directory_with_process_pool(mock_embed, tmp_path):
+    mock_embed.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    make_pdf(docs / "manual.pdf", [f"Manual page {i}." for i in range(5)])
+    make_pdf(docs / "faq.pdf", ["Question one?", "Answer two."])
+
+    paths = resolve_paths(str(docs))
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["faq.pdf", "manual.pdf"]
+
+    messages = []
+    summary = ingest(paths, "ingest_collection", db_path=str(tmp_path / "chroma"), workers=2,
+                     pages_per_task=2, progress=messages.append)
+
+    assert summary["files"] == 2
+    assert summary["pages"] == 7
+    assert summary["added"] == 7
+    assert len(messages) == 2
+
+    again = ingest(paths, "ingest_collection", db_path=str(tmp_path / "chroma"), workers=2,
+                   pages_per_task=2, progress=messages.append)
+    assert again["added"] == 0
+    assert again["unchanged"] == 7
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
+def test_unreadable_files_are_skipped_and_reported(mock_embed, tmp_path):
+    mock_embed.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    make_pdf(docs / "manual.pdf", [f"Manual page {i}." for i in range(3)])
+    (docs / "broken.pdf").write_bytes(b"not a pdf at all")
+
+    messages = []
+    summary = ingest(resolve_paths(str(docs)), "partial_collection", db_path=str(tmp_path / "chroma"), workers=1,
+                     pages_per_task=2, progress=messages.append)
+
+    assert summary["files"] == 1
+    assert summary["added"] == 3
+    assert summary["failed"] == 1
+    assert list(summary["failures"]) == [str(docs / "broken.pdf")]
+    assert messages[0].startswith("FAILED")
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
+def test_files_sharing_a_basename_are_kept_apart(mock_embed, tmp_path):
+    mock_embed.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    docs = tmp_path / "docs"
+    (docs / "a").mkdir(parents=True)
+    (docs / "b").mkdir()
+    make_pdf(docs / "a" / "manual.pdf", ["Hub A resets with the side button."])
+    make_pdf(docs / "b" / "manual.pdf", ["Hub B resets from the app."])
+    db_path = str(tmp_path / "chroma")
+
+    first = ingest(resolve_paths(str(docs)), "shared_names", db_path=db_path, workers=1,
+                   root=source_root(str(docs)), progress=lambda line: None)
+    again = ingest(resolve_paths(str(docs)), "shared_names", db_path=db_path, workers=1,
+                   root=source_root(str(docs)), progress=lambda line: None)
+
+    store = SupportDocEmbedder(db_path=db_path, collection_name="shared_names")
+    sources = sorted(metadata["source"] for metadata in store.collection.get(include=["metadatas"])["metadatas"])
+    assert sources == ["a/manual.pdf", "b/manual.pdf"]
+    assert (first["added"], first["deleted"]) == (2, 0)
+    assert (again["added"], again["deleted"], again["unchanged"]) == (0, 0, 2)
+    assert source_root(str(docs / "**" / "*.pdf")) == str(docs)
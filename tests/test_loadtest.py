@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from agentapp.processing.embedder import LLMToolkit
+from benchmarks.fake_upstream import ANSWER, base_url, start_server
+from benchmarks.loadtest_chat import check_embed_dim, percentile, run_load
+from chatapp.core.semantic_cache import get_semantic_cache
+from chatapp.core.upstream import get_http_client
+from chatapp.main import app, get_retriever
+
+
+def test_fake_upstream_serves_chat_stream_and_reranker():
+    server = start_server(latency=0.0)
+    try:
+        llm = LLMToolkit(use_cache=False)
+        llm.base_url = f"{base_url(server)}/hiring"
+        assert llm.get_summary("some text") == ANSWER
+        assert llm.rerank("hub reset", ["battery life", "hub reset steps"]) == ["hub reset steps", "battery life"]
+
+        stream = requests.post(f"{base_url(server)}/hiring/chat/completions", json={"stream": True}, stream=True)
+        lines = [line for line in stream.iter_lines(decode_unicode=True) if line]
+        assert lines[-1] == "data: [DONE]"
+        assert server.requests == {"chat_completions": 2, "reranker": 1}
+    finally:
+        server.shutdown()
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 95) == 0.0
+
+
+def test_run_load_reports_stages_and_percentiles(fake_retriever, fake_upstream):
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+            return await run_load(client, [(1, 0.5), (3, 0.5)], ("Username", "password"), progress=lambda line: None)
+
+    try:
+        report = asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [stage["users"] for stage in report["stages"]] == [1, 3]
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["error_rate"] == 0.0
+    assert report["overall"]["empty_context"] == 0
+    assert report["overall"]["p50_ms"] <= report["overall"]["p99_ms"]
+
+
+def test_run_load_flags_answers_given_without_context(fake_retriever, fake_upstream):
+    async def no_chunks(query, hits, http_client, top_k=2, query_embedding=None):
+        # What a failed vector query degrades to.
+        return [], []
+
+    fake_retriever.avector_pass = no_chunks
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake_upstream))
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+            return await run_load(client, [(1, 1.0)], ("Username", "password"), progress=lambda line: None)
+
+    try:
+        report = asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["empty_context"] == report["overall"]["requests"]
+
+
+def test_fake_embeddings_follow_the_collection_dimension():
+    server = start_server(embed_dim=check_embed_dim(1024))
+    try:
+        body = requests.post(f"{base_url(server)}/embed/embeddings", json={"input": ["hub"]}).json()
+        assert len(body["result"]["data"][0]["embedding"]) == 1024
+    finally:
+        server.shutdown()
+
+    assert check_embed_dim(1024, 1024) == 1024
+    with pytest.raises(SystemExit):
+        check_embed_dim(1024, 64)
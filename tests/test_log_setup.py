@@ -0,0 +1,98 @@
+import json
+import logging
+import queue
+
+from utils.log_setup import DroppingQueueHandler, JsonFormatter, SamplingFilter, create_handlers, payload_logger
+from utils.metrics import REGISTRY
+
+
+def make_record(name, level, msg, *args, **extra):
+    return logging.getLogger(name).makeRecord(name, level, __file__, 1, msg, args, None, extra=extra or None)
+
+
+def test_sampling_applies_to_child_loggers_below_warning():
+    sampler = SamplingFilter({"chatapp.payload": 0.0})
+
+    assert not sampler.filter(make_record("chatapp.payload", logging.INFO, "context"))
+    assert not sampler.filter(make_record("chatapp.payload.chunks", logging.INFO, "context"))
+    assert sampler.filter(make_record("chatapp.payload", logging.WARNING, "context"))
+    assert sampler.filter(make_record("chatapp", logging.INFO, "request"))
+
+
+def test_json_formatter_caps_arguments_and_keeps_extra_fields():
+    formatter = JsonFormatter()
+    formatter.max_chars = 20
+    record = make_record("chatapp", logging.INFO, "Context: %s", ["x" * 100], session_id="s-1")
+
+    entry = json.loads(formatter.format(record))
+
+    assert entry["logger"] == "chatapp"
+    assert entry["session_id"] == "s-1"
+    assert entry["message"].startswith("Context: ['xxxxxxxxx")
+    assert entry["message"].endswith("more chars]")
+    assert len(entry["message"]) < 60
+
+
+def test_full_queue_drops_instead_of_blocking():
+    before = REGISTRY.get_sample_value("log_records_dropped_total")
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(make_record("chatapp", logging.INFO, "message %s", i))
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    assert REGISTRY.get_sample_value("log_records_dropped_total") - before == 3
+
+
+def test_queued_record_keeps_the_arguments_it_was_logged_with():
+    handler = DroppingQueueHandler(queue.Queue())
+    chunk_ids = ["c1"]
+    handler.handle(make_record("chatapp", logging.INFO, "chunks %s", chunk_ids))
+    chunk_ids.append("c2")
+
+    assert handler.queue.get_nowait().getMessage() == "chunks ['c1']"
+
+
+def test_stopping_the_listener_logs_how_many_records_were_dropped(tmp_path):
+    path = tmp_path / "app.log"
+    handler, listener = create_handlers(str(path), sample_rates={}, queue_size=1)
+    for i in range(3):
+        handler.handle(make_record("chatapp", logging.WARNING, "message %s", i))
+    listener.start()
+    listener.stop()
+    listener.stop()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["message"] for line in lines] == [
+        "message 0", "2 log records were dropped because the log queue was full",
+    ]
+
+
+def test_listener_writes_json_lines_on_its_own_thread(tmp_path):
+    path = tmp_path / "app.log"
+    handler, listener = create_handlers(str(path), sample_rates={})
+    logger = logging.getLogger("tests.log_setup")
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    try:
+        logger.info("answered %s in %.1f ms", "s-1", 12.34)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["message"] for line in lines] == ["answered s-1 in 12.3 ms", "failed"]
+    assert "ValueError: boom" in lines[1]["exception"]
+
+
+def test_payload_loggers_are_sampled_under_their_app_name():
+    sampler = SamplingFilter({"chatapp.payload": 0.0})
+
+    assert not sampler.filter(make_record(payload_logger("chatapp").name, logging.INFO, "context"))
+    assert sampler.filter(make_record(payload_logger("agentapp").name, logging.INFO, "context"))
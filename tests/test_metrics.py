@@ -0,0 +1,42 @@
+import pytest
+from utils.metrics import REGISTRY, _timings, server_timing, stage, upstream_call
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_upstream_call_counts_outcomes_and_restores_in_flight():
+    ok_before = sample("upstream_requests_total", target="test_target", outcome="ok")
+    error_before = sample("upstream_requests_total", target="test_target", outcome="error")
+
+    with upstream_call("test_target"):
+        assert sample("upstream_requests_in_flight", target="test_target") == 1
+    with pytest.raises(RuntimeError):
+        with upstream_call("test_target"):
+            raise RuntimeError("upstream down")
+
+    assert sample("upstream_requests_total", target="test_target", outcome="ok") == ok_before + 1
+    assert sample("upstream_requests_total", target="test_target", outcome="error") == error_before + 1
+    assert sample("upstream_requests_in_flight", target="test_target") == 0
+
+
+def test_stages_collect_into_request_timings():
+    timings = []
+    token = _timings.set(timings)
+    try:
+        with stage("embeddings"):
+            pass
+        with stage("embeddings"):
+            pass
+        with stage("vector_query"):
+            pass
+    finally:
+        _timings.reset(token)
+
+    assert [name for name, _ in timings] == ["embeddings", "embeddings", "vector_query"]
+    header = server_timing([("embeddings", 0.010), ("embeddings", 0.005), ("vector_query", 0.002)], 0.05)
+    assert header == "embeddings;dur=15.0, vector_query;dur=2.0, total;dur=50.0"
+    with stage("outside_request"):
+        pass
+    assert len(timings) == 3
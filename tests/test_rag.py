@@ -1,12 +1,16 @@
 import os
+from array import array
 import pytest
 from unittest.mock import patch, MagicMock
 from utils.rag_retriever import SupportDocEmbedder
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_providers import EMBEDDING_PROVIDER, EmbeddingProvider, HashingEmbeddingProvider, get_embedding_provider
+from utils.lexical_index import BM25Index
 
 
 @pytest.fixture
 def embedder():
-    return SupportDocEmbedder(collection_name="test_collection")
+    return SupportDocEmbedder(collection_name="test_collection", use_cache=False, use_lexical=False)
 
 
 def test_extract_text_from_pdf(embedder):
@@ -25,7 +29,7 @@ def test_extract_text_from_pdf(embedder):
     os.remove(test_pdf)
 
 
-@patch("utils.rag_retriever.requests.post")
+@patch("utils.embedding_providers.requests.Session.post")
 def test_get_embedding(mock_post, embedder):
     mock_post.return_value.status_code = 200
     mock_post.return_value.json.return_value = {
@@ -41,16 +45,50 @@ def test_get_embedding(mock_post, embedder):
     assert embedding == [0.1, 0.2, 0.3]
 
 
-@patch.object(SupportDocEmbedder, "get_embedding")
+@patch("utils.embedding_providers.requests.Session.post")
+def test_get_embeddings_batches_inputs(mock_post, embedder):
+    mock_post.return_value.json.return_value = {
+        "result": {
+            "data": [
+                {"index": 1, "embedding": [0.2]},
+                {"index": 0, "embedding": [0.1]}
+            ]
+        }
+    }
+
+    embeddings = embedder.get_embeddings(["first", "second"])
+    assert embeddings == [[0.1], [0.2]]
+    mock_post.assert_called_once()
+    assert mock_post.call_args.kwargs["json"]["input"] == ["first", "second"]
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
 @patch.object(SupportDocEmbedder, "extract_text_from_pdf")
 def test_embed_and_store(mock_extract, mock_embed, embedder):
     mock_extract.return_value = ["Sample text"]
-    mock_embed.return_value = [0.1, 0.2, 0.3]
+    mock_embed.return_value = [[0.1, 0.2, 0.3]]
 
     embedder.collection = MagicMock()
+    embedder.collection.metadata = {"embedding_model": "usf1-embed"}
+    embedder.collection.get.return_value = {"ids": [], "metadatas": []}
     embedder.embed_and_store("dummy.pdf")
 
-    embedder.collection.add.assert_called_once()
+    embedder.collection.upsert.assert_called_once()
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
+def test_store_chunks_adds_one_batch_per_request(mock_embed, embedder):
+    mock_embed.side_effect = lambda texts: [[0.1, 0.2, 0.3] for _ in texts]
+    chunks = [f"chunk {i}" for i in range(5)]
+
+    embedder.collection = MagicMock()
+    embedder.collection.metadata = {"embedding_model": "usf1-embed"}
+    stats = embedder.store_chunks([f"id_{i}" for i in range(5)], chunks, batch_size=2, max_in_flight=2)
+
+    assert mock_embed.call_count == 3
+    assert embedder.collection.upsert.call_count == 3
+    assert stats["chunks"] == 5
+    assert stats["batches"] == 3
 
 
 @patch.object(SupportDocEmbedder, "get_embedding")
@@ -58,9 +96,190 @@ def test_retrieve_context(mock_embed, embedder):
     mock_embed.return_value = [0.1, 0.2, 0.3]
     embedder.collection = MagicMock()
     embedder.collection.query.return_value = {
+        "ids": [["doc_1", "doc_2"]],
         "documents": [["Answer 1", "Answer 2"]]
     }
 
     result = embedder.retrieve_context("test query")
     assert isinstance(result, list)
     assert "Answer 1" in result
+
+
+@patch("utils.embedding_providers.requests.Session.post")
+def test_get_embeddings_uses_cache(mock_post, tmp_path):
+    mock_post.return_value.json.return_value = {
+        "result": {"data": [{"index": 0, "embedding": [0.1, 0.2]}]}
+    }
+    cached_embedder = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="test_collection")
+    cached_embedder.cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+
+    miss = cached_embedder.get_embedding("repeat query")
+    hit = cached_embedder.get_embedding("repeat query")
+    # Both come back at float32 precision, whether embedded just now or read from the cache.
+    assert miss == hit == array("f", [0.1, 0.2]).tolist()
+    mock_post.assert_called_once()
+    assert cached_embedder.cache.stats["memory_hits"] == 1
+
+
+def test_aretrieve_context_uses_async_client(embedder):
+    import asyncio
+    import httpx
+
+    def handler(request):
+        return httpx.Response(200, json={"result": {"data": [{"index": 0, "embedding": [0.1, 0.2, 0.3]}]}})
+
+    embedder.collection = MagicMock()
+    embedder.collection.query.return_value = {"ids": [["doc_1"]], "documents": [["Answer 1"]]}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await embedder.aretrieve_context("test query", client)
+
+    assert asyncio.run(run()) == ["Answer 1"]
+    embedder.collection.query.assert_called_once_with(query_embeddings=[[0.1, 0.2, 0.3]], n_results=2,
+                                                     include=["documents"])
+
+
+@patch.object(SupportDocEmbedder, "get_embeddings")
+def test_sync_document_only_embeds_changes(mock_embed, tmp_path):
+    mock_embed.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    store = SupportDocEmbedder(db_path=str(tmp_path), collection_name="sync_collection", use_cache=False)
+
+    first = store.sync_document("manual.pdf", ["page one", "page two", "page three"])
+    assert (first["added"], first["deleted"], first["unchanged"]) == (3, 0, 0)
+    assert store.index_version() == 1
+
+    mock_embed.reset_mock()
+    second = store.sync_document("manual.pdf", ["page one", "page two (revised)", "page three"])
+    assert (second["added"], second["deleted"], second["unchanged"]) == (1, 1, 2)
+    mock_embed.assert_called_once_with(["page two (revised)"])
+
+    mock_embed.reset_mock()
+    third = store.sync_document("manual.pdf", ["page one", "page two (revised)", "page three"])
+    assert (third["added"], third["deleted"], third["unchanged"]) == (0, 0, 3)
+    mock_embed.assert_not_called()
+    assert store.collection.count() == 3
+    assert store.index_version() == 2
+
+
+def test_sync_document_replaces_legacy_chunk_ids(tmp_path):
+    store = SupportDocEmbedder(db_path=str(tmp_path), collection_name="legacy_collection", use_cache=False)
+    store.collection.add(documents=["old page"], embeddings=[[0.1, 0.2]], ids=["manual.pdf_chunk_0"])
+
+    with patch.object(SupportDocEmbedder, "get_embeddings", return_value=[[0.3, 0.4]]):
+        report = store.sync_document("manual.pdf", ["new page"])
+
+    assert report["deleted"] == 1
+    assert store.collection.get(ids=["manual.pdf_chunk_0"])["ids"] == []
+
+
+def test_provider_without_embed_fails_at_construction():
+    class Incomplete(EmbeddingProvider):
+        model = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_default_provider_is_the_same_instance_as_its_explicit_name():
+    assert get_embedding_provider() is get_embedding_provider(EMBEDDING_PROVIDER)
+    with pytest.raises(ValueError):
+        get_embedding_provider("missing")
+
+
+def test_hashing_provider_is_deterministic_and_normalized():
+    provider = HashingEmbeddingProvider(dim=64)
+    first, again, other = provider.embed(["Reset the hub", "reset the HUB", "Battery life"])
+
+    assert first == again
+    assert first != other
+    assert sum(v * v for v in first) == pytest.approx(1.0, rel=1e-5)
+
+
+def test_embedding_model_is_recorded_and_enforced(tmp_path):
+    store = SupportDocEmbedder(db_path=str(tmp_path), collection_name="model_collection", use_cache=False,
+                               provider=HashingEmbeddingProvider(dim=32))
+    store.sync_document("manual.pdf", ["page one", "page two"])
+    assert store.collection.metadata["embedding_model"] == "hashing-32"
+    assert store.retrieve_context("page one", top_k=1) == ["page one"]
+
+    with pytest.raises(ValueError, match="hashing-32"):
+        SupportDocEmbedder(db_path=str(tmp_path), collection_name="model_collection", use_cache=False,
+                           provider=HashingEmbeddingProvider(dim=64))
+
+
+def test_unrecorded_collections_are_treated_as_remote(tmp_path):
+    store = SupportDocEmbedder(db_path=str(tmp_path), collection_name="legacy_model", use_cache=False)
+    store.collection.add(documents=["old page"], embeddings=[[0.1, 0.2]], ids=["manual.pdf_chunk_0"])
+
+    with pytest.raises(ValueError, match="usf1-embed"):
+        SupportDocEmbedder(db_path=str(tmp_path), collection_name="legacy_model", use_cache=False,
+                           provider=HashingEmbeddingProvider())
+
+
+def test_bm25_ranks_exact_keywords_and_forgets_deleted_chunks(tmp_path):
+    index = BM25Index(str(tmp_path / "lexical.sqlite3"), "support")
+    index.add(["a", "b", "c"], ["Order ORD-88231 ships Monday", "Returns within 30 days", "Order tracking help"])
+
+    hits = index.search("where is ORD-88231?")
+    assert hits[0].chunk_id == "a"
+    assert hits[0].coverage == 1.0
+
+    index.delete(["a"])
+    assert index.search("ORD-88231") == []
+    assert [hit.chunk_id for hit in index.search("order")] == ["c"]
+    assert index.count() == 2
+
+
+def test_retrieve_skips_embedding_for_confident_lexical_hits(tmp_path):
+    provider = HashingEmbeddingProvider(dim=32)
+    store = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="lexical_collection",
+                               use_cache=False, provider=provider)
+    store.sync_document("manual.pdf", ["Order ORD-88231 ships Monday.", "Returns are accepted within 30 days.",
+                                       "Reset the hub by holding the button."])
+
+    with patch.object(provider, "embed", wraps=provider.embed) as embed:
+        ids, docs = store.retrieve("ORD-88231", top_k=1)
+        assert docs == ["Order ORD-88231 ships Monday."]
+        embed.assert_not_called()
+
+        ids, docs = store.retrieve("ORD-88231", top_k=2, mode="hybrid")
+        embed.assert_called_once()
+        assert docs[0] == "Order ORD-88231 ships Monday."
+        assert len(set(ids)) == 2
+
+
+def test_lexical_index_is_backfilled_for_existing_collections(tmp_path):
+    store = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="backfill_collection",
+                               use_cache=False, use_lexical=False, provider=HashingEmbeddingProvider(dim=32))
+    store.sync_document("manual.pdf", ["Warranty covers two years.", "Shipping is free."])
+
+    reopened = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="backfill_collection",
+                                  use_cache=False, provider=HashingEmbeddingProvider(dim=32))
+    assert reopened.retrieve_context("warranty", top_k=1, mode="lexical") == ["Warranty covers two years."]
+    assert reopened.lexical.count() == 2
+
+
+def test_fuse_prefers_chunks_ranked_by_both():
+    assert SupportDocEmbedder.fuse([["x", "y", "z"], ["y", "w"]], top_k=2) == ["y", "x"]
+
+
+def test_retrieve_contexts_batches_embeddings_and_queries_once(tmp_path):
+    provider = HashingEmbeddingProvider(dim=32)
+    store = SupportDocEmbedder(db_path=str(tmp_path / "chroma"), collection_name="batch_collection",
+                               use_cache=False, use_lexical=False, provider=provider)
+    store.sync_document("manual.pdf", ["Reset the hub.", "Returns within 30 days.", "Battery lasts a year."])
+    queries = ["reset hub", "returns policy", "battery life", "hub reset steps", "warranty"]
+
+    with patch.object(provider, "embed", wraps=provider.embed) as embed, \
+            patch.object(store.collection, "query", wraps=store.collection.query) as query:
+        results = store.retrieve_contexts(queries, top_k=2, batch_size=2)
+
+    assert embed.call_count == 3
+    query.assert_called_once()
+    assert [r["query"] for r in results] == queries
+    for result in results:
+        ids, documents = store.search(provider.embed([result["query"]])[0], top_k=2)
+        assert result["ids"] == ids
+        assert result["documents"] == documents
+        assert result["distances"] == sorted(result["distances"])
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from utils.retriever_registry import RetrieverRegistry
+
+
+def test_registry_reuses_open_collection(tmp_path):
+    registry = RetrieverRegistry()
+    first = registry.get(str(tmp_path), "docs")
+    second = registry.get(str(tmp_path), "docs")
+    assert first is second
+    assert first.client is registry.get(str(tmp_path), "other").client
+
+
+def test_registry_evicts_least_recently_used(tmp_path):
+    registry = RetrieverRegistry(max_collections=2)
+    registry.get(str(tmp_path), "col_a")
+    registry.get(str(tmp_path), "col_b")
+    registry.get(str(tmp_path), "col_a")
+    registry.get(str(tmp_path), "col_c")
+
+    assert len(registry) == 2
+    assert (str(tmp_path), "col_a") in registry
+    assert (str(tmp_path), "col_b") not in registry
+
+
+def test_registry_warm_handles_populated_collection(tmp_path):
+    registry = RetrieverRegistry()
+    retriever = registry.get(str(tmp_path), "docs")
+    retriever.collection.add(documents=["hello"], embeddings=[[0.1, 0.2, 0.3]], ids=["doc_0"])
+
+    assert registry.warm(str(tmp_path), "docs") is retriever
+
+
+def test_evicted_and_cleared_retrievers_close_their_lexical_index(tmp_path):
+    registry = RetrieverRegistry(max_collections=1)
+    evicted = registry.get(str(tmp_path), "col_a")
+    connection = evicted.lexical._conn
+    kept = registry.get(str(tmp_path), "col_b")
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
+    assert evicted.lexical is None
+    assert evicted.lexical_search("hub") == []
+
+    connection = kept.lexical._conn
+    registry.clear()
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
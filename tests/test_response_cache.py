@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock, patch
+
+from agentapp.processing.embedder import LLMToolkit
+from agentapp.processing.response_cache import ResponseCache, is_cacheable
+
+
+def completion(content):
+    response = MagicMock()
+    response.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return response
+
+
+def test_ttl_expires_both_tiers(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), ttl=60)
+    payload = {"model": "usf1-mini", "messages": []}
+
+    with patch("utils.kv_cache.time.time", return_value=1000.0):
+        cache.set("/chat", payload, {"ok": True})
+    with patch("utils.kv_cache.time.time", return_value=1030.0):
+        assert cache.get("/chat", payload) == {"ok": True}
+    with patch("utils.kv_cache.time.time", return_value=1100.0):
+        assert cache.get("/chat", payload) is None
+
+    (count,) = cache.store._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+    assert count == 0
+
+
+def test_key_covers_endpoint_and_parameters():
+    payload = {"model": "usf1-mini", "temperature": 0.7}
+    assert ResponseCache.key("/a", payload) == ResponseCache.key("/a", dict(reversed(payload.items())))
+    assert ResponseCache.key("/a", payload) != ResponseCache.key("/b", payload)
+    assert ResponseCache.key("/a", payload) != ResponseCache.key("/a", {**payload, "temperature": 0.2})
+
+
+def test_toolkit_serves_repeats_from_cache():
+    llm = LLMToolkit(cache=ResponseCache())
+    with patch.object(llm.session, "post", return_value=completion("A summary")) as post:
+        assert llm.get_summary("same text") == "A summary"
+        assert llm.get_summary("same text") == "A summary"
+        assert llm.get_summary("other text") == "A summary"
+
+    assert post.call_count == 2
+    assert llm.cache.stats["memory_hits"] == 1
+
+
+def test_bypass_refreshes_entry():
+    llm = LLMToolkit(cache=ResponseCache())
+    with patch.object(llm.session, "post", side_effect=[completion("High"), completion("Low")]) as post:
+        assert llm.get_critique_score("summary") == "High"
+        llm.bypass_cache = True
+        assert llm.get_critique_score("summary") == "Low"
+        llm.bypass_cache = False
+        assert llm.get_critique_score("summary") == "Low"
+
+    assert post.call_count == 2
+
+
+def test_failures_are_not_cached():
+    llm = LLMToolkit(cache=ResponseCache())
+    failed = MagicMock()
+    failed.raise_for_status.side_effect = RuntimeError("503")
+    with patch.object(llm.session, "post", side_effect=[failed, completion("Recovered")]):
+        assert llm.get_summary("text") == "Summarization failed."
+        assert llm.get_summary("text") == "Recovered"
+
+
+def test_error_and_malformed_bodies_are_not_cached():
+    llm = LLMToolkit(cache=ResponseCache())
+    error = MagicMock()
+    error.json.return_value = {"error": {"message": "rate limited"}}
+    with patch.object(llm.session, "post", side_effect=[error, completion(""), completion("Recovered")]) as post:
+        assert llm.get_summary("text") == "Summarization failed."
+        llm.get_summary("text")
+        assert llm.get_summary("text") == "Recovered"
+
+    assert post.call_count == 3
+    assert is_cacheable({"result": {"data": [{"index": 0, "score": 0.9}]}})
+    assert not is_cacheable({"result": None})
@@ -0,0 +1,91 @@
+import httpx
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from opentelemetry.trace import SpanKind
+
+from agentapp.processing.concurrency import bounded_map
+from agentapp.processing.embedder import LLMToolkit
+from agentapp.processing.response_cache import ResponseCache
+from chatapp.core.semantic_cache import get_semantic_cache
+from chatapp.core.upstream import get_http_client
+from chatapp.main import app, get_retriever
+from utils.tracing import configure_tracing, get_tracer, memory_exporter
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+@pytest.fixture
+def spans():
+    configure_tracing("tests", exporter="memory")
+    exporter = memory_exporter()
+    if exporter is None:
+        pytest.skip("a non-memory tracer provider is already installed")
+    exporter.clear()
+    yield exporter
+    exporter.clear()
+
+
+def completion_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = f'{{"choices": [{{"message": {{"content": "{content}"}}}}]}}'.encode()
+    response.headers["Content-Length"] = str(len(response._content))
+    return response
+
+
+def test_chat_continues_incoming_trace_into_upstream_call(spans, fake_retriever):
+    outbound = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        outbound.append(request.headers.get("traceparent"))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Within 30 days."}}]})
+
+    app.dependency_overrides[get_retriever] = lambda: fake_retriever
+    app.dependency_overrides[get_http_client] = lambda: httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "Username", "password": "password"}).json()["access_token"]
+        response = client.post(
+            "/chat",
+            json={"session_id": "traced-session", "message": "What is the return policy?"},
+            headers={"Authorization": f"Bearer {token}", "traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    finished = {span.name: span for span in spans.get_finished_spans()}
+    server, upstream_span = finished["POST /chat"], finished["chat_completions"]
+    assert server.kind == SpanKind.SERVER
+    assert format(server.context.trace_id, "032x") == TRACE_ID
+    assert upstream_span.parent.span_id == server.context.span_id
+    assert upstream_span.attributes["http.response.status_code"] == 200
+    assert upstream_span.attributes["http.request.body.size"] > 0
+    # The upstream sees the client span as its parent, within the caller's trace.
+    assert outbound == [f"00-{TRACE_ID}-{upstream_span.context.span_id:016x}-01"]
+
+
+def test_worker_threads_nest_llm_calls_under_the_caller(spans):
+    llm = LLMToolkit(use_cache=False)
+    llm.session.post = lambda url, json, headers: completion_response("A summary")
+
+    with get_tracer().start_as_current_span("graph.summarize") as parent:
+        bounded_map(llm.get_summary, ["one", "two", "three"], max_workers=3)
+
+    calls = [span for span in spans.get_finished_spans() if span.name == "llm /chat/completions"]
+    assert len(calls) == 3
+    assert all(span.parent.span_id == parent.get_span_context().span_id for span in calls)
+    assert all(span.attributes["http.request.resend_count"] == 0 for span in calls)
+    assert all(span.attributes["http.response.body.size"] > 0 for span in calls)
+
+
+def test_response_cache_hits_are_not_traced_as_upstream_calls(spans):
+    llm = LLMToolkit(cache=ResponseCache())
+    llm.session.post = lambda url, json, headers: completion_response("A summary")
+
+    assert llm.get_summary("same text") == llm.get_summary("same text") == "A summary"
+
+    calls = [span for span in spans.get_finished_spans() if span.name == "llm /chat/completions"]
+    assert len(calls) == 1
@@ -0,0 +1,84 @@
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Iterator
+
+import tiktoken
+
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+_BOUNDARIES = {
+    # Lazily match up to sentence-ending punctuation followed by whitespace, a newline, or the end.
+    "sentence": re.compile(r".*?(?:[.!?](?=\s)|\n|$)\s*", re.S),
+    "paragraph": re.compile(r".*?(?:\n[ \t]*\n|$)\s*", re.S),
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = CHUNK_ENCODING):
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding=None) -> int:
+    return len((encoding or get_encoding()).encode(text, disallowed_special=()))
+
+
+def split_units(text: str, boundary: str = "sentence") -> Iterator[str]:
+    if boundary not in _BOUNDARIES:
+        raise ValueError(f"Unknown chunk boundary '{boundary}', expected one of {sorted(_BOUNDARIES)}")
+    for match in _BOUNDARIES[boundary].finditer(text):
+        if match.group():
+            yield match.group()
+
+
+def iter_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+                boundary: str = "sentence", encoding=None) -> Iterator[str]:
+    """Yield chunks of at most `max_tokens` tokens, split on sentence or paragraph boundaries.
+
+    Consecutive chunks share up to `overlap` tokens of trailing units. Each unit is
+    tokenized once and chunks are built with a single join, so the whole pass is linear
+    in the length of the text. A unit longer than `max_tokens` is split on token windows.
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+    encoding = encoding or get_encoding()
+
+    window = deque()
+    window_tokens = 0
+
+    for unit in split_units(text, boundary):
+        tokens = encoding.encode(unit, disallowed_special=())
+        size = len(tokens)
+
+        if size > max_tokens:
+            if window:
+                chunk = "".join(u for u, _ in window).strip()
+                if chunk:
+                    yield chunk
+                window.clear()
+                window_tokens = 0
+            step = max_tokens - overlap
+            for start in range(0, size, step):
+                yield encoding.decode(tokens[start:start + max_tokens]).strip()
+                if start + max_tokens >= size:
+                    break
+            continue
+
+        if window and window_tokens + size > max_tokens:
+            chunk = "".join(u for u, _ in window).strip()
+            if chunk:
+                yield chunk
+            while window and (window_tokens > overlap or window_tokens + size > max_tokens):
+                _, dropped = window.popleft()
+                window_tokens -= dropped
+
+        window.append((unit, size))
+        window_tokens += size
+
+    if window:
+        chunk = "".join(u for u, _ in window).strip()
+        if chunk:
+            yield chunk
@@ -0,0 +1,161 @@
+"""Builds the retrieved context for the chat prompt within a token budget.
+
+Retrieval over-fetches CONTEXT_FETCH_K chunks; assemble_context then walks them
+in rank order and
+  1. trims text a chunk shares with an already selected one (neighbouring chunks
+     overlap by CHUNK_OVERLAP_TOKENS, and the same page can arrive twice),
+  2. drops chunks whose remaining word shingles are mostly covered already
+     (CONTEXT_DEDUP_THRESHOLD),
+  3. packs what is left into CONTEXT_TOKEN_BUDGET tokens. A chunk that does not
+     fit is skipped in favour of smaller, lower-ranked ones, or cut on a token
+     boundary once at least CONTEXT_MIN_TAIL_TOKENS of the budget remain.
+
+Tokens are counted with tiktoken (CHUNK_ENCODING, as for ingestion). The upstream
+model's own tokenizer may differ slightly, so treat the counts as estimates.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from utils.chunking import count_tokens, get_encoding
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "6"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_MIN_TAIL_TOKENS = int(os.getenv("CONTEXT_MIN_TAIL_TOKENS", "64"))
+
+SEPARATOR = "\n"
+SHINGLE_WORDS = 5
+# Shared text shorter than this is left alone: it is more likely a common phrase than chunk overlap.
+MIN_OVERLAP_CHARS = 32
+# Per-message framing tokens in chat-completion prompts, as counted for OpenAI chat models.
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMER_TOKENS = 3
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class AssembledContext:
+    chunk_ids: list
+    chunks: list
+    tokens: int
+    budget: int
+    candidates: int
+    candidate_tokens: int
+    duplicates: int = 0
+    truncated: bool = False
+    skipped: list = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return SEPARATOR.join(self.chunks)
+
+    def usage(self) -> dict:
+        return {
+            "context_tokens": self.tokens,
+            "context_budget": self.budget,
+            "chunks": len(self.chunks),
+            "candidates": self.candidates,
+            "candidate_tokens": self.candidate_tokens,
+            "duplicates": self.duplicates,
+            "truncated": self.truncated,
+        }
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def overlap(left: str, right: str, min_chars: int = MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    if len(left) < min_chars or len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    start = max(0, len(left) - len(right))
+    best = 0
+    while True:
+        position = left.find(probe, start)
+        if position < 0:
+            return best
+        # The earliest match that runs to the end of `left` is the longest overlap.
+        if right.startswith(left[position:]):
+            return len(left) - position
+        start = position + 1
+
+
+def trim_overlaps(text: str, selected: list) -> str:
+    for chunk in selected:
+        head = overlap(chunk, text)
+        if head:
+            text = text[head:]
+        tail = overlap(text, chunk)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+
+def assemble_context(chunk_ids: list, chunks: list, budget: int = CONTEXT_TOKEN_BUDGET,
+                     dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+                     min_tail_tokens: int = CONTEXT_MIN_TAIL_TOKENS, encoding=None) -> AssembledContext:
+    """Pick, in rank order, the chunks that fit `budget` tokens once duplicates are removed."""
+    encoding = encoding or get_encoding()
+    separator_tokens = count_tokens(SEPARATOR, encoding)
+    selected_ids, selected, seen = [], [], set()
+    used, candidate_tokens, duplicates, truncated, skipped = 0, 0, 0, False, []
+
+    for chunk_id, chunk in zip(chunk_ids, chunks):
+        tokens = encoding.encode(chunk, disallowed_special=())
+        candidate_tokens += len(tokens)
+        if truncated:
+            skipped.append(chunk_id)
+            continue
+
+        text = trim_overlaps(chunk, selected)
+        words = shingles(text)
+        if not words or len(words & seen) >= dedup_threshold * len(words):
+            duplicates += 1
+            continue
+        if text != chunk:
+            tokens = encoding.encode(text, disallowed_special=())
+
+        room = budget - used - (separator_tokens if selected else 0)
+        if len(tokens) > room:
+            if room < min_tail_tokens:
+                skipped.append(chunk_id)
+                continue
+            text = encoding.decode(tokens[:room]).strip()
+            tokens = tokens[:room]
+            truncated = True
+
+        selected_ids.append(chunk_id)
+        selected.append(text)
+        seen |= words
+        used += len(tokens) + (separator_tokens if len(selected) > 1 else 0)
+
+    return AssembledContext(
+        chunk_ids=selected_ids,
+        chunks=selected,
+        tokens=count_tokens(SEPARATOR.join(selected), encoding),
+        budget=budget,
+        candidates=len(chunks),
+        candidate_tokens=candidate_tokens,
+        duplicates=duplicates,
+        truncated=truncated,
+        skipped=skipped,
+    )
+
+
+def count_message_tokens(messages: list, encoding=None) -> int:
+    encoding = encoding or get_encoding()
+    return REPLY_PRIMER_TOKENS + sum(
+        MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"], encoding) for message in messages
+    )
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import threading
+from array import array
+
+from utils.kv_cache import TwoTierCache, sidecar_path
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "200000"))
+
+
+def default_cache_path(db_path: str) -> str:
+    return os.getenv("EMBEDDING_CACHE_PATH", sidecar_path(db_path, "embedding_cache.sqlite3"))
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store keyed by sha256(model, text).
+
+    Vectors are kept as float32 blobs, so cached values round-trip at float32 precision.
+    """
+
+    def __init__(self, path: str = None, max_memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_disk_items: int = EMBEDDING_CACHE_DISK_ITEMS):
+        self.store = TwoTierCache(path, max_memory_items=max_memory_items, max_disk_items=max_disk_items)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def encode(embedding) -> bytes:
+        return array("f", embedding).tobytes()
+
+    @staticmethod
+    def decode(blob: bytes) -> list[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    @classmethod
+    def to_float32(cls, embedding) -> list[float]:
+        # Rounds a fresh vector the way storing it would, so hits and misses return the same values.
+        return cls.decode(cls.encode(embedding))
+
+    def get_many(self, model: str, texts: list[str]) -> dict:
+        keys = {self.key(model, text): text for text in texts}
+        found = self.store.get_many(list(keys))
+        return {keys[key]: self.decode(blob) for key, blob in found.items()}
+
+    def set_many(self, model: str, items):
+        self.store.set_many((self.key(model, text), self.encode(embedding)) for text, embedding in items)
+
+    @property
+    def stats(self) -> dict:
+        return {**self.store.stats, "hit_rate": round(self.store.hit_rate(), 4)}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str) -> EmbeddingCache:
+    # One cache per file so every embedder in the process shares the same memory tier.
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path)
+            _caches[path] = cache
+        return cache
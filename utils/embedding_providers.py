@@ -0,0 +1,168 @@
+"""Embedding backends for SupportDocEmbedder.
+
+    EMBEDDING_PROVIDER=remote   usf1-embed over HTTP (default)
+    EMBEDDING_PROVIDER=local    sentence-transformers in-process on CPU
+    EMBEDDING_PROVIDER=hashing  deterministic feature hashing, for tests and benchmarks
+
+Each provider exposes `model`, the name recorded in collection metadata and
+used in embedding cache keys, so vectors from different backends never mix.
+"""
+
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from utils.metrics import upstream_call
+from utils.tracing import client_span, inject_headers, record_response
+
+load_dotenv()
+
+ULTRASAFE_BASE_URL = os.getenv("ULTRASAFE_BASE_URL", "https://api.us.inc/usf/v1")
+EMBED_MODEL = "usf1-embed"
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "remote")
+LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "32"))
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", "0"))
+HASHING_EMBED_DIM = int(os.getenv("HASHING_EMBED_DIM", "256"))
+
+
+class EmbeddingProvider(ABC):
+    model = None
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+    async def aembed(self, texts: list[str], http_client=None) -> list[list[float]]:
+        # In-process backends do CPU work, so they run off the event loop.
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class RemoteEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, base_url: str = ULTRASAFE_BASE_URL, model: str = EMBED_MODEL):
+        self.model = model
+        self.api_key = os.getenv("ULTRASAFE_API_KEY", "")
+        self.embed_url = f"{base_url}/embed/embeddings"
+        self.session = requests.Session()
+
+    def _request(self, texts: list[str]):
+        payload = {
+            "model": self.model,
+            "input": texts
+        }
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key
+        }
+        return payload, headers
+
+    @staticmethod
+    def _parse(body: dict, count: int) -> list[list[float]]:
+        data = body["result"]["data"]
+        if len(data) != count:
+            raise ValueError(f"Expected {count} embeddings, got {len(data)}")
+        if all("index" in item for item in data):
+            data = sorted(data, key=lambda item: item["index"])
+
+        embeddings = [item.get("embedding") for item in data]
+        if any(embedding is None for embedding in embeddings):
+            raise ValueError("Missing 'embedding' in API response")
+
+        return embeddings
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        payload, headers = self._request(texts)
+        with upstream_call("embeddings"), client_span("embeddings", self.embed_url, payload) as span:
+            span.set_attribute("embedding.inputs", len(texts))
+            response = self.session.post(self.embed_url, json=payload, headers=inject_headers(headers))
+            record_response(span, response)
+            response.raise_for_status()
+        return self._parse(response.json(), len(texts))
+
+    async def aembed(self, texts: list[str], http_client=None) -> list[list[float]]:
+        if http_client is None:
+            return await super().aembed(texts)
+        payload, headers = self._request(texts)
+        with upstream_call("embeddings"), client_span("embeddings", self.embed_url, payload) as span:
+            span.set_attribute("embedding.inputs", len(texts))
+            response = await http_client.post(self.embed_url, json=payload, headers=inject_headers(headers))
+            record_response(span, response)
+            response.raise_for_status()
+        return self._parse(response.json(), len(texts))
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """Runs a sentence-transformers model on CPU; the model loads on first use."""
+
+    def __init__(self, model_name: str = LOCAL_EMBED_MODEL, batch_size: int = LOCAL_EMBED_BATCH_SIZE,
+                 threads: int = LOCAL_EMBED_THREADS):
+        self.model_name = model_name
+        self.model = f"local:{model_name}"
+        self.batch_size = batch_size
+        self.threads = threads
+        self._encoder = None
+        # One encode at a time: torch already spreads a batch over its own CPU threads.
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._encoder is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self._encoder = SentenceTransformer(self.model_name, device="cpu")
+        return self._encoder
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            vectors = self._load().encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                          normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Signed feature hashing of lowercase word tokens; no model, no network."""
+
+    token_pattern = re.compile(r"\w+")
+
+    def __init__(self, dim: int = HASHING_EMBED_DIM):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in self.token_pattern.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1.0, norms)).tolist()
+
+
+PROVIDERS = {
+    "remote": RemoteEmbeddingProvider,
+    "local": SentenceTransformerProvider,
+    "hashing": HashingEmbeddingProvider,
+}
+
+
+def get_embedding_provider(name: str = None) -> EmbeddingProvider:
+    # Resolved before the cache lookup, so the default and its explicit name share one instance.
+    return _provider(name or EMBEDDING_PROVIDER)
+
+
+@lru_cache(maxsize=None)
+def _provider(name: str) -> EmbeddingProvider:
+    # Shared per name so a local model is loaded once per process.
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}', expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[name]()
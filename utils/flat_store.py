@@ -0,0 +1,355 @@
+"""Exact nearest-neighbour store for small collections.
+
+Each collection is a directory holding
+
+    vectors.f32   float32 matrix, one row per chunk, memory-mapped
+    norms.f32     squared L2 norm of every row, memory-mapped
+    table.json    ids, documents, metadatas and collection metadata
+
+Opening a collection maps the two matrices without reading them, and a query
+is one matrix product plus argpartition. Distances are squared L2, the same as
+chromadb's default space. Writes rewrite table.json, so this suits collections
+of a few thousand chunks with a single writer process.
+
+Rows that table.json refers to are never written again, so a reader (or a
+crash) never pairs an id with another chunk's vector. Deleting or re-upserting
+an id only marks its row dead in the table; new vectors go past the last row.
+Once dead rows outnumber live ones, compact() copies the live rows into a new
+generation of matrix files (vectors.<n>.f32), swaps the table over to them and
+removes the old files.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.kv_cache import sidecar_path
+
+_DTYPE = np.float32
+_INITIAL_CAPACITY = 1024
+_COMPACT_MIN_DEAD = 256
+
+
+def default_flat_path(db_path: str) -> str:
+    return os.getenv("FLAT_STORE_PATH", sidecar_path(db_path, "flat_store"))
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    for key, value in where.items():
+        if key.startswith("$") or isinstance(value, dict):
+            raise ValueError(f"FlatCollection only supports equality filters, got {where}")
+        if (metadata or {}).get(key) != value:
+            return False
+    return True
+
+
+class FlatCollection:
+    """The subset of chromadb's Collection API that SupportDocEmbedder uses."""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.directory = directory
+        self._table_path = os.path.join(directory, "table.json")
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._vectors = None
+        self._norms = None
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._table_path):
+            self._load()
+        else:
+            self._reset()
+            self._save_table()
+
+    # ---------- persistence ----------
+
+    def _matrix_path(self, stem: str) -> str:
+        # Generation 0 keeps the original file names.
+        suffix = f".{self.generation}" if self.generation else ""
+        return os.path.join(self.directory, f"{stem}{suffix}.f32")
+
+    @property
+    def _vectors_path(self) -> str:
+        return self._matrix_path("vectors")
+
+    @property
+    def _norms_path(self) -> str:
+        return self._matrix_path("norms")
+
+    def _reset(self):
+        self.metadata = None
+        self.dim = None
+        self.capacity = 0
+        self.generation = 0
+        # Row-aligned; dead rows hold None in all three.
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._positions = {}
+
+    def _load(self):
+        for attempt in range(3):
+            with open(self._table_path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            self._loaded_mtime = os.stat(self._table_path).st_mtime_ns
+            self.metadata = table["metadata"]
+            self.dim = table["dim"]
+            self.capacity = table["capacity"]
+            self.generation = table.get("generation", 0)
+            self._ids = table["ids"]
+            self._documents = table["documents"]
+            self._metadatas = table["metadatas"]
+            self._positions = {chunk_id: row for row, chunk_id in enumerate(self._ids) if chunk_id is not None}
+            try:
+                self._map()
+                return
+            except FileNotFoundError:
+                # Another process compacted between our reading the table and mapping its files.
+                if attempt == 2:
+                    raise
+
+    def _map(self):
+        self._vectors = self._norms = None
+        if self.dim is None or not self.capacity:
+            return
+        self._vectors = np.memmap(self._vectors_path, dtype=_DTYPE, mode="r+", shape=(self.capacity, self.dim))
+        self._norms = np.memmap(self._norms_path, dtype=_DTYPE, mode="r+", shape=(self.capacity,))
+
+    def _refresh(self):
+        # Picks up writes made by another process, e.g. the ingest CLI.
+        try:
+            mtime = os.stat(self._table_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    def _save_table(self):
+        # Rows are flushed before the table that makes them visible, and the table is
+        # swapped in atomically, so readers never see ids without their vectors.
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._norms.flush()
+        table = {
+            "metadata": self.metadata,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "generation": self.generation,
+            "ids": self._ids,
+            "documents": self._documents,
+            "metadatas": self._metadatas,
+        }
+        tmp_path = f"{self._table_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+        os.replace(tmp_path, self._table_path)
+        self._loaded_mtime = os.stat(self._table_path).st_mtime_ns
+
+    def _reserve(self, rows: int):
+        if rows <= self.capacity:
+            return
+        capacity = max(_INITIAL_CAPACITY, self.capacity * 2, rows)
+        self._vectors = self._norms = None
+        # Rows are contiguous, so growing the files in place keeps existing rows where they are.
+        for path, row_bytes in ((self._vectors_path, self.dim * 4), (self._norms_path, 4)):
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._map()
+
+    def _dead_rows(self) -> list[int]:
+        return [row for row, chunk_id in enumerate(self._ids) if chunk_id is None]
+
+    def _kill(self, row: int):
+        self._ids[row] = None
+        self._documents[row] = None
+        self._metadatas[row] = None
+
+    def _maybe_compact(self):
+        dead = len(self._ids) - len(self._positions)
+        if dead >= _COMPACT_MIN_DEAD and dead > len(self._positions):
+            self.compact()
+
+    def compact(self):
+        """Copy the live rows into a fresh generation of matrix files and drop the dead ones."""
+        with self._lock:
+            self._refresh()
+            if self.dim is None or len(self._positions) == len(self._ids):
+                return
+            rows = [row for row, chunk_id in enumerate(self._ids) if chunk_id is not None]
+            vectors = np.array(self._vectors[rows]) if rows else np.empty((0, self.dim), dtype=_DTYPE)
+            norms = np.array(self._norms[rows]) if rows else np.empty(0, dtype=_DTYPE)
+            old_paths = (self._vectors_path, self._norms_path)
+
+            self.generation += 1
+            self.capacity = max(_INITIAL_CAPACITY, len(rows))
+            self._vectors = self._norms = None
+            for path, row_bytes in ((self._vectors_path, self.dim * 4), (self._norms_path, 4)):
+                with open(path, "wb") as f:
+                    f.truncate(self.capacity * row_bytes)
+            self._map()
+            self._vectors[:len(rows)] = vectors
+            self._norms[:len(rows)] = norms
+            self._ids = [self._ids[row] for row in rows]
+            self._documents = [self._documents[row] for row in rows]
+            self._metadatas = [self._metadatas[row] for row in rows]
+            self._positions = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+            self._save_table()
+
+            for path in old_paths:
+                try:
+                    # Processes that still map the old files keep reading them until they refresh.
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # ---------- writes ----------
+
+    def upsert(self, ids: list[str], embeddings, documents: list[str] = None, metadatas: list[dict] = None):
+        matrix = np.asarray(embeddings, dtype=_DTYPE)
+        if matrix.ndim != 2 or len(matrix) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got array of shape {matrix.shape}")
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match collection dimensionality {self.dim}")
+
+            # Every vector goes to a new row past the saved table; a replaced id's old row is only marked dead.
+            self._reserve(len(self._ids) + len(ids))
+            for i, chunk_id in enumerate(ids):
+                if chunk_id in self._positions:
+                    self._kill(self._positions[chunk_id])
+                row = len(self._ids)
+                self._vectors[row] = matrix[i]
+                self._norms[row] = float(matrix[i] @ matrix[i])
+                self._positions[chunk_id] = row
+                self._ids.append(chunk_id)
+                self._documents.append(documents[i] if documents else None)
+                self._metadatas.append(metadatas[i] if metadatas else None)
+            self._save_table()
+            self._maybe_compact()
+
+    add = upsert
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            self._refresh()
+            for chunk_id in ids:
+                row = self._positions.pop(chunk_id, None)
+                if row is not None:
+                    self._kill(row)
+            self._save_table()
+            self._maybe_compact()
+
+    def modify(self, metadata: dict = None, name: str = None):
+        if name is not None and name != self.name:
+            raise ValueError("FlatCollection does not support renaming")
+        with self._lock:
+            self._refresh()
+            self.metadata = metadata
+            self._save_table()
+
+    # ---------- reads ----------
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._positions)
+
+    def get(self, ids: list[str] = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list[str] = ("documents", "metadatas")) -> dict:
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions]
+            else:
+                rows = [row for row, chunk_id in enumerate(self._ids) if chunk_id is not None]
+            if where:
+                rows = [row for row in rows if _matches(self._metadatas[row], where)]
+            rows = list(rows)[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+
+            result = {"ids": [self._ids[row] for row in rows], "documents": None, "metadatas": None,
+                      "embeddings": None}
+            if "documents" in include:
+                result["documents"] = [self._documents[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[row] for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = np.array(self._vectors[rows]) if rows else np.empty((0, self.dim or 0))
+            return result
+
+    def query(self, query_embeddings, n_results: int = 10,
+              include: list[str] = ("documents", "metadatas", "distances")) -> dict:
+        queries = np.asarray(query_embeddings, dtype=_DTYPE)
+        with self._lock:
+            self._refresh()
+            live = len(self._positions)
+            count = len(self._ids)
+            result = {"ids": [], "documents": None, "metadatas": None, "distances": None}
+            for key in ("documents", "metadatas", "distances"):
+                if key in include:
+                    result[key] = []
+            if not live:
+                for key in result:
+                    if result[key] is not None:
+                        result[key] = [[] for _ in queries]
+                return result
+            if queries.shape[1] != self.dim:
+                raise ValueError(f"Query dimension {queries.shape[1]} does not match collection dimensionality {self.dim}")
+
+            # ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2, for every query at once.
+            vectors = self._vectors[:count]
+            distances = (queries * queries).sum(axis=1, keepdims=True) - 2.0 * (queries @ vectors.T) + self._norms[:count]
+            if live < count:
+                distances[:, self._dead_rows()] = np.inf
+            k = min(n_results, live)
+            if k < count:
+                candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(count), (len(queries), count))
+            for row_distances, row_candidates in zip(distances, candidates):
+                order = row_candidates[np.argsort(row_distances[row_candidates], kind="stable")]
+                result["ids"].append([self._ids[i] for i in order])
+                if result["documents"] is not None:
+                    result["documents"].append([self._documents[i] for i in order])
+                if result["metadatas"] is not None:
+                    result["metadatas"].append([self._metadatas[i] for i in order])
+                if result["distances"] is not None:
+                    result["distances"].append([float(max(row_distances[i], 0.0)) for i in order])
+            return result
+
+
+class FlatVectorStore:
+    """Drop-in for chromadb's PersistentClient over a directory of FlatCollections."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _directory(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def get_or_create_collection(self, name: str, metadata: dict = None) -> FlatCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = FlatCollection(self._directory(name), name)
+                if metadata and collection.metadata is None:
+                    collection.modify(metadata=metadata)
+                self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name: str) -> FlatCollection:
+        if name not in self._collections and not os.path.isdir(self._directory(name)):
+            raise ValueError(f"Collection {name} does not exist.")
+        collection = self.get_or_create_collection(name)
+        collection._refresh()
+        return collection
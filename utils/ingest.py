@@ -0,0 +1,177 @@
+"""Ingest a directory or glob of PDFs into a Chroma collection.
+
+    python -m utils.ingest doc/ --collection support_collection --workers 8
+    python -m utils.ingest "doc/**/*.pdf" --collection research_collection
+
+Page extraction and chunking run in a process pool. Each document is synced
+into the collection (see SupportDocEmbedder.sync_document) as soon as all of
+its pages are back, so embedding overlaps with extraction of later files.
+A file that cannot be opened, extracted or synced is skipped and listed under
+"failures" in the summary; the command then exits with status 1.
+
+Documents are keyed by their path relative to the ingest root (the directory,
+the file's folder, or the fixed part of the glob), so doc/a/manual.pdf and
+doc/b/manual.pdf stay separate while top-level files keep their bare names.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz
+
+from utils.chunking import iter_chunks
+from utils.embedding_providers import PROVIDERS, get_embedding_provider
+from utils.rag_retriever import EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT, SupportDocEmbedder, extract_page_texts
+
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+
+
+def resolve_paths(target: str) -> list[str]:
+    if os.path.isdir(target):
+        return sorted(glob.glob(os.path.join(target, "**", "*.pdf"), recursive=True))
+    if os.path.isfile(target):
+        return [target]
+    return sorted(path for path in glob.glob(target, recursive=True) if path.lower().endswith(".pdf"))
+
+
+def source_root(target: str) -> str:
+    if os.path.isdir(target):
+        return target
+    if os.path.isfile(target):
+        return os.path.dirname(target) or "."
+    fixed = []
+    for part in target.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return "/".join(fixed) or "."
+
+
+def source_key(path: str, root: str) -> str:
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def extract_chunks(path: str, start: int, stop: int) -> tuple[str, int, int, list[str]]:
+    pages = extract_page_texts(path, start, stop)
+    chunks = [chunk for page in pages for chunk in iter_chunks(page)]
+    return path, start, len(pages), chunks
+
+
+def describe(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+def page_tasks(paths: list[str], pages_per_task: int, failures: dict):
+    # Files that cannot be opened are recorded in `failures` instead of yielding tasks.
+    for path in paths:
+        try:
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            failures[path] = describe(e)
+            continue
+        for start in range(0, max(page_count, 1), pages_per_task):
+            yield path, start, min(start + pages_per_task, page_count)
+
+
+def ingest(paths: list[str], collection_name: str, db_path: str = "chroma_store", workers: int = None,
+           pages_per_task: int = PAGES_PER_TASK, batch_size: int = EMBED_BATCH_SIZE,
+           max_in_flight: int = EMBED_MAX_IN_FLIGHT, provider: str = None, root: str = None,
+           progress=print) -> dict:
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else "."
+    embedder = SupportDocEmbedder(db_path=db_path, collection_name=collection_name,
+                                  provider=get_embedding_provider(provider))
+    failures = {}
+    tasks = list(page_tasks(paths, pages_per_task, failures))
+    remaining = {path: 0 for path in paths}
+    for path, _, _ in tasks:
+        remaining[path] += 1
+
+    parts = {path: {} for path in paths}
+    page_counts = {path: 0 for path in paths}
+    totals = {"files": 0, "pages": 0, "chunks": 0, "added": 0, "deleted": 0, "unchanged": 0}
+    for path, error in failures.items():
+        progress(f"FAILED {path}: {error}")
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_chunks, *task): task[0] for task in tasks}
+        for future in as_completed(futures):
+            path = futures[future]
+            remaining[path] -= 1
+            try:
+                _, start, page_count, chunks = future.result()
+            except Exception as e:
+                if path not in failures:
+                    failures[path] = describe(e)
+                    progress(f"FAILED {path}: {failures[path]}")
+                continue
+            if path in failures:
+                continue
+            parts[path][start] = chunks
+            page_counts[path] += page_count
+            if remaining[path]:
+                continue
+
+            # Only documents with every part extracted are synced, so a partial document never
+            # replaces the chunks already stored for it.
+            document_parts = parts.pop(path)
+            document_chunks = [chunk for key in sorted(document_parts) for chunk in document_parts[key]]
+            try:
+                report = embedder.sync_document(source_key(path, root), document_chunks,
+                                                batch_size=batch_size, max_in_flight=max_in_flight)
+            except Exception as e:
+                failures[path] = describe(e)
+                progress(f"FAILED {path}: {failures[path]}")
+                continue
+
+            totals["files"] += 1
+            totals["pages"] += page_counts[path]
+            totals["chunks"] += len(document_chunks)
+            for key in ("added", "deleted", "unchanged"):
+                totals[key] += report[key]
+
+            elapsed = time.perf_counter() - start_time
+            progress(f"[{totals['files']}/{len(paths)}] {report['source']}: {page_counts[path]} pages, "
+                     f"+{report['added']} -{report['deleted']} ={report['unchanged']} chunks | "
+                     f"{totals['pages'] / elapsed:.1f} pages/s, {totals['chunks'] / elapsed:.1f} chunks/s")
+
+    elapsed = time.perf_counter() - start_time
+    totals["seconds"] = round(elapsed, 3)
+    totals["pages_per_sec"] = round(totals["pages"] / elapsed, 2) if elapsed > 0 else 0.0
+    totals["chunks_per_sec"] = round(totals["chunks"] / elapsed, 2) if elapsed > 0 else 0.0
+    totals["failed"] = len(failures)
+    totals["failures"] = failures
+    logging.info("ingest: %s", totals)
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest PDFs into a Chroma collection")
+    parser.add_argument("target", help="PDF file, directory, or glob pattern")
+    parser.add_argument("--collection", default="support_collection")
+    parser.add_argument("--db-path", default="chroma_store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="extraction processes")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=EMBED_MAX_IN_FLIGHT)
+    parser.add_argument("--provider", choices=sorted(PROVIDERS), help="embedding backend (default: EMBEDDING_PROVIDER)")
+    args = parser.parse_args()
+
+    paths = resolve_paths(args.target)
+    if not paths:
+        parser.error(f"No PDF files found for {args.target}")
+
+    print(f"Ingesting {len(paths)} file(s) into '{args.collection}' with {args.workers} worker(s)")
+    summary = ingest(paths, args.collection, db_path=args.db_path, workers=args.workers,
+                     pages_per_task=args.pages_per_task, batch_size=args.batch_size,
+                     max_in_flight=args.max_in_flight, provider=args.provider, root=source_root(args.target))
+    print(summary)
+    if summary["failed"]:
+        sys.exit(1)
@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+import os
+from collections import OrderedDict
+
+
+def sidecar_path(db_path: str, name: str) -> str:
+    # Next to the store directory rather than inside it (chromadb owns that folder), prefixed with
+    # the store's own name so stores sharing a parent directory get separate files.
+    path = os.path.abspath(db_path)
+    return os.path.join(os.path.dirname(path), f"{os.path.basename(path)}.{name}")
+
+
+class TwoTierCache:
+    """Byte-valued cache with an in-memory LRU in front of an optional SQLite table.
+
+    Memory hits never touch disk; disk hits are promoted into memory. Each tier
+    is bounded, and the disk tier drops its least recently read rows first.
+    With `ttl` set, entries older than `ttl` seconds count as misses and are dropped.
+    """
+
+    def __init__(self, path: str = None, max_memory_items: int = 1024, max_disk_items: int = 100_000,
+                 ttl: float = None):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl = ttl
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_prune = 0
+
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL,"
+                " created REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+            if "created" not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)")
+            self._conn.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _remember(self, key: str, value: bytes, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                value, created = entry
+                if self._expired(created, now):
+                    del self._memory[key]
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = value
+                self.stats["memory_hits"] += 1
+
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            if missing and self._conn is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM entries WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                expired = [key for key, _, created in rows if self._expired(created, now)]
+                rows = [row for row in rows if not self._expired(row[2], now)]
+                if expired:
+                    self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in expired])
+                if rows:
+                    self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                           [(now, key) for key, _, _ in rows])
+                if rows or expired:
+                    self._conn.commit()
+                for key, value, created in rows:
+                    found[key] = value
+                    self._remember(key, value, created)
+                self.stats["disk_hits"] += len(rows)
+
+            self.stats["misses"] += sum(1 for key in missing if key not in found)
+        return found
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        items = list(items)
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value, now)
+            if self._conn is None or not items:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, accessed, created) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items],
+            )
+            self._writes_since_prune += len(items)
+            if self._writes_since_prune >= max(1, self.max_disk_items // 10):
+                self._prune()
+            self._conn.commit()
+
+    def set(self, key: str, value: bytes):
+        self.set_many([(key, value)])
+
+    def _prune(self):
+        self._writes_since_prune = 0
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - self.max_disk_items
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)", (excess,)
+            )
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
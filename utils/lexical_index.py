@@ -0,0 +1,143 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+from utils.kv_cache import sidecar_path
+
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my of on or our so that the this "
+    "to was what when where which who why will with you your".split()
+)
+
+
+def default_index_path(db_path: str) -> str:
+    return os.getenv("LEXICAL_INDEX_PATH", sidecar_path(db_path, "lexical_index.sqlite3"))
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalHit(NamedTuple):
+    chunk_id: str
+    score: float
+    coverage: float
+
+
+class BM25Index:
+    """Okapi BM25 over one collection's chunks, stored as an inverted index in SQLite.
+
+    Postings carry the chunk length, so a query is one indexed read per call. Several
+    collections can share a file; every row is scoped by collection name.
+    """
+
+    def __init__(self, path: str, collection: str, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.collection = collection
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_postings (collection TEXT NOT NULL, term TEXT NOT NULL,"
+            " chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, length INTEGER NOT NULL,"
+            " PRIMARY KEY (collection, term, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_docs (collection TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " terms TEXT NOT NULL, length INTEGER NOT NULL, PRIMARY KEY (collection, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def _remove(self, ids: list[str]):
+        for chunk_id in ids:
+            row = self._conn.execute("SELECT terms FROM lexical_docs WHERE collection = ? AND chunk_id = ?",
+                                     (self.collection, chunk_id)).fetchone()
+            if row is None:
+                continue
+            self._conn.executemany(
+                "DELETE FROM lexical_postings WHERE collection = ? AND term = ? AND chunk_id = ?",
+                [(self.collection, term, chunk_id) for term in row[0].split()],
+            )
+            self._conn.execute("DELETE FROM lexical_docs WHERE collection = ? AND chunk_id = ?",
+                               (self.collection, chunk_id))
+
+    def add(self, ids: list[str], texts: list[str]):
+        with self._lock:
+            self._remove(ids)
+            for chunk_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._conn.executemany(
+                    "INSERT INTO lexical_postings (collection, term, chunk_id, tf, length) VALUES (?, ?, ?, ?, ?)",
+                    [(self.collection, term, chunk_id, tf, length) for term, tf in counts.items()],
+                )
+                self._conn.execute(
+                    "INSERT INTO lexical_docs (collection, chunk_id, terms, length) VALUES (?, ?, ?, ?)",
+                    (self.collection, chunk_id, " ".join(counts), length),
+                )
+            self._conn.commit()
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            self._remove(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM lexical_postings WHERE collection = ?", (self.collection,))
+            self._conn.execute("DELETE FROM lexical_docs WHERE collection = ?", (self.collection,))
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM lexical_docs WHERE collection = ?",
+                                          (self.collection,)).fetchone()
+        return count
+
+    def search(self, query: str, top_k: int = 10) -> list[LexicalHit]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            doc_count, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM lexical_docs WHERE collection = ?",
+                (self.collection,),
+            ).fetchone()
+            rows = self._conn.execute(
+                f"SELECT term, chunk_id, tf, length FROM lexical_postings"
+                f" WHERE collection = ? AND term IN ({placeholders})",
+                [self.collection, *terms],
+            ).fetchall()
+        if not rows:
+            return []
+
+        avg_length = total_length / doc_count if doc_count else 1.0
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        scores = Counter()
+        matched = Counter()
+        for term, chunk_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            matched[chunk_id] += 1
+
+        return [LexicalHit(chunk_id, score, matched[chunk_id] / len(terms))
+                for chunk_id, score in scores.most_common(top_k)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
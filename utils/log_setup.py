@@ -0,0 +1,242 @@
+"""Non-blocking logging shared by chatapp and agentapp.
+
+Callers only pay for building a LogRecord and putting it on a bounded queue.
+Formatting, JSON encoding and file writes happen on a QueueListener thread
+that feeds a RotatingFileHandler. Settings:
+
+    LOG_DIR               directory for <app>.log (default ./logs)
+    LOG_LEVEL             root level (default INFO)
+    LOG_FORMAT            json (default) or text
+    LOG_MAX_BYTES         rotate after this many bytes (default 10 MB)
+    LOG_BACKUP_COUNT      rotated files kept (default 5)
+    LOG_QUEUE_SIZE        records buffered before new ones are dropped (default 10000);
+                          drops are counted in log_records_dropped_total and the
+                          total is written to the log when the listener stops
+    LOG_FIELD_MAX_CHARS   cap on each formatted argument and on the message (default 1000)
+    LOG_SAMPLE_RATES      per-logger sampling of records below WARNING,
+                          e.g. "chatapp.payload=0.1,agentapp.payload=0.05"
+
+Log with %-style arguments, not f-strings, so nothing is formatted for records
+that are filtered, sampled out or dropped. Because formatting happens later, on
+the listener thread, list/dict/set arguments are copied (one level deep) when
+the record is queued; do not pass other objects you mutate right after logging.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from dotenv import load_dotenv
+from opentelemetry import trace
+
+from utils.metrics import LOG_RECORDS_DROPPED
+
+load_dotenv()
+
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.getcwd(), "logs"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "1000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "chatapp.payload=0.1,agentapp.payload=0.1")
+
+TEXT_FORMAT = "[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else came from `extra=` and is emitted as a field.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id", "span_id"}
+_MUTABLE_ARGS = (list, dict, set, bytearray)
+
+_listener = None
+_lock = threading.Lock()
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        name, rate = part.split("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def cap(value, max_chars: int = LOG_FIELD_MAX_CHARS):
+    if not isinstance(value, (str, bytes, list, tuple, dict)):
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= max_chars:
+        return value
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+
+def snapshot(value):
+    return copy.copy(value) if isinstance(value, _MUTABLE_ARGS) else value
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records below WARNING from the configured loggers and their children."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def rate_for(self, name: str):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate is None or random.random() < rate
+
+
+class TraceContextFilter(logging.Filter):
+    # Runs on the caller's thread, where the active span is still known.
+    def filter(self, record):
+        context = trace.get_current_span().get_span_context()
+        if context.is_valid:
+            record.trace_id = format(context.trace_id, "032x")
+            record.span_id = format(context.span_id, "016x")
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: a full queue drops the record and counts it (also in LOG_RECORDS_DROPPED)."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener lives in this process, so the record is formatted there instead
+        # of on the caller's thread. Container arguments are copied so that changes
+        # made after the call do not show up in the message.
+        if isinstance(record.args, dict):
+            record.args = {key: snapshot(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(snapshot(arg) for arg in record.args)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+class DrainingQueueListener(QueueListener):
+    def __init__(self, source: DroppingQueueHandler, *handlers, respect_handler_level=False):
+        super().__init__(source.queue, *handlers, respect_handler_level=respect_handler_level)
+        self.source = source
+
+    def enqueue_sentinel(self):
+        # Waits for room instead of failing, so stop() still flushes a full queue.
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # Safe to call twice (e.g. explicitly and again at exit).
+        if self._thread is None:
+            return
+        super().stop()
+        if self.source.dropped:
+            # Written directly: the queue is no longer drained at this point.
+            self.handle(logging.getLogger(__name__).makeRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "%d log records were dropped because the log queue was full", (self.source.dropped,), None,
+            ))
+
+
+class CappedFormatterMixin:
+    max_chars = LOG_FIELD_MAX_CHARS
+
+    def message(self, record) -> str:
+        if record.args:
+            args = record.args
+            if isinstance(args, dict):
+                record.args = {key: cap(value, self.max_chars) for key, value in args.items()}
+            else:
+                record.args = tuple(cap(arg, self.max_chars) for arg in args)
+        return cap(record.getMessage(), self.max_chars)
+
+
+class JsonFormatter(CappedFormatterMixin, logging.Formatter):
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": self.message(record),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+            entry["span_id"] = record.span_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = cap(value, self.max_chars)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(CappedFormatterMixin, logging.Formatter):
+    def format(self, record) -> str:
+        record.message = self.message(record)
+        record.asctime = self.formatTime(record, self.datefmt)
+        text = self.formatMessage(record)
+        if record.exc_info:
+            text = f"{text}\n{self.formatException(record.exc_info)}"
+        return text
+
+
+def create_handlers(path: str, log_format: str = LOG_FORMAT, max_bytes: int = LOG_MAX_BYTES,
+                    backup_count: int = LOG_BACKUP_COUNT, queue_size: int = LOG_QUEUE_SIZE,
+                    sample_rates: dict[str, float] = None) -> tuple[DroppingQueueHandler, DrainingQueueListener]:
+    """A queue handler for loggers plus the (not yet started) listener that writes `path`."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    rates = parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    handler.addFilter(TraceContextFilter())
+    listener = DrainingQueueListener(handler, file_handler, respect_handler_level=True)
+    return handler, listener
+
+
+def payload_logger(app_name: str) -> logging.Logger:
+    """Logger for large request payloads (retrieved context, summaries); LOG_SAMPLE_RATES samples it."""
+    return logging.getLogger(f"{app_name}.payload")
+
+
+def setup_logging(app_name: str):
+    """Route the root logger through a queue to logs/<app_name>.log. Only the first call configures."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        handler, listener = create_handlers(os.path.join(LOG_DIR, f"{app_name}.log"))
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(handler)
+        listener.start()
+        # Flushes whatever is still queued when the process exits.
+        atexit.register(listener.stop)
+        _listener = listener
+        return listener
@@ -0,0 +1,121 @@
+"""Prometheus metrics and per-request stage timings.
+
+    with stage("embedding"):            # histogram + Server-Timing entry
+        ...
+    with upstream_call("chat_completions"):   # also counts calls and tracks in-flight requests
+        ...
+
+Timings are collected in a context variable that ServerTimingMiddleware sets per
+request; it survives awaits and is copied into run_in_threadpool/asyncio.to_thread
+workers. Outside a request (agents, ingestion) only the histograms are updated.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+REGISTRY = CollectorRegistry()
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+                          buckets=_BUCKETS, registry=REGISTRY)
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Calls to upstream APIs", ["target", "outcome"],
+                            registry=REGISTRY)
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream calls currently waiting for a response",
+                           ["target"], registry=REGISTRY)
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "End-to-end request latency", ["method", "route", "status"],
+                                 buckets=_BUCKETS, registry=REGISTRY)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled", registry=REGISTRY)
+PROMPT_TOKENS = Histogram("chat_prompt_tokens", "Estimated tokens sent to the chat model", ["part"],
+                          buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384), registry=REGISTRY)
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full",
+                              registry=REGISTRY)
+
+_timings = ContextVar("stage_timings", default=None)
+
+
+def record(name: str, seconds: float):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+@contextmanager
+def upstream_call(target: str):
+    gauge = UPSTREAM_IN_FLIGHT.labels(target)
+    gauge.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        gauge.dec()
+        UPSTREAM_REQUESTS.labels(target, outcome).inc()
+        record(target, time.perf_counter() - start)
+
+
+def server_timing(timings: list, total: float) -> str:
+    # Repeated stages are summed so the header stays one entry per stage.
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware: per-request timing context, Server-Timing header and request metrics.
+
+    The header is written when the response starts, so a streamed response only
+    reports the stages that finished before its first byte.
+    """
+
+    def __init__(self, app, skip_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], getattr(route, "path", "unmatched"), str(status)).observe(
+                time.perf_counter() - start
+            )
+            _timings.reset(token)
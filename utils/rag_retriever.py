@@ -1,90 +1,430 @@
 import fitz  
-import requests
 from dotenv import load_dotenv
 import os
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from chromadb import PersistentClient
+from utils.chunking import iter_chunks
+from utils.embedding_cache import EMBEDDING_CACHE_ENABLED, default_cache_path, get_embedding_cache
+from utils.embedding_providers import EMBED_MODEL, EmbeddingProvider, get_embedding_provider
+from utils.flat_store import FlatVectorStore, default_flat_path
+from utils.lexical_index import LEXICAL_INDEX_ENABLED, BM25Index, default_index_path
+from utils.metrics import stage
 
 load_dotenv()
 
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+RETRIEVAL_MODES = ("auto", "lexical", "vector", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "auto")
+LEXICAL_CONFIDENCE_MARGIN = float(os.getenv("LEXICAL_CONFIDENCE_MARGIN", "2.0"))
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_CANDIDATES = int(os.getenv("RRF_CANDIDATES", "10"))
+
+
+def extract_page_texts(path: str, start: int = 0, stop: int = None) -> list[str]:
+    doc = fitz.open(path)
+    try:
+        texts = []
+        for page in doc.pages(start, stop if stop is not None else doc.page_count):
+            text = page.get_text().strip()
+            if text:
+                texts.append(text)
+        return texts
+    finally:
+        doc.close()
+
+
+def open_vector_client(db_path: str, backend: str = None):
+    # "flat" keeps exact, memory-mapped vectors in a <db_path>.flat_store directory next to db_path.
+    backend = backend or VECTOR_STORE
+    if backend == "chroma":
+        return PersistentClient(path=db_path)
+    if backend == "flat":
+        return FlatVectorStore(default_flat_path(db_path))
+    raise ValueError(f"Unknown vector store '{backend}', expected 'chroma' or 'flat'")
+
 
 class SupportDocEmbedder:
-    def __init__(self, db_path: str = "chroma_store", collection_name: str = "default"):
-        self.client = PersistentClient(path=db_path)
+    def __init__(self, db_path: str = "chroma_store", collection_name: str = "default", client=None,
+                 use_cache: bool = EMBEDDING_CACHE_ENABLED, provider: EmbeddingProvider = None,
+                 use_lexical: bool = LEXICAL_INDEX_ENABLED, retrieval_mode: str = RETRIEVAL_MODE):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {RETRIEVAL_MODES}")
+        self.db_path = db_path
+        self.client = client or open_vector_client(db_path)
         self.collection_name = collection_name
         self.collection = self.client.get_or_create_collection(name=self.collection_name)
-        self.api_key = os.getenv("ULTRASAFE_API_KEY")
+        self.provider = provider or get_embedding_provider()
+        self.cache = get_embedding_cache(default_cache_path(db_path)) if use_cache else None
+        self.lexical = BM25Index(default_index_path(db_path), collection_name) if use_lexical else None
+        self.retrieval_mode = retrieval_mode if use_lexical else "vector"
+        self._lexical_ready = False
+        self._lexical_lock = threading.Lock()
+        self.check_embedding_model()
+
+    def check_embedding_model(self):
+        recorded = (self.collection.metadata or {}).get("embedding_model")
+        if recorded is None and self.collection.count():
+            # Collections built before the model was recorded were all embedded remotely.
+            recorded = EMBED_MODEL
+        if recorded is not None and recorded != self.provider.model:
+            raise ValueError(f"Collection '{self.collection_name}' was embedded with '{recorded}', "
+                             f"but the configured provider is '{self.provider.model}'")
 
     def extract_text_from_pdf(self, path: str) -> list[str]:
         try:
             
-            doc = fitz.open(path)
-            texts = [page.get_text().strip() for page in doc if page.get_text().strip()]
-            doc.close()
-            return texts
+            return extract_page_texts(path)
         except Exception as e:
             
             raise
 
     def get_embedding(self, text: str):
-        try:
-            url = "https://api.us.inc/usf/v1/embed/embeddings"
-            payload = {
-                "model": "usf1-embed",
-                "input": text
-            }
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key
-            }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+        return self.get_embeddings([text])[0]
 
-            embedding = response.json()["result"]["data"][0]["embedding"]
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if self.cache is None:
+            return self.provider.embed(texts)
 
-            if embedding is None:
-                
-                raise ValueError("Missing 'embedding' in API response")
+        model = self.provider.model
+        embeddings = self.cache.get_many(model, texts)
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            fresh = [self.cache.to_float32(vector) for vector in self.provider.embed(missing)]
+            self.cache.set_many(model, zip(missing, fresh))
+            embeddings.update(zip(missing, fresh))
+        return [embeddings[text] for text in texts]
 
-            return embedding
+    async def aget_embedding(self, text: str, http_client):
+        return (await self.aget_embeddings([text], http_client))[0]
 
-        except Exception as e:
-            
-            raise
+    async def aget_embeddings(self, texts: list[str], http_client) -> list[list[float]]:
+        if self.cache is None:
+            return await self.provider.aembed(texts, http_client)
+
+        model = self.provider.model
+        embeddings = await asyncio.to_thread(self.cache.get_many, model, texts)
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            fresh = [self.cache.to_float32(vector) for vector in await self.provider.aembed(missing, http_client)]
+            await asyncio.to_thread(self.cache.set_many, model, list(zip(missing, fresh)))
+            embeddings.update(zip(missing, fresh))
+        return [embeddings[text] for text in texts]
 
-    def embed_and_store(self, pdf_path: str):
+    def embed_and_store(self, pdf_path: str, batch_size: int = EMBED_BATCH_SIZE,
+                        max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> dict:
         
         try:
-            chunks = self.extract_text_from_pdf(pdf_path)
-
-            for i, chunk in enumerate(chunks):
-                embedding = self.get_embedding(chunk)
-                chunk_id = f"{os.path.basename(pdf_path)}_chunk_{i}"
-                self.collection.add(
-                    documents=[chunk],
-                    embeddings=[embedding],
-                    ids=[chunk_id]
-                )
+            pages = self.extract_text_from_pdf(pdf_path)
+            chunks = [chunk for page in pages for chunk in iter_chunks(page)]
+            return self.sync_document(os.path.basename(pdf_path), chunks,
+                                      batch_size=batch_size, max_in_flight=max_in_flight)
                 
         except Exception as e:
             
             raise
 
+    @staticmethod
+    def chunk_ids(source: str, chunks: list[str]) -> dict:
+        # Ids are derived from content, so an unchanged chunk keeps its id even when
+        # pages are inserted or removed around it.
+        ids = {}
+        occurrences = {}
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+            occurrence = occurrences.get(digest, 0)
+            occurrences[digest] = occurrence + 1
+            chunk_id = f"{source}_{digest[:16]}" + (f"_{occurrence}" if occurrence else "")
+            ids[chunk_id] = {"chunk": chunk, "hash": digest}
+        return ids
 
-    def retrieve_context(self, query: str, top_k: int = 2):
-        try:
-            
+    def load_manifest(self, source: str) -> dict:
+        existing = self.collection.get(where={"source": source}, include=["metadatas"])
+        manifest = {chunk_id: (meta or {}).get("chunk_hash")
+                    for chunk_id, meta in zip(existing["ids"], existing["metadatas"])}
+        if not manifest:
+            # Chunks written before manifests existed are named <source>_chunk_<i> and carry no metadata.
+            legacy_prefix = f"{source}_chunk_"
+            manifest = {chunk_id: None for chunk_id in self.collection.get(include=[])["ids"]
+                        if chunk_id.startswith(legacy_prefix)}
+        return manifest
+
+    def sync_document(self, source: str, chunks: list[str], batch_size: int = EMBED_BATCH_SIZE,
+                      max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> dict:
+        # Makes the collection match `chunks` for this source: only new or changed chunks
+        # are embedded and upserted, and chunks that disappeared are deleted.
+        desired = self.chunk_ids(source, chunks)
+        manifest = self.load_manifest(source)
+
+        new_ids = [chunk_id for chunk_id in desired if chunk_id not in manifest]
+        stale_ids = [chunk_id for chunk_id in manifest if chunk_id not in desired]
+
+        if stale_ids:
+            self.collection.delete(ids=stale_ids)
+            if self.lexical is not None:
+                self.lexical.delete(stale_ids)
+        stats = self.store_chunks(
+            new_ids,
+            [desired[chunk_id]["chunk"] for chunk_id in new_ids],
+            metadatas=[{"source": source, "chunk_hash": desired[chunk_id]["hash"]} for chunk_id in new_ids],
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+        )
+
+        if new_ids or stale_ids:
+            self.bump_index_version()
+
+        report = {
+            "source": source,
+            "added": len(new_ids),
+            "deleted": len(stale_ids),
+            "unchanged": len(desired) - len(new_ids),
+            **stats,
+        }
+        logging.info("SupportDocEmbedder: synced %s: %s added, %s deleted, %s unchanged",
+                     source, report["added"], report["deleted"], report["unchanged"])
+        return report
+
+    def index_version(self) -> int:
+        # Read from the store rather than self.collection: the ingest CLI bumps it from another process.
+        metadata = self.client.get_collection(self.collection_name).metadata or {}
+        return int(metadata.get("index_version", 0))
+
+    def close(self):
+        # The vector client, embedding cache and provider are shared; only the BM25 connection is this retriever's.
+        lexical, self.lexical = self.lexical, None
+        if lexical is not None:
+            lexical.close()
+
+    def embedding_dim(self):
+        # None for an empty collection; the first store fixes the dimension.
+        stored = self.collection.get(limit=1, include=["embeddings"])["embeddings"]
+        return len(stored[0]) if stored is not None and len(stored) else None
+
+    def update_metadata(self, **values):
+        metadata = self.client.get_collection(self.collection_name).metadata or {}
+        # modify() replaces the whole metadata dict; hnsw:* keys are fixed at creation and may not be resent.
+        metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+        self.collection.modify(metadata={**metadata, **values})
+
+    def bump_index_version(self) -> int:
+        version = self.index_version() + 1
+        self.update_metadata(index_version=version)
+        return version
+
+    def store_chunks(self, ids: list[str], chunks: list[str], metadatas: list[dict] = None,
+                     batch_size: int = EMBED_BATCH_SIZE, max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> dict:
+        # Embeds `batch_size` chunks per request with at most `max_in_flight` requests
+        # outstanding, and writes each finished batch with a single collection.upsert.
+        start = time.perf_counter()
+        batches = 0
+        if chunks and "embedding_model" not in (self.collection.metadata or {}):
+            self.check_embedding_model()
+            self.update_metadata(embedding_model=self.provider.model)
+
+        def store(future, batch_slice):
+            self.collection.upsert(
+                documents=chunks[batch_slice],
+                embeddings=future.result(),
+                ids=ids[batch_slice],
+                metadatas=metadatas[batch_slice] if metadatas else None,
+            )
+            if self.lexical is not None:
+                self.lexical.add(ids[batch_slice], chunks[batch_slice])
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            pending = {}
+            for i in range(0, len(chunks), batch_size):
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        store(future, pending.pop(future))
+                batch_slice = slice(i, i + batch_size)
+                pending[pool.submit(self.get_embeddings, chunks[batch_slice])] = batch_slice
+                batches += 1
+            for future in list(pending):
+                store(future, pending.pop(future))
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "chunks": len(chunks),
+            "batches": batches,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(chunks) / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        logging.info("SupportDocEmbedder: stored %s chunks in %s batches (%s chunks/sec)",
+                     stats["chunks"], stats["batches"], stats["chunks_per_sec"])
+        return stats
+
+
+    def search(self, query_embedding, top_k: int = 2) -> tuple[list[str], list[str]]:
+        with stage("vector_query"):
+            results = self.collection.query(query_embeddings=[query_embedding], n_results=top_k, include=["documents"])
+        if not results.get('documents'):
+            return [], []
+        return results["ids"][0], results["documents"][0]
+
+    def query_by_embedding(self, query_embedding, top_k: int = 2) -> list[str]:
+        return self.search(query_embedding, top_k)[1]
+
+    def retrieve_contexts(self, queries: list[str], top_k: int = 2, batch_size: int = EMBED_BATCH_SIZE,
+                          max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> list[dict]:
+        # Vector search for many queries: embeddings are fetched `batch_size` at a time with up to
+        # `max_in_flight` requests outstanding, then every query goes through one collection.query.
+        if not queries:
+            return []
+        start = time.perf_counter()
+        batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(batches)))) as pool:
+            embeddings = [embedding for batch in pool.map(self.get_embeddings, batches) for embedding in batch]
+
+        results = self.collection.query(query_embeddings=embeddings, n_results=top_k,
+                                        include=["documents", "distances"])
+        contexts = [
+            {"query": query, "ids": ids, "documents": documents, "distances": distances}
+            for query, ids, documents, distances in zip(
+                queries, results["ids"], results["documents"], results["distances"]
+            )
+        ]
+
+        elapsed = time.perf_counter() - start
+        logging.info("SupportDocEmbedder: retrieved %s queries in %s embedding batches (%.1f queries/sec)",
+                     len(queries), len(batches), len(queries) / elapsed if elapsed > 0 else 0.0)
+        return contexts
+
+    def ensure_lexical_index(self):
+        # Collections ingested before the lexical index existed are backfilled on first use.
+        if self.lexical is None or self._lexical_ready:
+            return
+        with self._lexical_lock:
+            if not self._lexical_ready:
+                if self.lexical.count() != self.collection.count():
+                    self.rebuild_lexical_index()
+                self._lexical_ready = True
+
+    def rebuild_lexical_index(self, page_size: int = 1000):
+        self.lexical.clear()
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            self.lexical.add(page["ids"], [document or "" for document in page["documents"]])
+            offset += len(page["ids"])
+        logging.info("SupportDocEmbedder: rebuilt lexical index for %s (%s chunks)", self.collection_name, offset)
+
+    def lexical_search(self, query: str, top_k: int = RRF_CANDIDATES):
+        if self.lexical is None:
+            return []
+        self.ensure_lexical_index()
+        with stage("lexical_query"):
+            return self.lexical.search(query, top_k)
+
+    @staticmethod
+    def is_confident(hits) -> bool:
+        # The best lexical hit must cover most query terms and clearly beat the runner-up.
+        if not hits or hits[0].coverage < LEXICAL_MIN_COVERAGE:
+            return False
+        return len(hits) == 1 or hits[0].score >= LEXICAL_CONFIDENCE_MARGIN * hits[1].score
+
+    @staticmethod
+    def fuse(rankings: list[list[str]], top_k: int, k: int = RRF_K) -> list[str]:
+        # Reciprocal rank fusion: only ranks matter, so BM25 and distance scores need no calibration.
+        scores = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+    def documents_for(self, ids: list[str]) -> tuple[list[str], list[str]]:
+        if not ids:
+            return [], []
+        found = self.collection.get(ids=ids, include=["documents"])
+        by_id = dict(zip(found["ids"], found["documents"]))
+        ids = [chunk_id for chunk_id in ids if chunk_id in by_id]
+        return ids, [by_id[chunk_id] for chunk_id in ids]
+
+    def _lexical_answer(self, hits, mode: str) -> bool:
+        if mode == "lexical":
+            return True
+        if mode == "auto" and self.is_confident(hits):
+            logging.info("SupportDocEmbedder: lexical fast path (score %.2f)", hits[0].score)
+            return True
+        return False
+
+    def _fuse_with_vector(self, hits, query_embedding, top_k: int) -> tuple[list[str], list[str]]:
+        if not hits:
+            return self.search(query_embedding, top_k)
+        vector_ids, vector_docs = self.search(query_embedding, max(top_k, RRF_CANDIDATES))
+        fused = self.fuse([vector_ids, [hit.chunk_id for hit in hits]], top_k)
+        documents = dict(zip(vector_ids, vector_docs))
+        lexical_only = [chunk_id for chunk_id in fused if chunk_id not in documents]
+        documents.update(zip(*self.documents_for(lexical_only)))
+        ids = [chunk_id for chunk_id in fused if chunk_id in documents]
+        return ids, [documents[chunk_id] for chunk_id in ids]
+
+    def retrieve(self, query: str, top_k: int = 2, mode: str = None,
+                 query_embedding=None) -> tuple[list[str], list[str]]:
+        # auto: answer from BM25 alone when it is confident, otherwise fuse BM25 and vector ranks.
+        # lexical / vector: one side only. hybrid: always fuse.
+        mode = mode or self.retrieval_mode
+        hits = self.lexical_search(query, max(top_k, RRF_CANDIDATES)) if mode != "vector" else []
+        if self._lexical_answer(hits, mode):
+            return self.documents_for([hit.chunk_id for hit in hits[:top_k]])
+        if query_embedding is None:
             query_embedding = self.get_embedding(query)
-            results = self.collection.query(query_embeddings=[query_embedding], n_results=top_k)
-            documents = results.get('documents', [[]])[0] if results.get('documents') else []
-          
+        return self._fuse_with_vector(hits, query_embedding, top_k)
+
+    async def alexical_pass(self, query: str, top_k: int = 2, mode: str = None):
+        """First half of aretrieve: (BM25 hits, result), where result is None unless the hits suffice."""
+        mode = mode or self.retrieval_mode
+        hits = []
+        if mode != "vector":
+            hits = await asyncio.to_thread(self.lexical_search, query, max(top_k, RRF_CANDIDATES))
+        if self._lexical_answer(hits, mode):
+            return hits, await asyncio.to_thread(self.documents_for, [hit.chunk_id for hit in hits[:top_k]])
+        return hits, None
+
+    async def avector_pass(self, query: str, hits, http_client, top_k: int = 2,
+                           query_embedding=None) -> tuple[list[str], list[str]]:
+        """Second half of aretrieve: embeds the query unless given its embedding, then fuses with `hits`."""
+        if query_embedding is None:
+            query_embedding = await self.aget_embedding(query, http_client)
+        return await asyncio.to_thread(self._fuse_with_vector, hits, query_embedding, top_k)
+
+    async def aretrieve(self, query: str, http_client, top_k: int = 2, mode: str = None,
+                        query_embedding=None) -> tuple[list[str], list[str]]:
+        # Same as retrieve; the embedding call goes through the shared async client and the
+        # local index work runs in worker threads.
+        hits, result = await self.alexical_pass(query, top_k, mode)
+        if result is not None:
+            return result
+        return await self.avector_pass(query, hits, http_client, top_k, query_embedding)
 
-            return documents
+    def retrieve_context(self, query: str, top_k: int = 2, mode: str = None):
+        try:
+            
+            return self.retrieve(query, top_k, mode)[1]
 
         except Exception as e:
             
             return []
 
+    async def aretrieve_context(self, query: str, http_client, top_k: int = 2, mode: str = None):
+        try:
+            return (await self.aretrieve(query, http_client, top_k, mode))[1]
+
+        except Exception as e:
+            logging.error("SupportDocEmbedder: async retrieval failed: %s", e)
+            return []
+
 
 # ---------- Run as script ----------
 if __name__ == "__main__":
@@ -93,6 +433,7 @@ if __name__ == "__main__":
     # result = support_agent.retrieve_context("What is the return policy?")
     # print(result)
     support_agent = SupportDocEmbedder(collection_name="research_collection")
-    support_agent.embed_and_store("doc/healthAI.pdf")
+    stats = support_agent.embed_and_store("doc/healthAI.pdf")
+    print(stats)
     result = support_agent.retrieve_context("AI in healthcare")
     print(result)
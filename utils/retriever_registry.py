@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+
+from utils.rag_retriever import SupportDocEmbedder, open_vector_client
+
+DEFAULT_DB_PATH = "chroma_store"
+
+
+class RetrieverRegistry:
+    """Keeps chromadb clients and collections open across requests.
+
+    Retrievers are keyed by (db_path, collection_name) and the least recently
+    used one is closed and dropped once more than `max_collections` are open.
+    """
+
+    def __init__(self, max_collections: int = 8):
+        self.max_collections = max_collections
+        self._clients = {}
+        self._retrievers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_client(self, db_path: str):
+        client = self._clients.get(db_path)
+        if client is None:
+            client = open_vector_client(db_path)
+            self._clients[db_path] = client
+        return client
+
+    def get(self, db_path: str = DEFAULT_DB_PATH, collection_name: str = "default") -> SupportDocEmbedder:
+        key = (db_path, collection_name)
+        with self._lock:
+            retriever = self._retrievers.get(key)
+            if retriever is not None:
+                self._retrievers.move_to_end(key)
+                return retriever
+
+            retriever = SupportDocEmbedder(
+                db_path=db_path,
+                collection_name=collection_name,
+                client=self._get_client(db_path),
+            )
+            self._retrievers[key] = retriever
+
+            while len(self._retrievers) > self.max_collections:
+                (evicted_path, _), evicted = self._retrievers.popitem(last=False)
+                evicted.close()
+                if not any(path == evicted_path for path, _ in self._retrievers):
+                    self._clients.pop(evicted_path, None)
+
+            return retriever
+
+    def warm(self, db_path: str = DEFAULT_DB_PATH, collection_name: str = "default") -> SupportDocEmbedder:
+        # A query against a stored vector forces chromadb to load the HNSW segment now
+        # instead of on the first user request.
+        retriever = self.get(db_path, collection_name)
+        sample = retriever.collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            retriever.collection.query(query_embeddings=[list(embeddings[0])], n_results=1)
+        retriever.ensure_lexical_index()
+        return retriever
+
+    def __contains__(self, key) -> bool:
+        return key in self._retrievers
+
+    def __len__(self) -> int:
+        return len(self._retrievers)
+
+    def clear(self):
+        with self._lock:
+            for retriever in self._retrievers.values():
+                retriever.close()
+            self._retrievers.clear()
+            self._clients.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> RetrieverRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RetrieverRegistry()
+    return _registry
@@ -0,0 +1,168 @@
+"""OpenTelemetry tracing for the chat app and the agent pipeline.
+
+The exporter is chosen with OTEL_TRACES_EXPORTER:
+
+    none      (default) no provider is installed; spans are no-ops but incoming
+              trace context is still forwarded to upstream calls
+    console   every finished span is printed to stdout
+    memory    spans are kept in memory, see memory_exporter() and summarize_spans()
+    otlp      spans are batched to an OTLP/gRPC collector (OTEL_EXPORTER_OTLP_ENDPOINT)
+
+Outbound HTTP calls carry a W3C `traceparent` header (inject_headers), and
+TracingMiddleware continues the caller's trace for incoming requests.
+"""
+
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+load_dotenv()
+
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME")
+
+_provider = None
+_memory_exporter = None
+_lock = threading.Lock()
+
+
+def configure_tracing(service_name: str, exporter: str = None):
+    """Install the global tracer provider once per process and return it (None when disabled)."""
+    global _provider, _memory_exporter
+    exporter = (exporter or OTEL_TRACES_EXPORTER).lower()
+    if exporter == "none":
+        return None
+
+    with _lock:
+        if _provider is not None:
+            return _provider
+
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME or service_name}))
+        if exporter == "console":
+            provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+        elif exporter == "memory":
+            from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+            _memory_exporter = InMemorySpanExporter()
+            provider.add_span_processor(SimpleSpanProcessor(_memory_exporter))
+        elif exporter == "otlp":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        else:
+            raise ValueError(f"Unknown OTEL_TRACES_EXPORTER '{exporter}', expected none, console, memory or otlp")
+
+        trace.set_tracer_provider(provider)
+        _provider = provider
+        return provider
+
+
+def memory_exporter():
+    return _memory_exporter
+
+
+def get_tracer():
+    return trace.get_tracer("chatbot_rag")
+
+
+def set_attributes(attributes: dict):
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes(attributes)
+
+
+def traced(name: str):
+    """Run the decorated function inside a span called `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_tracer().start_as_current_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inject_headers(headers: dict) -> dict:
+    # Returns a copy so shared header dicts are never mutated.
+    headers = dict(headers)
+    propagate.inject(headers)
+    return headers
+
+
+@contextmanager
+def client_span(name: str, url: str, payload=None, method: str = "POST"):
+    with get_tracer().start_as_current_span(name, kind=SpanKind.CLIENT,
+                                            attributes={"http.request.method": method, "url.full": url}) as span:
+        # The payload is only serialized for sizing when the span is actually recorded.
+        if payload is not None and span.is_recording():
+            span.set_attribute("http.request.body.size", len(json.dumps(payload).encode("utf-8")))
+        yield span
+
+
+def record_response(span, response):
+    """Status, body size and retry count of a requests or httpx response."""
+    if not span.is_recording():
+        return
+    span.set_attribute("http.response.status_code", response.status_code)
+    length = response.headers.get("content-length")
+    if length is not None:
+        span.set_attribute("http.response.body.size", int(length))
+    # urllib3 keeps the retries it made for a requests response; httpx does not retry.
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    span.set_attribute("http.request.resend_count", len(retries.history) if retries is not None else 0)
+    if response.status_code >= 400:
+        span.set_status(Status(StatusCode.ERROR))
+
+
+def summarize_spans(spans) -> list[dict]:
+    """Count and total duration per span name, slowest first."""
+    totals = {}
+    for span in spans:
+        entry = totals.setdefault(span.name, {"name": span.name, "count": 0, "total_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += (span.end_time - span.start_time) / 1e6
+    return sorted(totals.values(), key=lambda entry: entry["total_ms"], reverse=True)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: one server span per request, continuing any incoming `traceparent`."""
+
+    def __init__(self, app, skip_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        context = propagate.extract(carrier)
+        method = scope["method"]
+        with get_tracer().start_as_current_span(f"{method} {scope['path']}", context=context, kind=SpanKind.SERVER,
+                                                attributes={"http.request.method": method,
+                                                            "url.path": scope["path"]}) as span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start" and span.is_recording():
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None and span.is_recording():
+                    span.set_attribute("http.route", route.path)
+                    span.update_name(f"{method} {route.path}")